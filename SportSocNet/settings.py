@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 import os
+import sys
 from datetime import timedelta
 from pathlib import Path
 
@@ -44,17 +45,129 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ],
+    # JSON остаётся форматом по умолчанию; быстрые форматы выбираются через Accept или ?format=
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'users.renderers.FastJSONRenderer',
+    ],
+    # Число доверенных прокси перед приложением: IP клиента для троттлинга берётся из X-Forwarded-For
+    # только на эту глубину; 0 — заголовок не учитывается, используется REMOTE_ADDR
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+    # Троттлинг (users.throttling): общий лимит на пользователя/IP и лимиты отдельных представлений (throttle_scope)
+    'DEFAULT_THROTTLE_CLASSES': [
+        'users.throttling.UserBucketThrottle',
+        'users.throttling.ScopedBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'user': '1200/min',
+        'anon': '120/min',
+        'login': '10/min',
+        'login_username': '5/min',
+        'token_refresh': '30/min',
+    },
+}
+# Хранилище состояния троттлинга: MemoryBucketStore — в памяти процесса (token bucket),
+# CacheSlidingWindowStore — общее для всех воркеров через кэш CACHE_ALIAS (Redis/Memcached)
+RATE_LIMIT = {
+    'ENABLED': True,
+    'STORE': 'users.throttling.MemoryBucketStore',
+    'MAX_ENTRIES': 100000,
 }
+# Права ролей (users.permissions): {ресурс: {действие: 'own' | 'all'}} для пользователей без роли;
+# этот же набор получает каждая новая роль. Суперпользователю доступно всё.
+RBAC_DEFAULT_PERMISSIONS = {
+    'user': {'view': 'all', 'update': 'own', 'delete': 'own'},
+    'achievement': {'view': 'all', 'create': 'own', 'update': 'own', 'delete': 'own'},
+    'achievementimage': {'view': 'all', 'create': 'own', 'update': 'own', 'delete': 'own'},
+}
+# Сколько секунд процесс держит скомпилированные права ролей, прежде чем перечитать их из БД
+RBAC_CACHE_TTL = 30
+try:
+    import msgpack  # noqa: F401
+
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('users.renderers.MessagePackRenderer')
+except ImportError:
+    pass
 
 SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,
     'ACCESS_TOKEN_LIFETIME': timedelta(days=365),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=730),
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.TokenRefreshSerializer',
+}
+# Как часто (сек.) индекс черного списка JWT догружает записи других процессов (users.tokens)
+JWT_BLACKLIST_SYNC_INTERVAL = 5
+# Перекрытие окон догрузки (сек.): покрывает транзакции, зафиксированные позже соседних,
+# и расхождение часов между узлами; раз в JWT_BLACKLIST_FULL_SYNC_INTERVAL индекс перечитывается целиком
+JWT_BLACKLIST_SYNC_OVERLAP = 60
+JWT_BLACKLIST_FULL_SYNC_INTERVAL = 300
+# Кэш пользователей в CachedJWTAuthentication: время жизни записи (сек.) и максимальное число записей
+JWT_USER_CACHE_TTL = 30
+JWT_USER_CACHE_SIZE = 10000
+# Кэш ответов API (users.cache). LocMemCache вытесняет записи по LRU при достижении MAX_ENTRIES;
+# для нескольких процессов/узлов backend заменяется на общий (Redis, Memcached)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'api': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api-responses',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Фоновые задачи (users.taskqueue): ThreadPoolBackend — пул потоков внутри процесса,
+# ImmediateBackend — синхронное выполнение (тесты)
+TASK_QUEUE = {
+    'BACKEND': 'users.taskqueue.ThreadPoolBackend',
+    'WORKERS': 2,
+}
+# Сколько дней хранятся завершённые задачи (чистят run_task_worker и команда purge_tasks)
+TASK_RETENTION_DAYS = {'done': 7, 'failed': 30}
+# Лента (users.feed): спортсмены с большим числом подписчиков читаются «на лету», без рассылки по лентам;
+# FEED_BACKFILL_SIZE — сколько последних достижений добавляется в ленту при подписке
+FEED_FANOUT_LIMIT = 10000
+FEED_BACKFILL_SIZE = 50
+
+# Метрики производительности (users.metrics): пороги медленных запросов и SQL в мс,
+# доля запросов под cProfile и порог сохранения профиля в PROFILE_DIR.
+# /metrics доступен администраторам и по METRICS_TOKEN (Authorization: Bearer <token>);
+# ALLOWED_IPS сверяется с REMOTE_ADDR и имеет смысл только без обратного прокси
+PERFORMANCE_METRICS = {
+    'SLOW_REQUEST_MS': 500,
+    'SLOW_QUERY_MS': 100,
+    'PROFILE_SAMPLE_RATE': float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+    'PROFILE_THRESHOLD_MS': 1000,
+    'PROFILE_DIR': os.path.join(BASE_DIR, 'profiles'),
+    'ALLOWED_IPS': (),
+    'TOKEN': os.environ.get('METRICS_TOKEN'),
 }
+
+# Предупреждения о медленных запросах и SQL пишутся в консоль; при прогоне тестов — только ошибки
+TESTING = sys.argv[1:2] == ['test']
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'users.metrics': {
+            'handlers': ['console'],
+            'level': 'ERROR' if TESTING else os.environ.get('METRICS_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
 MIDDLEWARE = [
+    'users.metrics.PerformanceMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,6 +175,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'users.db_router.ReplicaRoutingMiddleware',
+    'users.throttling.RateLimitHeadersMiddleware',
 ]
 
 ROOT_URLCONF = 'SportSocNet.urls'
@@ -88,12 +203,60 @@ WSGI_APPLICATION = 'SportSocNet.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Конфигурация берётся из окружения. По умолчанию — SQLite в режиме WAL (локальная разработка и тесты).
+# DB_ENGINE=postgresql включает PostgreSQL с постоянными соединениями (DB_CONN_MAX_AGE) и проверкой
+# их перед использованием; DB_POOL=1 вместо этого включает пул соединений psycopg 3.
+# DB_REPLICA_HOSTS — хосты реплик через запятую, на них уходят чтения (users.db_router).
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite3')
+
+if DB_ENGINE == 'postgresql':
+    DB_POOL = os.environ.get('DB_POOL') == '1'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'sportsocnet'),
+            'USER': os.environ.get('DB_USER', 'sportsocnet'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            # С пулом psycopg соединения переиспользует пул, CONN_MAX_AGE должен быть 0
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'pool': {'min_size': 2, 'max_size': int(os.environ.get('DB_POOL_SIZE', 10))}} if DB_POOL else {},
+        }
     }
-}
+    for index, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))):
+        DATABASES[f'replica_{index}'] = {
+            **DATABASES['default'],
+            'HOST': host.strip(),
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    # WAL: читатели не блокируют писателя; IMMEDIATE: запись берёт блокировку в начале транзакции.
+    # journal_mode=WAL меняет заголовок файла БД, поэтому включается только явно (SQLITE_WAL=1) —
+    # для своей БД (SQLITE_PATH), а не для db.sqlite3 из репозитория
+    SQLITE_WAL = os.environ.get('SQLITE_WAL') == '1'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                'init_command': (
+                    ('PRAGMA journal_mode=WAL;PRAGMA synchronous=NORMAL;' if SQLITE_WAL else '')
+                    + 'PRAGMA cache_size=-20000;'
+                    'PRAGMA temp_store=MEMORY;'
+                    'PRAGMA mmap_size=134217728;'
+                ),
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+        }
+    }
+
+DATABASE_ROUTERS = ['users.db_router.ReplicaRouter']
+# Сколько секунд после записи клиент читает только с default (read-your-writes);
+# отметка хранится у клиента в подписанной cookie db_pin / заголовке X-DB-Pin
+DATABASE_REPLICA_PIN_SECONDS = 5
 
 AUTH_USER_MODEL = 'users.User'
 # Password validation
@@ -120,6 +283,20 @@ AUTH_PASSWORD_VALIDATORS = [
 LANGUAGE_CODE = 'ru-ru'
 MEDIA_URL = '/media/'  # URL для доступа к медиафайлам
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # Путь к директории, где хранятся медиафайлы
+# Медиафайлы именуются хэшем содержимого, одинаковые загрузки хранятся одной копией (users.storage)
+STORAGES = {
+    'default': {'BACKEND': 'users.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+# Отдача медиа фронтенд-сервером: None, 'x-sendfile' (Apache) или 'x-accel-redirect' (nginx, internal-location
+# MEDIA_ACCEL_REDIRECT_PREFIX с alias на MEDIA_ROOT)
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE') or None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+# Загрузка изображений по частям (users.uploads): каталог для частей, размер части, лимит и срок жизни сессии
+CHUNKED_UPLOAD_DIR = os.path.join(BASE_DIR, 'upload_parts')
+CHUNKED_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+CHUNKED_UPLOAD_MAX_SIZE = 50 * 1024 * 1024
+CHUNKED_UPLOAD_TTL = 24 * 60 * 60
 TIME_ZONE = 'UTC'
 
 USE_I18N = True
@@ -1,19 +1,39 @@
 from rest_framework.routers import DefaultRouter
-from django.urls import path, include
-from users.views import RoleViewSet, UserViewSet, AchievementViewSet, AchievementImageViewSet
-from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
-    TokenRefreshView,
-)
+from django.conf import settings
+from django.urls import path, re_path, include
+from users.views import RoleViewSet, UserViewSet, AchievementViewSet, AchievementImageViewSet, UserProfileViewSet, \
+    TaskQueueMetricsView, CacheMetricsView, SearchView, LeaderboardView, FeedView, UploadSessionViewSet, \
+    TokenObtainView, TokenRefreshThrottledView
+from users.media import MediaView
+from users.metrics import metrics_view
+from users.async_views import AsyncUserView, AsyncAchievementView, AsyncAchievementImageView
 
 router = DefaultRouter()
 router.register(r'roles', RoleViewSet)
 router.register(r'users', UserViewSet)
 router.register(r'achievements', AchievementViewSet)
 router.register(r'achievement-images', AchievementImageViewSet)
+router.register(r'profiles', UserProfileViewSet, basename='profile')
+router.register(r'uploads', UploadSessionViewSet, basename='upload')
 
 urlpatterns = [
     path('api/v1/', include(router.urls)),
-    path('api/v1/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('api/v1/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/v1/token/', TokenObtainView.as_view(), name='token_obtain_pair'),
+    path('api/v1/token/refresh/', TokenRefreshThrottledView.as_view(), name='token_refresh'),
+    path('api/v1/search/', SearchView.as_view(), name='search'),
+    path('api/v1/feed/', FeedView.as_view(), name='feed'),
+    path('api/v1/leaderboard/', LeaderboardView.as_view(), name='leaderboard'),
+    # Асинхронные представления только для чтения (эффективны при запуске под ASGI)
+    path('api/v1/async/users/', AsyncUserView.as_view(), name='async_users'),
+    path('api/v1/async/users/<int:pk>/', AsyncUserView.as_view(), name='async_user'),
+    path('api/v1/async/achievements/', AsyncAchievementView.as_view(), name='async_achievements'),
+    path('api/v1/async/achievements/<int:pk>/', AsyncAchievementView.as_view(), name='async_achievement'),
+    path('api/v1/async/achievement-images/', AsyncAchievementImageView.as_view(), name='async_achievement_images'),
+    path('api/v1/async/achievement-images/<int:pk>/', AsyncAchievementImageView.as_view(),
+         name='async_achievement_image'),
+    path('api/v1/cache/metrics/', CacheMetricsView.as_view(), name='cache_metrics'),
+    path('api/v1/tasks/metrics/', TaskQueueMetricsView.as_view(), name='task_queue_metrics'),
+    path('metrics', metrics_view, name='metrics'),
+    # Медиафайлы; в продакшене с MEDIA_SENDFILE сами байты отдаёт nginx/Apache
+    re_path(rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>.+)$', MediaView.as_view(), name='media'),
 ]
@@ -0,0 +1,107 @@
+"""
+Сравнение синхронного (WSGI, DRF) и асинхронного (ASGI) путей чтения внутри одного процесса.
+
+    python -m benchmarks.async_vs_sync --users 200 --requests 500 --concurrency 50
+
+Данные создаются в отдельной тестовой БД, рабочая db.sqlite3 не затрагивается.
+Синхронный путь нагружается пулом потоков (как воркеры WSGI-сервера), асинхронный —
+корутинами в одном цикле событий (как один процесс ASGI-сервера).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SportSocNet.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import AsyncClient, Client, override_settings  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+from users.models import Achievement, User  # noqa: E402
+from users.tokens import RefreshToken  # noqa: E402
+
+DUMMY_CACHE = 'django.core.cache.backends.dummy.DummyCache'
+
+
+def seed(users, achievements_per_user):
+    owner = User.objects.create_user('bench', password='bench')
+    User.objects.bulk_create([User(username=f'athlete{i}') for i in range(users)])
+    Achievement.objects.bulk_create([
+        Achievement(user=owner, title=f'Старт {i}') for i in range(users * achievements_per_user)
+    ])
+    return f'Bearer {RefreshToken.for_user(owner).access_token}'
+
+
+def summary(name, latencies, elapsed):
+    latencies = sorted(latencies)
+    p = lambda q: latencies[min(int(len(latencies) * q), len(latencies) - 1)] * 1000  # noqa: E731
+    print(f'{name:<8} {len(latencies) / elapsed:8.1f} req/s  '
+          f'p50 {p(0.5):7.2f} ms  p95 {p(0.95):7.2f} ms  p99 {p(0.99):7.2f} ms  '
+          f'mean {statistics.mean(latencies) * 1000:7.2f} ms')
+
+
+def run_sync(url, token, requests, concurrency):
+    client = Client(headers={'Authorization': token})
+
+    def call(_):
+        start = time.perf_counter()
+        response = client.get(url)
+        assert response.status_code == 200, response.status_code
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(call, range(requests)))
+    summary('wsgi', latencies, time.perf_counter() - start)
+
+
+async def run_async(url, token, requests, concurrency):
+    client = AsyncClient()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.get(url, headers={'Authorization': token})
+            assert response.status_code == 200, response.status_code
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(call() for _ in range(requests)))
+    summary('asgi', latencies, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--achievements-per-user', type=int, default=5)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--page-size', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        token = seed(args.users, args.achievements_per_user)
+        query = f'?page_size={args.page_size}'
+        # Кэш ответов DRF-представлений отключается, чтобы оба пути каждый раз читали БД;
+        # троттлинг — чтобы все запросы одного пользователя доходили до представлений
+        with override_settings(CACHES={**settings.CACHES, 'api': {'BACKEND': DUMMY_CACHE}},
+                               RATE_LIMIT={'ENABLED': False}):
+            run_sync(f'/api/v1/achievements/{query}', token, args.requests, args.concurrency)
+            asyncio.run(run_async(f'/api/v1/async/achievements/{query}', token, args.requests, args.concurrency))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
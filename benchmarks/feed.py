@@ -0,0 +1,84 @@
+"""
+Лента подписок: время рассылки достижения популярного спортсмена и задержка чтения ленты.
+
+    python -m benchmarks.feed --followers 10000 --reads 200
+
+Данные создаются в отдельной тестовой БД, рабочая db.sqlite3 не затрагивается.
+Рассылка выполняется синхронно (ImmediateBackend), чтобы измерить её полное время.
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SportSocNet.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+from benchmarks.async_vs_sync import DUMMY_CACHE, summary  # noqa: E402
+from users.models import Achievement, FeedItem, Follow, User  # noqa: E402
+from users.tokens import RefreshToken  # noqa: E402
+
+
+def seed(followers):
+    star = User.objects.create_user('star', password='bench')
+    User.objects.bulk_create([User(username=f'fan{i}') for i in range(followers)], batch_size=1000)
+    fans = User.objects.filter(username__startswith='fan')
+    Follow.objects.bulk_create([Follow(follower=fan, followee=star) for fan in fans], batch_size=1000)
+    User.objects.filter(pk=star.pk).update(follower_count=followers)
+    return star, fans.first()
+
+
+def run_fan_out(star, achievements):
+    start = time.perf_counter()
+    for i in range(achievements):
+        Achievement.objects.create(user=star, title=f'Старт {i}')
+    elapsed = time.perf_counter() - start
+    print(f'fan-out  {achievements} достижений, {FeedItem.objects.count()} строк лент за {elapsed:.2f} s')
+
+
+def run_reads(reader, reads, page_size):
+    client = Client(headers={'Authorization': f'Bearer {RefreshToken.for_user(reader).access_token}'})
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(reads):
+        request_start = time.perf_counter()
+        response = client.get(f'/api/v1/feed/?page_size={page_size}')
+        assert response.status_code == 200, response.status_code
+        latencies.append(time.perf_counter() - request_start)
+    summary('feed', latencies, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--followers', type=int, default=10000)
+    parser.add_argument('--achievements', type=int, default=20)
+    parser.add_argument('--reads', type=int, default=200)
+    parser.add_argument('--page-size', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        star, reader = seed(args.followers)
+        with override_settings(CACHES={**settings.CACHES, 'api': {'BACKEND': DUMMY_CACHE}},
+                               TASK_QUEUE={'BACKEND': 'users.taskqueue.ImmediateBackend'},
+                               RATE_LIMIT={'ENABLED': False}):
+            run_fan_out(star, args.achievements)
+            run_reads(reader, args.reads, args.page_size)
+            # Тот же спортсмен как «звезда»: без рассылки, с подмешиванием при чтении
+            with override_settings(FEED_FANOUT_LIMIT=args.followers - 1):
+                FeedItem.objects.all().delete()
+                run_reads(reader, args.reads, args.page_size)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
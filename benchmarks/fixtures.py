@@ -0,0 +1,70 @@
+"""
+Генератор данных для бенчмарков: роли, пользователи, достижения и изображения пачками через bulk_create,
+затем пересчёт подписчиков, лент, статистики и поискового индекса (bulk_create не отправляет сигналы).
+"""
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from users.feed import fan_out_achievements
+from users.models import Achievement, AchievementImage, Follow, ImageStatus, Role, User
+from users.permissions import grant_default_permissions
+from users.search import index_objects
+from users.stats import rebuild_user_stats
+
+BATCH_SIZE = 1000
+PASSWORD = 'bench-password'
+ROLE_NAMES = ['Спортсмен', 'Тренер', 'Судья', 'Болельщик', 'Организатор']
+TITLES = ['Кубок города', 'Марафон', 'Первенство области', 'Чемпионат России', 'Забег', 'Турнир']
+
+
+def seed(users=100, roles=5, achievements_per_user=5, images_per_achievement=1, follows_per_user=10, seed=0):
+    """
+    Заполняет БД детерминированным набором данных (одинаковым при одинаковом seed).
+    Возвращает основного пользователя бенчмарков (логин bench, пароль PASSWORD).
+    """
+    rng = random.Random(seed)
+    password = make_password(PASSWORD)
+    with transaction.atomic():
+        role_objects = Role.objects.bulk_create([Role(name=ROLE_NAMES[i % len(ROLE_NAMES)]) for i in range(roles)])
+        grant_default_permissions(role_objects)
+        owner = User.objects.create(username='bench', password=password, role=role_objects[0])
+        User.objects.bulk_create([
+            User(username=f'athlete{i}', password=password, first_name=f'Имя{i}', last_name=f'Фамилия{i}',
+                 role=rng.choice(role_objects), bio='Бегун, пловец и лыжник')
+            for i in range(users - 1)
+        ], batch_size=BATCH_SIZE)
+        user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+
+        start = date(2015, 1, 1)
+        Achievement.objects.bulk_create([
+            Achievement(user_id=user_id, title=f'{rng.choice(TITLES)} {i}', description='Описание достижения',
+                        date_achieved=start + timedelta(days=rng.randrange(3650)))
+            for user_id in user_ids for i in range(achievements_per_user)
+        ], batch_size=BATCH_SIZE)
+        achievement_ids = Achievement.objects.values_list('pk', flat=True).iterator()
+        AchievementImage.objects.bulk_create((
+            AchievementImage(achievement_id=achievement_id, image=f'achievements/bench_{achievement_id}_{i}.jpg',
+                             image_status=ImageStatus.READY)
+            for achievement_id in achievement_ids for i in range(images_per_achievement)
+        ), batch_size=BATCH_SIZE)
+
+        Follow.objects.bulk_create([
+            Follow(follower_id=user_id, followee_id=followee_id)
+            for user_id in user_ids
+            for followee_id in rng.sample(user_ids, min(follows_per_user + 1, len(user_ids)))
+            if followee_id != user_id
+        ], batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+        User.objects.update(follower_count=Coalesce(Subquery(
+            Follow.objects.filter(followee=OuterRef('pk')).values('followee').annotate(count=Count('pk'))
+            .values('count')), 0))
+        fan_out_achievements(list(Achievement.objects.values_list('pk', flat=True)))
+        rebuild_user_stats(user_ids)
+        index_objects(User.objects.all())
+        index_objects(Achievement.objects.all())
+    return owner
@@ -0,0 +1,245 @@
+"""
+Нагрузочные сценарии API с порогами регрессии.
+
+    python -m benchmarks.run --users 500 --requests 200 --concurrency 20
+    python -m benchmarks.run --mode http --scenarios users.list,token.obtain
+    python -m benchmarks.run --save-baseline      # записать текущие результаты как эталон
+
+Данные создаются в отдельной тестовой БД (benchmarks.fixtures), рабочая db.sqlite3 не затрагивается.
+Режим inprocess вызывает Django напрямую из пула потоков, http — через настоящий HTTP-сервер
+(ThreadedWSGIServer) на свободном порту. Для каждого сценария печатаются p50/p95/p99, пропускная
+способность и число SQL-запросов; при сравнении с эталоном (benchmarks/baselines.json) процесс
+завершается с кодом 1, если p95 вырос больше чем на --tolerance или выросло число запросов.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SportSocNet.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler  # noqa: E402
+from django.core.wsgi import get_wsgi_application  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_test_environment  # noqa: E402
+
+from benchmarks.async_vs_sync import DUMMY_CACHE  # noqa: E402
+from benchmarks.fixtures import seed  # noqa: E402
+from benchmarks.scenarios import SCENARIOS, scenario_context  # noqa: E402
+from users.permissions import permission_cache  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(int(len(sorted_values) * q), len(sorted_values) - 1)]
+
+
+class InProcessTransport:
+    def __init__(self):
+        self.local = threading.local()
+
+    def client(self):
+        if not hasattr(self.local, 'client'):
+            self.local.client = Client()
+        return self.local.client
+
+    def send(self, method, path, data, headers):
+        client = self.client()
+        if method == 'GET':
+            response = client.get(path, headers=headers)
+        else:
+            response = client.generic(method, path, json.dumps(data), content_type='application/json',
+                                      headers=headers)
+        return response.status_code
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class HTTPTransport:
+    """
+    Запросы по HTTP к WSGI-приложению, запущенному в фоновом потоке этого процесса.
+    """
+
+    def __init__(self):
+        self.server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler, allow_reuse_address=False)
+        self.server.set_app(get_wsgi_application())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def send(self, method, path, data, headers):
+        body = json.dumps(data).encode() if data is not None else None
+        request = urllib.request.Request(self.base_url + urllib.parse.quote(path, safe='/?=&,'), data=body,
+                                         method=method, headers={**headers, 'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def headers_for(scenario, context):
+    return {'Authorization': f"Bearer {context['access']}"} if scenario.auth else {}
+
+
+def count_queries(scenario, context):
+    with CaptureQueriesContext(connection) as ctx:
+        InProcessTransport().send(scenario.method, scenario.path, scenario.body(context, 0),
+                                  headers_for(scenario, context))
+    return len(ctx.captured_queries)
+
+
+def run_scenario(transport, scenario, context, requests, concurrency):
+    requests = min(requests, scenario.max_requests or requests)
+    headers = headers_for(scenario, context)
+    errors = []
+
+    def call(i):
+        start = time.perf_counter()
+        status = transport.send(scenario.method, scenario.path, scenario.body(context, i + 1), headers)
+        if status >= 400:
+            errors.append(status)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = sorted(pool.map(call, range(requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        'requests': requests,
+        'errors': len(errors),
+        'rps': round(requests / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Список регрессий относительно эталона: рост p95 больше чем на tolerance или любой рост числа SQL-запросов.
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if not expected:
+            continue
+        if result['p95_ms'] > expected['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']} ms > {expected['p95_ms']} ms (+{tolerance:.0%})")
+        if result['queries'] > expected['queries']:
+            regressions.append(f"{name}: SQL-запросов {result['queries']} > {expected['queries']}")
+        if result['errors']:
+            regressions.append(f"{name}: ошибок {result['errors']}")
+    return regressions
+
+
+def print_table(results):
+    print(f"{'scenario':<22} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'errors':>7}")
+    for name, r in results.items():
+        print(f"{name:<22} {r['rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} "
+              f"{r['queries']:>8} {r['errors']:>7}")
+
+
+def load_baselines(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mode', choices=['inprocess', 'http'], default='inprocess')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--achievements-per-user', type=int, default=5)
+    parser.add_argument('--images-per-achievement', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--scenarios', help='Список сценариев через запятую (по умолчанию все)')
+    parser.add_argument('--with-cache', action='store_true', help='Не отключать кэш ответов API')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Допустимый рост p95 (доля)')
+    args = parser.parse_args()
+
+    scenarios = SCENARIOS
+    if args.scenarios:
+        names = set(args.scenarios.split(','))
+        scenarios = [scenario for scenario in SCENARIOS if scenario.name in names]
+
+    setup_test_environment()
+    # Журнал медленных запросов (users.metrics) под нагрузкой только мешает читать результаты
+    logging.getLogger('users.metrics').setLevel(logging.ERROR)
+    # Файловая тестовая БД: SQLite в памяти плохо переносит параллельную запись из потоков HTTP-сервера
+    test_db_dir = tempfile.mkdtemp()
+    if connection.vendor == 'sqlite':
+        settings.DATABASES['default'].setdefault('TEST', {})['NAME'] = os.path.join(test_db_dir, 'bench.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0)
+    caches = settings.CACHES if args.with_cache else {**settings.CACHES, 'api': {'BACKEND': DUMMY_CACHE}}
+    results = {}
+    transport = None
+    try:
+        owner = seed(users=args.users, achievements_per_user=args.achievements_per_user,
+                     images_per_achievement=args.images_per_achievement)
+        context = scenario_context(owner, args.requests + 1)
+        # Права ролей загружаются один раз на процесс — в число запросов сценария это не входит
+        permission_cache.get(owner.role_id)
+        with override_settings(CACHES=caches, TASK_QUEUE={'BACKEND': 'users.taskqueue.ImmediateBackend'},
+                               ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, '127.0.0.1'],
+                               RATE_LIMIT={'ENABLED': False}):
+            transport = HTTPTransport() if args.mode == 'http' else InProcessTransport()
+            for scenario in scenarios:
+                queries = count_queries(scenario, context)
+                result = run_scenario(transport, scenario, context, args.requests, args.concurrency)
+                results[scenario.name] = {**result, 'queries': queries}
+    finally:
+        if isinstance(transport, HTTPTransport):
+            transport.close()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    print_table(results)
+    baselines = load_baselines(args.baseline)
+    if args.save_baseline:
+        if any(r['errors'] for r in results.values()):
+            sys.exit('Есть ошибочные ответы, эталон не сохранён')
+        baselines[args.mode] = {name: {'p95_ms': r['p95_ms'], 'queries': r['queries']}
+                                for name, r in results.items()}
+        baselines['_fixture'] = {'users': args.users, 'achievements_per_user': args.achievements_per_user,
+                                 'images_per_achievement': args.images_per_achievement,
+                                 'requests': args.requests, 'concurrency': args.concurrency}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2, ensure_ascii=False, sort_keys=True)
+            f.write('\n')
+        print(f'Эталон сохранён в {args.baseline}')
+        return
+
+    regressions = compare(results, baselines.get(args.mode, {}), args.tolerance)
+    for line in regressions:
+        print(f'РЕГРЕССИЯ {line}', file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
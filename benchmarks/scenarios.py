@@ -0,0 +1,52 @@
+"""
+Сценарии нагрузки: HTTP-метод, путь и тело запроса. Пути и тела строятся по данным,
+созданным benchmarks.fixtures.seed, поэтому запуски сравнимы между собой.
+"""
+from benchmarks.fixtures import PASSWORD
+from users.tokens import RefreshToken
+
+
+class Scenario:
+    def __init__(self, name, method, path, data=None, max_requests=None, auth=True):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+        # Ограничение для дорогих по природе сценариев (хэширование пароля при выдаче токена)
+        self.max_requests = max_requests
+        self.auth = auth
+
+    def body(self, context, i):
+        return self.data(context, i) if callable(self.data) else self.data
+
+
+def achievement_payload(context, i):
+    return {'user': context['user_id'], 'title': f'Нагрузочный старт {i}', 'date_achieved': '2024-05-01'}
+
+
+def refresh_payload(context, i):
+    # Токены ротируются с занесением в чёрный список, поэтому каждому запросу нужен свой
+    return {'refresh': context['refresh_tokens'][i]}
+
+
+SCENARIOS = [
+    Scenario('users.list', 'GET', '/api/v1/users/?page_size=50'),
+    Scenario('users.list.sparse', 'GET', '/api/v1/users/?page_size=50&fields=id,username,role&expand=role'),
+    Scenario('achievements.list', 'GET', '/api/v1/achievements/?page_size=50'),
+    Scenario('profiles.list', 'GET', '/api/v1/profiles/?page_size=20'),
+    Scenario('achievements.create', 'POST', '/api/v1/achievements/', achievement_payload),
+    Scenario('search', 'GET', '/api/v1/search/?q=марафон'),
+    Scenario('leaderboard', 'GET', '/api/v1/leaderboard/'),
+    Scenario('feed', 'GET', '/api/v1/feed/'),
+    Scenario('token.obtain', 'POST', '/api/v1/token/', {'username': 'bench', 'password': PASSWORD},
+             max_requests=20, auth=False),
+    Scenario('token.refresh', 'POST', '/api/v1/token/refresh/', refresh_payload, auth=False),
+]
+
+
+def scenario_context(user, requests):
+    return {
+        'user_id': user.pk,
+        'access': str(RefreshToken.for_user(user).access_token),
+        'refresh_tokens': [str(RefreshToken.for_user(user)) for _ in range(requests + 1)],
+    }
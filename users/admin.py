@@ -1,5 +1,13 @@
 from django.contrib import admin
-from .models import Role, User, Achievement, AchievementImage
+from .models import Role, RolePermission, User, Achievement, AchievementImage, Task
+
+
+class RolePermissionInline(admin.TabularInline):
+    """
+    Права роли на странице роли.
+    """
+    model = RolePermission
+    extra = 0
 
 
 @admin.register(Role)
@@ -10,6 +18,7 @@ class RoleAdmin(admin.ModelAdmin):
     list_display = ('id', 'name')
     search_fields = ('name',)
     ordering = ('id',)
+    inlines = (RolePermissionInline,)
 
 
 @admin.register(User)
@@ -21,6 +30,7 @@ class UserAdmin(admin.ModelAdmin):
     list_filter = ('role', 'is_active', 'is_staff', 'date_joined')
     search_fields = ('username', 'email', 'first_name', 'last_name')
     ordering = ('-date_joined',)
+    list_select_related = ('role',)
     fieldsets = (
         (None, {
             'fields': (
@@ -47,7 +57,8 @@ class AchievementAdmin(admin.ModelAdmin):
     list_display = ('id', 'title', 'user', 'date_achieved')
     list_filter = ('date_achieved',)
     search_fields = ('title', 'user__username')
-    ordering = ('-date_achieved',)
+    ordering = ('user', '-date_achieved')  # индекс achievement_user_date_idx
+    list_select_related = ('user',)
     autocomplete_fields = ('user',)
 
 
@@ -59,6 +70,16 @@ class AchievementImageAdmin(admin.ModelAdmin):
     list_display = ('id', 'achievement', 'image', 'uploaded_at')
     list_filter = ('uploaded_at',)
     search_fields = ('achievement__title',)
-    ordering = ('-uploaded_at',)
+    ordering = ('achievement', 'uploaded_at')  # индекс achievementimage_ach_upl_idx
+    list_select_related = ('achievement',)
 
 
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    """
+    Админка для модели Task.
+    """
+    list_display = ('id', 'name', 'status', 'attempts', 'run_after', 'updated_at')
+    list_filter = ('status', 'name')
+    ordering = ('-id',)
+    readonly_fields = ('name', 'payload', 'attempts', 'last_error', 'created_at', 'updated_at')
@@ -5,3 +5,6 @@ class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
     verbose_name = 'Пользователи'
+
+    def ready(self):
+        from . import authentication, cache, feed, permissions, search, stats, storage, tasks, tokens  # noqa: F401 — сигналы и регистрация фоновых задач
@@ -0,0 +1,107 @@
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils.http import urlencode
+from django.views import View
+from rest_framework.exceptions import APIException
+
+from .authentication import CachedJWTAuthentication
+from .filters import MAX_ID, UserFilterBackend, AchievementFilterBackend, AchievementImageFilterBackend
+from .models import User, Achievement, AchievementImage, RolePermission
+from .permissions import RESOURCES, Action, Scope, get_scope
+from .serializers import query_param_set, UserSerializer, AchievementSerializer, AchievementImageSerializer
+
+
+class AsyncReadOnlyView(View):
+    """
+    Асинхронные list/retrieve поверх async ORM (aget, async for) для запуска под ASGI.
+    Ответы совпадают с DRF-представлениями, пагинация — по убыванию id (?cursor=<id последнего элемента>).
+    Права роли на просмотр permission_resource применяются так же, как в HasRolePermission.
+    """
+    queryset = None
+    serializer_class = None
+    filter_backend = None
+    permission_resource = None
+    page_size = 50
+    max_page_size = 200
+
+    @staticmethod
+    def error(detail, status):
+        if not isinstance(detail, dict):
+            detail = {'detail': detail}
+        return JsonResponse(detail, status=status, json_dumps_params={'ensure_ascii': False})
+
+    async def get(self, request, pk=None):
+        try:
+            authenticated = await CachedJWTAuthentication().aauthenticate(request)
+            if authenticated is None:
+                return self.error('Учетные данные не были предоставлены.', 401)
+            request.user = authenticated[0]
+            # Права роли могут потребовать запроса к БД (PermissionCache), поэтому — через sync_to_async
+            scope = await sync_to_async(get_scope)(request.user, self.permission_resource, Action.VIEW)
+            if scope is None:
+                return self.error('У вас недостаточно прав для выполнения данного действия.', 403)
+            queryset = self.queryset
+            if scope == Scope.OWN:
+                queryset = queryset.filter(**{RESOURCES[self.permission_resource][0]: request.user.pk})
+            # Раскрытые через ?expand= связи загружаются тем же запросом: ленивая загрузка в async-контексте невозможна
+            expanded = query_param_set(request, 'expand') & set(self.serializer_class.expandable_fields)
+            if expanded:
+                queryset = queryset.select_related(*sorted(expanded))
+            if pk is not None:
+                return await self.retrieve(request, queryset, pk)
+            return await self.list(request, queryset)
+        except APIException as exc:
+            return self.error(exc.detail, exc.status_code)
+
+    async def retrieve(self, request, queryset, pk):
+        try:
+            obj = await queryset.aget(pk=pk)
+        except queryset.model.DoesNotExist:
+            return self.error('Страница не найдена.', 404)
+        return JsonResponse(self.serializer_class(obj, context={'request': request}).data)
+
+    def get_page_size(self, request):
+        try:
+            return min(max(int(request.GET.get('page_size', self.page_size)), 1), self.max_page_size)
+        except ValueError:
+            return self.page_size
+
+    async def list(self, request, queryset):
+        if self.filter_backend is not None:
+            queryset = self.filter_backend().filter_queryset(request, queryset, self)
+        cursor = request.GET.get('cursor')
+        if cursor and cursor.isascii() and cursor.isdecimal() and int(cursor) <= MAX_ID:
+            queryset = queryset.filter(pk__lt=int(cursor))
+
+        page_size = self.get_page_size(request)
+        objects = [obj async for obj in queryset.order_by('-pk')[:page_size + 1]]
+        next_url = None
+        if len(objects) > page_size:
+            objects = objects[:page_size]
+            params = request.GET.copy()
+            params['cursor'] = objects[-1].pk
+            next_url = request.build_absolute_uri(f'{request.path}?{urlencode(params, doseq=True)}')
+
+        serializer = self.serializer_class(objects, many=True, context={'request': request})
+        return JsonResponse({'next': next_url, 'results': serializer.data})
+
+
+class AsyncUserView(AsyncReadOnlyView):
+    queryset = User.objects.all()
+    serializer_class = UserSerializer
+    filter_backend = UserFilterBackend
+    permission_resource = RolePermission.Resource.USER
+
+
+class AsyncAchievementView(AsyncReadOnlyView):
+    queryset = Achievement.objects.all()
+    serializer_class = AchievementSerializer
+    filter_backend = AchievementFilterBackend
+    permission_resource = RolePermission.Resource.ACHIEVEMENT
+
+
+class AsyncAchievementImageView(AsyncReadOnlyView):
+    queryset = AchievementImage.objects.all()
+    serializer_class = AchievementImageSerializer
+    filter_backend = AchievementImageFilterBackend
+    permission_resource = RolePermission.Resource.ACHIEVEMENT_IMAGE
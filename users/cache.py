@@ -0,0 +1,136 @@
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.signals import post_save, post_delete
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Role, User, Achievement, AchievementImage
+
+CACHE_ALIAS = 'api'
+CACHED_MODELS = (Role, User, Achievement, AchievementImage)
+
+_metrics = Counter()
+_metrics_lock = threading.Lock()
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _incr(key):
+    with _metrics_lock:
+        _metrics[key] += 1
+
+
+def _generation_key(label):
+    return f'gen:{label}'
+
+
+def _object_key(label, pk):
+    return f'obj:{label}:{pk}'
+
+
+def _versions(keys):
+    """
+    Текущие версии пространств ключей. Отсутствующая (вытесненная) версия заново
+    инициализируется временем, поэтому старые записи после вытеснения не оживают.
+    """
+    cache = _cache()
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def invalidate(model, pk=None):
+    """
+    Сбрасывает закэшированные списки модели и, если указан pk, ответы по конкретному объекту.
+    Нужно вызывать вручную после QuerySet.update(), который не отправляет сигналы.
+    """
+    label = model._meta.label_lower
+    keys = {_generation_key(label): time.time_ns()}
+    if pk is not None:
+        keys[_object_key(label, pk)] = time.time_ns()
+    _cache().set_many(keys, timeout=None)
+
+
+def invalidate_on_change(sender, instance, **kwargs):
+    invalidate(sender, instance.pk)
+
+
+# Подписка только на нужные модели: приёмник без sender мешает быстрому удалению (fast delete) остальных
+for model in CACHED_MODELS:
+    post_save.connect(invalidate_on_change, sender=model)
+    post_delete.connect(invalidate_on_change, sender=model)
+
+
+def cache_metrics():
+    with _metrics_lock:
+        return dict(_metrics)
+
+
+def _etag(data):
+    payload = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True, ensure_ascii=False)
+    return '"%s"' % hashlib.md5(payload.encode(), usedforsecurity=False).hexdigest()
+
+
+class CachedResponseMixin:
+    """
+    Кэширование ответов list/retrieve в кэше 'api' с поддержкой ETag и If-None-Match.
+    cache_dependencies — метки моделей, изменение которых делает ответ устаревшим, включая модели,
+    раскрываемые через ?expand= (см. SparseFieldsMixin.expandable_fields).
+    Ответ retrieve привязан к версии своего объекта, а не ко всей таблице.
+    cache_key_extra() — дополнительные части ключа, если ответ зависит от пользователя.
+    """
+    cache_dependencies = ()
+    cache_timeout = 300
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, self.cache_dependencies, (), lambda: super(
+            CachedResponseMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        label = self.get_queryset().model._meta.label_lower
+        lookup = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        dependencies = [dep for dep in self.cache_dependencies if dep != label]
+        return self.cached_response(request, dependencies, [_object_key(label, lookup)], lambda: super(
+            CachedResponseMixin, self).retrieve(request, *args, **kwargs))
+
+    def cache_key_extra(self, request):
+        return ()
+
+    def cached_response(self, request, dependencies, object_keys, build):
+        version_keys = [_generation_key(dep) for dep in dependencies] + list(object_keys)
+        versions = _versions(version_keys)
+        parts = (request.build_absolute_uri(), request.accepted_renderer.format, versions,
+                 self.cache_key_extra(request))
+        key = 'response:%s' % hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+
+        cache = _cache()
+        cached = cache.get(key)
+        if cached is None:
+            _incr('misses')
+            response = build()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            cached = {'data': response.data, 'etag': _etag(response.data)}
+            cache.set(key, cached, self.cache_timeout)
+        else:
+            _incr('hits')
+
+        if cached['etag'] in request.headers.get('If-None-Match', ''):
+            _incr('not_modified')
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(cached['data'])
+        response['ETag'] = cached['etag']
+        response['Cache-Control'] = 'private, no-cache'
+        return response
@@ -0,0 +1,112 @@
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.core import signing
+
+# Реплика, выбранная для текущего запроса (None — читать с default)
+_replica = ContextVar('replica', default=None)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'db_pin'
+PIN_HEADER = 'X-DB-Pin'
+PIN_SALT = 'users.db_router.pin'
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica')]
+
+
+def pin_seconds():
+    return getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 5)
+
+
+class ReplicaRouter:
+    """
+    Чтения в рамках безопасных запросов идут на реплику, выбранную для запроса, всё остальное — на default.
+    Решение о маршрутизации принимает ReplicaRoutingMiddleware.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _replica.get() or 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Разрешает чтение с реплик для GET/HEAD/OPTIONS под /api/v1/. Реплика выбирается одна на запрос,
+    чтобы все его чтения видели один и тот же момент репликации.
+    После записи клиент на DATABASE_REPLICA_PIN_SECONDS закрепляется за default (read-your-writes).
+    Отметка о закреплении хранится у клиента — в подписанной cookie db_pin и в заголовке ответа X-DB-Pin,
+    который клиенты без cookie могут вернуть в запросе, — поэтому работает при любом числе воркеров
+    и не требует общего кэша.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def is_pinned(request):
+        if request.get_signed_cookie(PIN_COOKIE, default=None, salt=PIN_SALT, max_age=pin_seconds()):
+            return True
+        value = request.headers.get(PIN_HEADER)
+        if not value:
+            return False
+        try:
+            signing.TimestampSigner(salt=PIN_SALT).unsign(value, max_age=pin_seconds())
+        except signing.BadSignature:
+            return False
+        return True
+
+    @staticmethod
+    def pin(response):
+        if response.status_code < 400:
+            response.set_signed_cookie(PIN_COOKIE, '1', salt=PIN_SALT, max_age=pin_seconds(), httponly=True,
+                                       samesite='Lax', secure=settings.SESSION_COOKIE_SECURE)
+            response[PIN_HEADER] = signing.TimestampSigner(salt=PIN_SALT).sign('1')
+        return response
+
+    def choose_replica(self, request):
+        return None if self.is_pinned(request) else random.choice(replica_aliases())
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not replica_aliases() or not request.path.startswith('/api/v1/'):
+            return self.get_response(request)
+
+        if request.method in SAFE_METHODS:
+            token = _replica.set(self.choose_replica(request))
+            try:
+                return self.get_response(request)
+            finally:
+                _replica.reset(token)
+        return self.pin(self.get_response(request))
+
+    async def __acall__(self, request):
+        if not replica_aliases() or not request.path.startswith('/api/v1/'):
+            return await self.get_response(request)
+
+        if request.method in SAFE_METHODS:
+            token = _replica.set(self.choose_replica(request))
+            try:
+                return await self.get_response(request)
+            finally:
+                _replica.reset(token)
+        return self.pin(await self.get_response(request))
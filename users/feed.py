@@ -0,0 +1,181 @@
+import base64
+from datetime import datetime
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .cache import invalidate
+from .models import User, Achievement, Follow, FeedItem
+from .taskqueue import task
+
+FANOUT_BATCH_SIZE = 1000
+
+
+def fanout_limit():
+    """
+    Достижения спортсменов с большим числом подписчиков не рассылаются по лентам,
+    а подмешиваются при чтении (fan-out-on-read).
+    """
+    return getattr(settings, 'FEED_FANOUT_LIMIT', 10000)
+
+
+def follower_count(user_id):
+    return User.objects.filter(pk=user_id).values_list('follower_count', flat=True).get()
+
+
+def follow(follower, followee):
+    """
+    Подписывает follower на followee. Возвращает False, если подписка уже была.
+    """
+    try:
+        with transaction.atomic():
+            Follow.objects.create(follower=follower, followee=followee)
+            User.objects.filter(pk=followee.pk).update(follower_count=F('follower_count') + 1)
+            if follower_count(followee.pk) == fanout_limit() + 1:
+                trim_author_feed.delay(author_id=followee.pk)
+            backfill_feed.delay(follower_id=follower.pk, followee_id=followee.pk)
+    except IntegrityError:
+        return False
+    invalidate(User, followee.pk)
+    return True
+
+
+def unfollow(follower, followee):
+    with transaction.atomic():
+        deleted, _ = Follow.objects.filter(follower=follower, followee=followee).delete()
+        if not deleted:
+            return False
+        User.objects.filter(pk=followee.pk).update(follower_count=F('follower_count') - 1)
+        FeedItem.objects.filter(owner=follower, author=followee).delete()
+        if follower_count(followee.pk) == fanout_limit():
+            backfill_author_feed.delay(author_id=followee.pk)
+    invalidate(User, followee.pk)
+    return True
+
+
+@task(name='users.fan_out_achievements')
+def fan_out_achievements(achievement_ids):
+    """
+    Раскладывает достижения в ленты подписчиков пачками по FANOUT_BATCH_SIZE строк.
+    """
+    achievements = Achievement.objects.filter(pk__in=achievement_ids, user__follower_count__gt=0,
+                                              user__follower_count__lte=fanout_limit())
+    for achievement in achievements.only('pk', 'user_id', 'created_at'):
+        followers = (Follow.objects.filter(followee_id=achievement.user_id).order_by()
+                     .values_list('follower_id', flat=True).iterator(chunk_size=FANOUT_BATCH_SIZE))
+        batch = []
+        for follower_id in followers:
+            batch.append(FeedItem(owner_id=follower_id, achievement_id=achievement.pk,
+                                  author_id=achievement.user_id, created_at=achievement.created_at))
+            if len(batch) == FANOUT_BATCH_SIZE:
+                FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+@task(name='users.backfill_feed')
+def backfill_feed(follower_id, followee_id):
+    """
+    Добавляет в ленту нового подписчика последние достижения спортсмена.
+    """
+    if User.objects.filter(pk=followee_id, follower_count__gt=fanout_limit()).exists():
+        return
+    recent = (Achievement.objects.filter(user_id=followee_id).order_by('-created_at', '-id')
+              .values_list('pk', 'created_at')[:getattr(settings, 'FEED_BACKFILL_SIZE', 50)])
+    FeedItem.objects.bulk_create([
+        FeedItem(owner_id=follower_id, achievement_id=pk, author_id=followee_id, created_at=created_at)
+        for pk, created_at in recent
+    ], ignore_conflicts=True)
+
+
+@task(name='users.trim_author_feed')
+def trim_author_feed(author_id):
+    """
+    Спортсмен перешёл порог FEED_FANOUT_LIMIT: его достижения теперь подмешиваются при чтении,
+    а разосланные раньше строки лент больше не читаются и удаляются пачками.
+    """
+    if not User.objects.filter(pk=author_id, follower_count__gt=fanout_limit()).exists():
+        return
+    items = FeedItem.objects.filter(author_id=author_id)
+    while ids := list(items.values_list('pk', flat=True)[:FANOUT_BATCH_SIZE]):
+        FeedItem.objects.filter(pk__in=ids).delete()
+
+
+@task(name='users.backfill_author_feed')
+def backfill_author_feed(author_id):
+    """
+    Спортсмен опустился до порога FEED_FANOUT_LIMIT: его последние достижения (как при подписке)
+    раскладываются по лентам всех подписчиков, иначе опубликованное в статусе «звезды» пропало бы из лент.
+    """
+    if User.objects.filter(pk=author_id, follower_count__gt=fanout_limit()).exists():
+        return
+    recent = list(Achievement.objects.filter(user_id=author_id).order_by('-created_at', '-id')
+                  .values_list('pk', 'created_at')[:getattr(settings, 'FEED_BACKFILL_SIZE', 50)])
+    if not recent:
+        return
+    followers = (Follow.objects.filter(followee_id=author_id).order_by()
+                 .values_list('follower_id', flat=True).iterator(chunk_size=FANOUT_BATCH_SIZE))
+    batch = []
+    for follower_id in followers:
+        batch += [FeedItem(owner_id=follower_id, achievement_id=pk, author_id=author_id, created_at=created_at)
+                  for pk, created_at in recent]
+        if len(batch) >= FANOUT_BATCH_SIZE:
+            FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def schedule_fan_out(achievement_ids):
+    if achievement_ids:
+        fan_out_achievements.delay(achievement_ids=list(achievement_ids))
+
+
+@receiver(post_save, sender=Achievement)
+def fan_out_on_create(sender, instance, created, **kwargs):
+    if created and User.objects.filter(pk=instance.user_id, follower_count__gt=0).exists():
+        schedule_fan_out([instance.pk])
+
+
+def encode_cursor(created_at, achievement_id):
+    return base64.urlsafe_b64encode(f'{created_at.isoformat()}|{achievement_id}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, achievement_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(achievement_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def read_feed(user, cursor=None, page_size=20):
+    """
+    Страница ленты: [(created_at, achievement_id)] по убыванию и курсор следующей страницы.
+    Разосланные строки читаются по индексу (owner, -created_at), достижения «звёзд» —
+    по индексу (user, -created_at); затем обе выборки сливаются. Строки «звёзд», разосланные
+    до перехода порога, из ленты не читаются, чтобы достижение не попало в страницу дважды.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    celebrities = list(Follow.objects.filter(follower=user, followee__follower_count__gt=fanout_limit())
+                       .values_list('followee_id', flat=True))
+    timeline = FeedItem.objects.filter(owner=user).exclude(author_id__in=celebrities)
+    popular = Achievement.objects.filter(user_id__in=celebrities)
+    if position is not None:
+        created_at, achievement_id = position
+        timeline = timeline.filter(Q(created_at__lt=created_at) | Q(created_at=created_at,
+                                                                    achievement_id__lt=achievement_id))
+        popular = popular.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=achievement_id))
+
+    rows = list(timeline.order_by('-created_at', '-achievement_id')
+                .values_list('created_at', 'achievement_id')[:page_size + 1])
+    if celebrities:
+        rows += list(popular.order_by('-created_at', '-id').values_list('created_at', 'id')[:page_size + 1])
+        rows.sort(reverse=True)
+        seen = set()
+        rows = [row for row in rows if not (row[1] in seen or seen.add(row[1]))]
+
+    next_cursor = encode_cursor(*rows[page_size - 1]) if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
@@ -0,0 +1,83 @@
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+# Наибольшее значение BigAutoField: id больше этого БД не принимает (OverflowError при запросе)
+MAX_ID = 2 ** 63 - 1
+
+
+def _parse(value, parser, param):
+    try:
+        parsed = parser(value)
+    except ValueError:
+        # Формат верный, но значение невозможно: 2024-02-30
+        parsed = None
+    if parsed is None:
+        raise ValidationError({param: f"Некорректное значение: {value}"})
+    return parsed
+
+
+def _parse_datetime(value):
+    # Допускаем и дату без времени: 2024-05-01 == 2024-05-01T00:00
+    return parse_datetime(value) or parse_datetime(f'{value}T00:00:00')
+
+
+def _parse_id(value):
+    # isdigit() пропускает «²» и другие цифры Юникода, которые int() не разбирает
+    if not (value.isascii() and value.isdecimal()):
+        return None
+    pk = int(value)
+    return pk if pk <= MAX_ID else None
+
+
+class QueryParamFilterBackend(BaseFilterBackend):
+    """
+    Фильтрация по параметрам запроса.
+    filter_params: {параметр: (lookup, функция разбора)}.
+    """
+    filter_params = {}
+
+    def filter_queryset(self, request, queryset, view):
+        # Поддерживаются и DRF Request, и обычный HttpRequest (асинхронные представления)
+        params = getattr(request, 'query_params', request.GET)
+        filters = {}
+        for param, (lookup, parser) in self.filter_params.items():
+            value = params.get(param)
+            if value:
+                filters[lookup] = _parse(value, parser, param)
+        return queryset.filter(**filters) if filters else queryset
+
+
+class AchievementFilterBackend(QueryParamFilterBackend):
+    """
+    ?user=, ?date_achieved_after=, ?date_achieved_before= (индекс user, -date_achieved).
+    """
+    filter_params = {
+        'user': ('user_id', _parse_id),
+        'date_achieved_after': ('date_achieved__gte', parse_date),
+        'date_achieved_before': ('date_achieved__lte', parse_date),
+    }
+
+
+class AchievementImageFilterBackend(QueryParamFilterBackend):
+    """
+    ?achievement=, ?user=, ?uploaded_after=, ?uploaded_before= (индекс achievement, uploaded_at).
+    """
+    filter_params = {
+        'achievement': ('achievement_id', _parse_id),
+        'user': ('achievement__user_id', _parse_id),
+        'uploaded_after': ('uploaded_at__gte', _parse_datetime),
+        'uploaded_before': ('uploaded_at__lte', _parse_datetime),
+    }
+
+
+class UserFilterBackend(QueryParamFilterBackend):
+    """
+    ?role=, ?joined_after=, ?joined_before= (индекс date_joined).
+    """
+    filter_params = {
+        'role': ('role_id', _parse_id),
+        'joined_after': ('date_joined__gte', _parse_datetime),
+        'joined_before': ('date_joined__lte', _parse_datetime),
+    }
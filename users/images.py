@@ -0,0 +1,115 @@
+import hashlib
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# Имя варианта -> максимальная сторона в пикселях (None — исходный размер)
+IMAGE_VARIANTS = {
+    'thumbnail': 200,
+    'medium': 800,
+    'original': None,
+}
+VARIANT_FORMAT = 'WEBP'
+VARIANT_EXTENSION = 'webp'
+VARIANT_QUALITY = 80
+# Формат Pillow -> расширение файла; только эти форматы принимаются как изображения (см. users.media)
+IMAGE_FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp'}
+
+
+def image_extension(file):
+    """
+    Определяет формат по содержимому файла (Image.verify) и возвращает расширение из
+    IMAGE_FORMAT_EXTENSIONS. Если это не изображение допустимого формата — ValueError.
+    """
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            image.verify()
+            image_format = image.format
+    except Exception as exc:
+        raise ValueError("Файл не является изображением") from exc
+    finally:
+        file.seek(0)
+    if image_format not in IMAGE_FORMAT_EXTENSIONS:
+        raise ValueError(f"Формат изображения {image_format} не поддерживается")
+    return IMAGE_FORMAT_EXTENSIONS[image_format]
+
+
+def _encode(image):
+    buffer = BytesIO()
+    # EXIF и прочие метаданные не передаются в save(), поэтому в результат не попадают
+    image.save(buffer, VARIANT_FORMAT, quality=VARIANT_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def _prepare(image):
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    return image
+
+
+def delete_variants(storage, variants):
+    for variant in (variants or {}).values():
+        if variant.get('name'):
+            storage.delete(variant['name'])
+
+
+def build_variants(field_file):
+    """
+    Декодирует загруженное изображение один раз и сохраняет набор уменьшенных копий в WebP без EXIF.
+    Возвращает {вариант: {'name': путь в хранилище, 'width': ..., 'height': ...}}.
+    """
+    storage = field_file.storage
+    directory, filename = os.path.split(field_file.name)
+    stem = os.path.splitext(filename)[0]
+
+    field_file.open('rb')
+    try:
+        with Image.open(field_file) as source:
+            source.load()
+            image = _prepare(source)
+    finally:
+        field_file.close()
+
+    variants = {}
+    for variant, max_side in IMAGE_VARIANTS.items():
+        resized = image.copy()
+        if max_side:
+            resized.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        content = _encode(resized)
+        # Хэш содержимого в имени: URL варианта меняется вместе с файлом, и его можно кэшировать бессрочно
+        digest = hashlib.sha256(content).hexdigest()[:16]
+        name = storage.save(
+            os.path.join(directory, 'variants', f'{stem}_{variant}.{digest}.{VARIANT_EXTENSION}'),
+            ContentFile(content),
+        )
+        variants[variant] = {'name': name, 'width': resized.width, 'height': resized.height}
+    return variants
+
+
+def process_image_field(instance, field_name, variants_field_name):
+    """
+    Пересобирает варианты для поля изображения модели и удаляет варианты предыдущей загрузки.
+    """
+    field_file = getattr(instance, field_name)
+    old_variants = getattr(instance, variants_field_name)
+    delete_variants(field_file.storage, old_variants)
+    variants = build_variants(field_file) if field_file else {}
+    setattr(instance, variants_field_name, variants)
+    type(instance).objects.filter(pk=instance.pk).update(**{variants_field_name: variants})
+    return variants
+
+
+def variants_representation(field_file, variants, request=None):
+    result = {}
+    for variant, data in (variants or {}).items():
+        url = field_file.storage.url(data['name'])
+        result[variant] = {
+            'url': request.build_absolute_uri(url) if request else url,
+            'width': data['width'],
+            'height': data['height'],
+        }
+    return result
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from users.tokens import compact_tokens
+
+
+class Command(BaseCommand):
+    help = "Удаляет истёкшие JWT из таблиц OutstandingToken/BlacklistedToken. Запускается периодически (cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = compact_tokens(options['batch_size'])
+        self.stdout.write(f"Удалено токенов: {deleted}")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.transfer import TransferError, export_data
+
+
+class Command(BaseCommand):
+    help = ("Выгружает роли, пользователей, достижения, изображения и подписки в каталог (JSON Lines + media.tar); "
+            "ленты не выгружаются — импорт строит их заново по подпискам. "
+            "Повторный запуск с тем же каталогом продолжает прерванную выгрузку. "
+            "В выгрузке есть хэши паролей — храните её как секрет.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Каталог выгрузки')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            manifest = export_data(options['path'], options['chunk_size'])
+        except TransferError as e:
+            raise CommandError(str(e))
+        for label, state in manifest['models'].items():
+            self.stdout.write(f"{label}: {state['rows']}")
+        media = manifest['media']
+        self.stdout.write(f"Медиафайлов: {media['files']}, не найдено в хранилище: {media['missing']}")
@@ -0,0 +1,22 @@
+from django.core.files.storage import storages
+from django.core.management.base import BaseCommand, CommandError
+
+from users.storage import ContentAddressedStorage, collect_garbage, import_legacy_files
+
+
+class Command(BaseCommand):
+    help = ("Сверяет счётчики ссылок на медиафайлы с данными и удаляет файлы без ссылок. "
+            "С --import-legacy сначала переносит файлы, загруженные до хранилища по хэшу, в cas/.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-seconds', type=int, default=3600)
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument('--import-legacy', action='store_true')
+
+    def handle(self, *args, **options):
+        if not isinstance(storages['default'], ContentAddressedStorage):
+            raise CommandError("Хранилище по умолчанию должно быть users.storage.ContentAddressedStorage")
+        if options['import_legacy'] and not options['dry_run']:
+            self.stdout.write(f"Перенесено файлов: {import_legacy_files()}")
+        fixed, removed = collect_garbage(options['grace_seconds'], options['dry_run'])
+        self.stdout.write(f"Исправлено счётчиков: {fixed}, удалено файлов: {removed}")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.transfer import TransferError, import_data
+
+
+class Command(BaseCommand):
+    help = ("Загружает выгрузку export_sportsocnet: медиафайлы, затем записи пачками с переназначением "
+            "внешних ключей. Пользователи и роли с существующими username/названием не дублируются; "
+            "повторный запуск пропускает уже загруженные строки.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Каталог выгрузки')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            result = import_data(options['path'], options['batch_size'])
+        except TransferError as e:
+            raise CommandError(str(e))
+        written, skipped = result.pop('media')
+        self.stdout.write(f"Медиафайлов записано: {written}, пропущено: {skipped}")
+        for label, (created, matched, orphaned) in result.items():
+            self.stdout.write(f"{label}: создано {created}, сопоставлено с существующими {matched}, "
+                              f"пропущено без родителя {orphaned}")
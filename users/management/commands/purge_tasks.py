@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from users.taskqueue import purge_finished_tasks
+
+
+class Command(BaseCommand):
+    help = "Удаляет завершённые и упавшие задачи старше TASK_RETENTION_DAYS. Запускается периодически (cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = purge_finished_tasks(options['batch_size'])
+        self.stdout.write(f"Удалено задач: {deleted}")
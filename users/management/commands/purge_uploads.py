@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from users.uploads import purge_expired_uploads
+
+
+class Command(BaseCommand):
+    help = "Удаляет просроченные незавершённые загрузки по частям. Запускается периодически (cron)."
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_uploads()
+        self.stdout.write(f"Удалено загрузок: {deleted}")
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from users.models import User
+from users.stats import rebuild_user_stats
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счётчики достижений пользователей и рейтинг пачками."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id, total = 0, 0
+        while True:
+            user_ids = list(User.objects.filter(pk__gt=last_id).order_by('pk')
+                            .values_list('pk', flat=True)[:batch_size])
+            if not user_ids:
+                break
+            with transaction.atomic():
+                rebuild_user_stats(user_ids)
+            last_id = user_ids[-1]
+            total += len(user_ids)
+        self.stdout.write(f"Пересчитано пользователей: {total}")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from users.models import User, Achievement
+from users.search import index_objects
+
+
+class Command(BaseCommand):
+    help = "Перестраивает поисковый индекс по пользователям и достижениям."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model in (User, Achievement):
+            batch, total = [], 0
+            for obj in model.objects.order_by('pk').iterator(chunk_size=batch_size):
+                batch.append(obj)
+                if len(batch) == batch_size:
+                    index_objects(batch)
+                    total += len(batch)
+                    batch = []
+            index_objects(batch)
+            total += len(batch)
+            self.stdout.write(f"{model._meta.verbose_name_plural}: {total}")
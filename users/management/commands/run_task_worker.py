@@ -0,0 +1,48 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from users.models import Task
+from users.taskqueue import execute, purge_finished_tasks
+
+
+class Command(BaseCommand):
+    help = "Выполняет фоновые задачи из таблицы очереди (в т.ч. оставшиеся после перезапуска процесса)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Обработать текущую очередь и выйти")
+        parser.add_argument('--interval', type=float, default=1.0, help="Пауза между опросами очереди, сек.")
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help="Через сколько секунд задача в статусе running считается зависшей")
+        parser.add_argument('--purge-interval', type=int, default=3600,
+                            help="Как часто удалять старые завершённые задачи, сек.")
+
+    def handle(self, *args, **options):
+        last_purge = None
+        while True:
+            if last_purge is None or time.monotonic() - last_purge >= options['purge_interval']:
+                purge_finished_tasks()
+                last_purge = time.monotonic()
+            self.requeue_stale(options['stale_after'])
+            processed = self.run_batch(options['batch_size'])
+            if options['once'] and not processed:
+                break
+            if not processed:
+                time.sleep(options['interval'])
+
+    def requeue_stale(self, stale_after):
+        # Задачи, чей воркер упал посреди выполнения
+        Task.objects.filter(
+            status=Task.Status.RUNNING, updated_at__lt=timezone.now() - timedelta(seconds=stale_after)
+        ).update(status=Task.Status.PENDING, run_after=timezone.now())
+
+    def run_batch(self, batch_size):
+        task_ids = list(Task.objects.filter(status=Task.Status.PENDING, run_after__lte=timezone.now())
+                        .order_by('run_after').values_list('id', flat=True)[:batch_size])
+        for task_id in task_ids:
+            if execute(task_id):
+                self.stdout.write(f"Задача {task_id} выполнена")
+        return len(task_ids)
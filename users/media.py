@@ -0,0 +1,129 @@
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views import View
+
+# Имя файла с хэшем содержимого (см. users.storage, users.uploads.hashed_filename, users.images.build_variants)
+HASHED_NAME_RE = re.compile(r'(?:^|[._])[0-9a-f]{12,64}\.\w+$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=3600'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+STREAM_BLOCK_SIZE = 64 * 1024
+# Отдаются в браузер как есть; остальные файлы — только вложением, чтобы загруженный HTML/SVG не исполнялся
+INLINE_CONTENT_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp'}
+
+
+def file_etag(stat_result):
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """
+    Разбирает заголовок Range с одним диапазоном. Возвращает (start, end) включительно,
+    None — если заголовок не поддерживается (отдаётся весь файл), False — если диапазон невыполним.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start == '':
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def iter_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(STREAM_BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+class MediaView(View):
+    """
+    Отдача файлов из MEDIA_ROOT: условные запросы (ETag/Last-Modified), Range для докачки
+    и перемотки, бессрочное кэширование файлов с хэшем в имени. При MEDIA_SENDFILE
+    ('x-sendfile' или 'x-accel-redirect') файл отдаёт фронтенд-сервер, а Django — только заголовки.
+    """
+    http_method_names = ['get', 'head']
+
+    def get(self, request, path):
+        if any(part.startswith('.') for part in path.split('/')):
+            raise Http404
+        try:
+            full_path = safe_join(settings.MEDIA_ROOT, path)
+            stat_result = os.stat(full_path)
+        except (OSError, ValueError):
+            raise Http404
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise Http404
+
+        etag = file_etag(stat_result)
+        last_modified = int(stat_result.st_mtime)
+        headers = {
+            'ETag': etag,
+            'Last-Modified': http_date(last_modified),
+            'Cache-Control': (IMMUTABLE_CACHE_CONTROL if HASHED_NAME_RE.search(os.path.basename(path))
+                              else DEFAULT_CACHE_CONTROL),
+            'Accept-Ranges': 'bytes',
+            'X-Content-Type-Options': 'nosniff',
+        }
+        content_type = mimetypes.guess_type(full_path)[0]
+        attachment = content_type not in INLINE_CONTENT_TYPES
+        if attachment:
+            content_type = 'application/octet-stream'
+            headers['Content-Disposition'] = 'attachment'
+        if self.not_modified(request, etag, last_modified):
+            return HttpResponseNotModified(headers=headers)
+
+        sendfile = getattr(settings, 'MEDIA_SENDFILE', None)
+        if sendfile == 'x-sendfile':
+            return HttpResponse(content_type=content_type, headers={**headers, 'X-Sendfile': full_path})
+        if sendfile == 'x-accel-redirect':
+            location = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/') + path
+            return HttpResponse(content_type=content_type, headers={**headers, 'X-Accel-Redirect': location})
+
+        size = stat_result.st_size
+        byte_range = None
+        if 'Range' in request.headers and request.headers.get('If-Range', etag) == etag:
+            byte_range = parse_range(request.headers['Range'], size)
+        if byte_range is False:
+            return HttpResponse(status=416, headers={**headers, 'Content-Range': f'bytes */{size}'})
+
+        status, start, length = 200, 0, size
+        if byte_range:
+            start, end = byte_range
+            status, length = 206, end - start + 1
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        headers['Content-Length'] = str(length)
+        if request.method == 'HEAD':
+            return HttpResponse(status=status, content_type=content_type, headers=headers)
+        if status == 200:
+            return FileResponse(open(full_path, 'rb'), as_attachment=attachment, content_type=content_type,
+                                headers=headers)
+        return StreamingHttpResponse(iter_range(full_path, start, length), status=status,
+                                     content_type=content_type, headers=headers)
+
+    @staticmethod
+    def not_modified(request, etag, last_modified):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return if_modified_since is not None and last_modified <= if_modified_since
@@ -0,0 +1,302 @@
+import cProfile
+import hashlib
+import hmac
+import logging
+import os
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+DEFAULTS = {
+    'SLOW_REQUEST_MS': 500,
+    'SLOW_QUERY_MS': 100,
+    'PROFILE_SAMPLE_RATE': 0.0,
+    'PROFILE_THRESHOLD_MS': 1000,
+    'PROFILE_DIR': None,
+    'ALLOWED_IPS': (),
+    'TOKEN': None,
+}
+
+
+def metrics_settings():
+    return {**DEFAULTS, **getattr(settings, 'PERFORMANCE_METRICS', {})}
+
+
+class Histogram:
+    """
+    Гистограмма в формате Prometheus: накопительные счётчики по верхним границам корзин, сумма и число.
+    """
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = ([0] * (len(self.buckets) + 1), [0.0, 0])
+        counts, total = series
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+        total[1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total) in sorted(self.series.items()):
+            label_text = ','.join(f'{key}="{value}"' for key, value in labels)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total[0]}')
+            lines.append(f'{self.name}_count{{{label_text}}} {total[1]}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.series = {}
+
+    def inc(self, labels, value=1):
+        self.series[labels] = self.series.get(labels, 0) + value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self.series.items()):
+            label_text = ','.join(f'{key}="{value}"' for key, value in labels)
+            lines.append(f'{self.name}{{{label_text}}} {value}')
+        return lines
+
+
+class Registry:
+    """
+    Метрики текущего процесса. При нескольких воркерах каждый процесс отдаёт свои значения,
+    Prometheus собирает их по отдельности (как и для очереди задач и кэша).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.request_duration = Histogram('http_request_duration_seconds', 'Время обработки запроса',
+                                          DURATION_BUCKETS)
+        self.db_queries = Histogram('http_request_db_queries', 'Число SQL-запросов на запрос', QUERY_COUNT_BUCKETS)
+        self.db_duration = Histogram('http_request_db_duration_seconds', 'Время SQL-запросов на запрос',
+                                     DURATION_BUCKETS)
+        self.render_duration = Histogram('http_request_serialization_seconds',
+                                         'Время рендеринга (сериализации) ответа', DURATION_BUCKETS)
+        self.response_size = Histogram('http_response_size_bytes', 'Размер тела ответа', SIZE_BUCKETS)
+        self.slow_queries = Counter('db_slow_queries_total', 'Медленные SQL-запросы')
+        self.slow_requests = Counter('http_slow_requests_total', 'Медленные запросы')
+
+    def record(self, stats):
+        labels = (('view', stats.view), ('method', stats.method), ('status', str(stats.status)))
+        view_labels = (('view', stats.view),)
+        with self.lock:
+            self.request_duration.observe(labels, stats.duration)
+            self.response_size.observe(view_labels, stats.response_size)
+            if stats.render_duration is not None:
+                self.render_duration.observe(view_labels, stats.render_duration)
+            if stats.queries is not None:
+                self.db_queries.observe(view_labels, stats.queries)
+                self.db_duration.observe(view_labels, stats.db_duration)
+            if stats.slow_queries:
+                self.slow_queries.inc(view_labels, stats.slow_queries)
+            if stats.slow:
+                self.slow_requests.inc(view_labels)
+
+    def render(self):
+        with self.lock:
+            lines = []
+            for metric in (self.request_duration, self.db_queries, self.db_duration, self.render_duration,
+                           self.response_size, self.slow_queries, self.slow_requests):
+                lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """
+    Нормализованный SQL без литералов и со свёрнутыми списками IN: одинаковые по форме запросы
+    с разными параметрами получают один отпечаток.
+    """
+    normalized = _SPACE_RE.sub(' ', _IN_LIST_RE.sub('(...)', _LITERAL_RE.sub('?', sql))).strip()
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12], normalized
+
+
+def view_name(view_func, method):
+    """
+    Имя вида «UserViewSet.list»: для ViewSet — действие, для APIView — HTTP-метод.
+    """
+    cls = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if cls is None:
+        return getattr(view_func, '__name__', 'unknown')
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{cls.__name__}.{actions.get(method.lower(), method.lower())}'
+
+
+class RequestStats:
+    def __init__(self, request):
+        self.method = request.method
+        self.path = request.path
+        self.view = 'unresolved'
+        self.status = 0
+        self.duration = 0.0
+        self.queries = None
+        self.db_duration = 0.0
+        self.slow_queries = 0
+        self.render_started = None
+        self.render_duration = None
+        self.response_size = 0
+        self.slow = False
+        self.settings = metrics_settings()
+
+    def __call__(self, execute, sql, params, many, context):
+        # Обёртка выполнения SQL (connection.execute_wrapper)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.db_duration += elapsed
+            if elapsed * 1000 >= self.settings['SLOW_QUERY_MS']:
+                self.slow_queries += 1
+                digest, normalized = fingerprint(sql)
+                logger.warning('Slow query %.1f ms in %s [%s]: %s', elapsed * 1000, self.view, digest, normalized)
+
+    def finish(self, response, duration):
+        self.duration = duration
+        self.status = response.status_code
+        if not response.streaming:
+            self.response_size = len(response.content)
+        elif response.has_header('Content-Length'):
+            self.response_size = int(response['Content-Length'])
+        self.slow = duration * 1000 >= self.settings['SLOW_REQUEST_MS']
+        if self.slow:
+            logger.warning('Slow request %.1f ms: %s %s (%s), %s queries, %.1f ms in DB',
+                           duration * 1000, self.method, self.path, self.view, self.queries,
+                           self.db_duration * 1000)
+        registry.record(self)
+
+
+class PerformanceMetricsMiddleware:
+    """
+    Собирает по каждому запросу время обработки, число и время SQL-запросов, время рендеринга
+    и размер ответа с разбивкой по действию (UserViewSet.list, AchievementViewSet.create, ...).
+    Медленные запросы и SQL пишутся в лог users.metrics; часть запросов (PROFILE_SAMPLE_RATE)
+    выполняется под cProfile, и профиль сохраняется, если запрос дольше PROFILE_THRESHOLD_MS.
+    Должен стоять первым в MIDDLEWARE, чтобы учитывать время остальных middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = request._performance_stats = RequestStats(request)
+        stats.queries = 0
+        profiler = self.start_profiler(stats)
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(stats))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+        self.stop_profiler(profiler, stats, duration)
+        stats.finish(response, duration)
+        return response
+
+    async def __acall__(self, request):
+        # В асинхронном режиме ORM выполняется в отдельном потоке (sync_to_async), поэтому SQL не учитывается
+        stats = request._performance_stats = RequestStats(request)
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        stats.finish(response, time.perf_counter() - start)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._performance_stats.view = view_name(view_func, request.method)
+
+    def process_template_response(self, request, response):
+        # Ответы DRF рендерятся после выхода из представления: время рендеринга — время сериализации в JSON
+        stats = request._performance_stats
+        stats.render_started = time.perf_counter()
+
+        def rendered(response):
+            stats.render_duration = time.perf_counter() - stats.render_started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def start_profiler(stats):
+        if random.random() >= stats.settings['PROFILE_SAMPLE_RATE']:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Уже активен другой профилировщик (например, в соседнем запросе того же потока)
+            return None
+        return profiler
+
+    @staticmethod
+    def stop_profiler(profiler, stats, duration):
+        if profiler is None:
+            return
+        profiler.disable()
+        directory = stats.settings['PROFILE_DIR']
+        if directory and duration * 1000 >= stats.settings['PROFILE_THRESHOLD_MS']:
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'{time.strftime("%Y%m%d-%H%M%S")}-{stats.view}-{os.getpid()}.prof')
+            profiler.dump_stats(path)
+            logger.info('Profile of %s %s (%.1f ms) saved to %s', stats.method, stats.path, duration * 1000, path)
+
+
+def metrics_view(request):
+    """
+    Метрики в текстовом формате Prometheus. Доступны администраторам, по заголовку
+    Authorization: Bearer <TOKEN> и с адресов из ALLOWED_IPS. REMOTE_ADDR за обратным прокси —
+    адрес самого прокси, поэтому там ALLOWED_IPS оставляют пустым и используют TOKEN.
+    """
+    options = metrics_settings()
+    token = options['TOKEN']
+    authorization = request.headers.get('Authorization', '')
+    if not (getattr(request.user, 'is_staff', False)
+            or (token and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode()))
+            or request.META.get('REMOTE_ADDR') in options['ALLOWED_IPS']):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
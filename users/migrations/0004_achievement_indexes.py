@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0003_alter_user_role'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='achievement',
+            index=models.Index(fields=['user', '-date_achieved'], name='achievement_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='achievementimage',
+            index=models.Index(fields=['achievement', 'uploaded_at'], name='achievementimage_ach_upl_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['date_joined'], name='user_date_joined_idx'),
+        ),
+    ]
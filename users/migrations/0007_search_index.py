@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+def create_backend_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE users_search_fts USING fts5(content, tokenize='unicode61 remove_diacritics 2')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute('ALTER TABLE users_searchentry ADD COLUMN search_vector tsvector')
+        schema_editor.execute('CREATE INDEX users_searchentry_vector_idx ON users_searchentry USING GIN (search_vector)')
+        schema_editor.execute(
+            'CREATE INDEX users_searchentry_trgm_idx ON users_searchentry USING GIN (content gin_trgm_ops)'
+        )
+
+
+def drop_backend_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS users_search_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE users_searchentry DROP COLUMN IF EXISTS search_vector')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_task_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('user', 'Пользователь'), ('achievement', 'Достижение')], max_length=20, verbose_name='Тип')),
+                ('object_id', models.BigIntegerField(verbose_name='ID объекта')),
+                ('title', models.CharField(max_length=400, verbose_name='Заголовок')),
+                ('content', models.TextField(verbose_name='Индексируемый текст')),
+            ],
+            options={
+                'verbose_name': 'Запись поискового индекса',
+                'verbose_name_plural': 'Поисковый индекс',
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='searchentry_kind_object_uniq')],
+            },
+        ),
+        migrations.RunPython(create_backend_index, drop_backend_index),
+    ]
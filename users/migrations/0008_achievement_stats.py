@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+from django.db.models.functions import ExtractYear
+
+
+def fill_stats(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Achievement = apps.get_model('users', 'Achievement')
+    AchievementImage = apps.get_model('users', 'AchievementImage')
+    LeaderboardEntry = apps.get_model('users', 'LeaderboardEntry')
+
+    images = dict(AchievementImage.objects.values('achievement__user_id').annotate(count=Count('id'))
+                  .order_by().values_list('achievement__user_id', 'count'))
+    for row in Achievement.objects.values('user_id').annotate(count=Count('id'), latest=Max('date_achieved')).order_by():
+        User.objects.filter(pk=row['user_id']).update(achievement_count=row['count'],
+                                                      latest_achievement_date=row['latest'],
+                                                      achievement_image_count=images.get(row['user_id'], 0))
+        LeaderboardEntry.objects.create(user_id=row['user_id'], year=0, achievement_count=row['count'])
+    per_year = Achievement.objects.filter(date_achieved__isnull=False).annotate(year=ExtractYear('date_achieved'))
+    for row in per_year.values('user_id', 'year').annotate(count=Count('id')).order_by():
+        LeaderboardEntry.objects.create(user_id=row['user_id'], year=row['year'], achievement_count=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='achievement_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число достижений'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='achievement_image_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число изображений достижений'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='latest_achievement_date',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Дата последнего достижения'),
+        ),
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(default=0, verbose_name='Год')),
+                ('achievement_count', models.PositiveIntegerField(default=0, verbose_name='Число достижений')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entries', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Позиция в рейтинге',
+                'verbose_name_plural': 'Рейтинг',
+                'indexes': [models.Index(fields=['year', '-achievement_count', 'user'], name='leaderboard_year_count_idx')],
+                'constraints': [models.UniqueConstraint(fields=('year', 'user'), name='leaderboard_year_user_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
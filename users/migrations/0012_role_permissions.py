@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from users.permissions import ADMIN_ROLE_NAME
+
+# Набор по умолчанию для существующих ролей: просмотр всего, изменение только своего.
+# Роль ADMIN_ROLE_NAME получает доступ ко всем объектам.
+# Копия settings.RBAC_DEFAULT_PERMISSIONS намеренно заморожена на момент миграции: она описывает права,
+# выданные при переходе на RBAC, и не должна меняться вместе с настройкой
+DEFAULT_PERMISSIONS = {
+    'user': {'view': 'all', 'update': 'own', 'delete': 'own'},
+    'achievement': {'view': 'all', 'create': 'own', 'update': 'own', 'delete': 'own'},
+    'achievementimage': {'view': 'all', 'create': 'own', 'update': 'own', 'delete': 'own'},
+}
+
+
+def grant_default_permissions(apps, schema_editor):
+    Role = apps.get_model('users', 'Role')
+    RolePermission = apps.get_model('users', 'RolePermission')
+    permissions = []
+    for role in Role.objects.all():
+        for resource, actions in DEFAULT_PERMISSIONS.items():
+            action_scopes = dict.fromkeys(['view', 'create', 'update', 'delete'], 'all') \
+                if role.name == ADMIN_ROLE_NAME else actions
+            permissions += [RolePermission(role=role, resource=resource, action=action, scope=scope)
+                            for action, scope in action_scopes.items()]
+    RolePermission.objects.bulk_create(permissions)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_media_blobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RolePermission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource', models.CharField(choices=[('user', 'Пользователи'), ('achievement', 'Достижения'), ('achievementimage', 'Изображения достижений')], max_length=30, verbose_name='Ресурс')),
+                ('action', models.CharField(choices=[('view', 'Просмотр'), ('create', 'Создание'), ('update', 'Изменение'), ('delete', 'Удаление')], max_length=20, verbose_name='Действие')),
+                ('scope', models.CharField(choices=[('own', 'Свои объекты'), ('all', 'Все объекты')], default='own', max_length=10, verbose_name='Область')),
+                ('role', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='permissions', to='users.role', verbose_name='Роль')),
+            ],
+            options={
+                'verbose_name': 'Разрешение роли',
+                'verbose_name_plural': 'Разрешения ролей',
+                'constraints': [models.UniqueConstraint(fields=('role', 'resource', 'action'), name='rolepermission_uniq')],
+            },
+        ),
+        migrations.RunPython(grant_default_permissions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0012_role_permissions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportMapping',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.UUIDField(verbose_name='Выгрузка')),
+                ('model', models.CharField(max_length=100, verbose_name='Модель')),
+                ('old_pk', models.BigIntegerField(verbose_name='ID в выгрузке')),
+                ('new_pk', models.BigIntegerField(verbose_name='ID после импорта')),
+            ],
+            options={
+                'verbose_name': 'Соответствие импортированной записи',
+                'verbose_name_plural': 'Соответствия импортированных записей',
+                'constraints': [models.UniqueConstraint(fields=('source', 'model', 'old_pk'), name='importmapping_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations
+
+from users.search import achievement_document, stem_text, user_document
+
+BATCH_SIZE = 1000
+
+
+def create_entries(SearchEntry, connection, entries):
+    entries = SearchEntry.objects.using(connection.alias).bulk_create(entries)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.executemany('INSERT INTO users_search_fts (rowid, content) VALUES (%s, %s)',
+                               [(entry.pk, stem_text(entry.content)) for entry in entries])
+        elif connection.vendor == 'postgresql':
+            cursor.execute("UPDATE users_searchentry SET search_vector = to_tsvector('russian', content) "
+                           "WHERE id = ANY(%s)", [[entry.pk for entry in entries]])
+
+
+def backfill_search_index(apps, schema_editor):
+    # Индекс из 0007 заполняется сигналами только для новых изменений: существующие
+    # пользователи и достижения индексируются здесь (то же делает команда rebuild_search_index)
+    SearchEntry = apps.get_model('users', 'SearchEntry')
+    connection = schema_editor.connection
+    for model_name, kind, document in (('User', 'user', user_document),
+                                       ('Achievement', 'achievement', achievement_document)):
+        model = apps.get_model('users', model_name)
+        indexed = SearchEntry.objects.using(connection.alias).filter(kind=kind).values('object_id')
+        batch = []
+        for obj in (model.objects.using(connection.alias).exclude(pk__in=indexed).order_by('pk')
+                    .iterator(chunk_size=BATCH_SIZE)):
+            title, content = document(obj)
+            batch.append(SearchEntry(kind=kind, object_id=obj.pk, title=title, content=content))
+            if len(batch) == BATCH_SIZE:
+                create_entries(SearchEntry, connection, batch)
+                batch = []
+        if batch:
+            create_entries(SearchEntry, connection, batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_import_mapping'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_index, migrations.RunPython.noop),
+    ]
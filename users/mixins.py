@@ -0,0 +1,68 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework import serializers
+
+
+class StreamingListMixin:
+    """
+    Потоковая выдача списка для массовой выгрузки (?stream=1).
+    Строки читаются из БД пачками через .iterator() и отдаются в формате JSON Lines,
+    поэтому память воркера не зависит от размера таблицы.
+    """
+    stream_query_param = 'stream'
+    stream_chunk_size = 500
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get(self.stream_query_param) in ('1', 'true'):
+            return self.stream_list(request)
+        return super().list(request, *args, **kwargs)
+
+    def stream_list(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        ordering = getattr(self.pagination_class, 'ordering', None)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+
+        def rows():
+            for obj in queryset.iterator(chunk_size=self.stream_chunk_size):
+                data = self.get_serializer(obj).data
+                yield json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+        return StreamingHttpResponse(rows(), content_type='application/x-ndjson')
+
+
+class SparseQuerysetMixin:
+    """
+    Сужает queryset под поля, запрошенные через ?fields= / ?expand= (см. SparseFieldsMixin):
+    .only() по нужным колонкам и select_related() для раскрытых связей.
+    Если поле нельзя сопоставить с колонкой модели, queryset не сужается.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return queryset
+        params = request.query_params
+        if not params.get('fields') and not params.get('expand'):
+            return queryset
+
+        serializer = self.get_serializer()
+        model_fields = {field.name for field in queryset.model._meta.concrete_fields}
+        columns = {queryset.model._meta.pk.name}
+        ordering = getattr(self.pagination_class, 'ordering', None) or ()
+        columns.update(field.lstrip('-') for field in ordering)
+        related = []
+        for name, field in serializer.fields.items():
+            if name in serializer.expandable_fields and isinstance(field, serializers.BaseSerializer):
+                related.append(field.source)
+            sources = serializer.method_field_sources.get(name) or [field.source.split('.')[0]]
+            if not set(sources) <= model_fields:
+                return queryset
+            columns.update(sources)
+
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*columns)
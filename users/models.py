@@ -1,5 +1,15 @@
+import uuid
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+
+
+class ImageStatus(models.TextChoices):
+    NONE = 'none', 'Нет изображения'
+    PROCESSING = 'processing', 'Обрабатывается'
+    READY = 'ready', 'Готово'
+    FAILED = 'failed', 'Ошибка обработки'
 
 
 class Role(models.Model):
@@ -28,16 +38,42 @@ class User(AbstractUser):
                                   verbose_name="Отчество")
     profile_image = models.ImageField(upload_to='profile_images/', blank=True, null=True,
                                       help_text="Изображение профиля", verbose_name="Изображение профиля")
+    profile_image_variants = models.JSONField(default=dict, blank=True, editable=False,
+                                              verbose_name="Варианты изображения профиля")
+    profile_image_status = models.CharField(max_length=20, choices=ImageStatus.choices, default=ImageStatus.NONE,
+                                            editable=False, verbose_name="Статус обработки изображения профиля")
+    # Денормализованная статистика (см. users.stats), поддерживается при изменении достижений
+    achievement_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Число достижений")
+    achievement_image_count = models.PositiveIntegerField(default=0, editable=False,
+                                                          verbose_name="Число изображений достижений")
+    latest_achievement_date = models.DateField(null=True, blank=True, editable=False,
+                                               verbose_name="Дата последнего достижения")
+    follower_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Число подписчиков")
     date_joined = models.DateTimeField(auto_now_add=True, editable=False)
 
     class Meta:
         verbose_name = "Пользователь"
         verbose_name_plural = "Пользователи"
+        indexes = [
+            models.Index(fields=['date_joined'], name='user_date_joined_idx'),
+        ]
 
+    # Меняются только через UPDATE с F() и подзапросами (users.stats, users.feed)
+    STATS_FIELDS = frozenset({'achievement_count', 'achievement_image_count', 'latest_achievement_date',
+                              'follower_count'})
 
     def __str__(self):
         return self.username
 
+    def save(self, *args, **kwargs):
+        # Полное сохранение (сериализатор, админка) не записывает счётчики: значения в памяти могли устареть
+        # и затёрли бы параллельные приращения
+        if not self._state.adding and not args and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.STATS_FIELDS]
+        super().save(*args, **kwargs)
+
 
 class Achievement(models.Model):
     """
@@ -52,14 +88,24 @@ class Achievement(models.Model):
     title = models.CharField(max_length=100, verbose_name="Название достижения")
     description = models.TextField(blank=True, verbose_name="Описание достижения")
     date_achieved = models.DateField(null=True, blank=True, verbose_name="Дата достижения")
+    created_at = models.DateTimeField(default=timezone.now, editable=False, verbose_name="Дата создания")
 
     class Meta:
         verbose_name = "Достижение"
         verbose_name_plural = "Достижения"
+        indexes = [
+            models.Index(fields=['user', '-date_achieved'], name='achievement_user_date_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='achievement_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.user.username})"
 
+    def save(self, *args, **kwargs):
+        # Счётчики пользователя обновляются в post_save — в той же транзакции, что и запись
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class AchievementImage(models.Model):
     """
@@ -72,11 +118,271 @@ class AchievementImage(models.Model):
         verbose_name="Достижение"
     )
     image = models.ImageField(upload_to="achievements/", verbose_name="Изображение")
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Варианты изображения")
+    image_status = models.CharField(max_length=20, choices=ImageStatus.choices, default=ImageStatus.PROCESSING,
+                                    editable=False, verbose_name="Статус обработки изображения")
     uploaded_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата загрузки")
 
     class Meta:
         verbose_name = "Изображение достижения"
         verbose_name_plural = "Изображения достижений"
+        indexes = [
+            models.Index(fields=['achievement', 'uploaded_at'], name='achievementimage_ach_upl_idx'),
+        ]
 
     def __str__(self):
         return f"Изображение для {self.achievement.title}"
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class Task(models.Model):
+    """
+    Фоновая задача в очереди (см. users.taskqueue).
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'В очереди'
+        RUNNING = 'running', 'Выполняется'
+        DONE = 'done', 'Выполнена'
+        FAILED = 'failed', 'Ошибка'
+
+    name = models.CharField(max_length=200, verbose_name="Задача")
+    payload = models.JSONField(default=dict, blank=True, verbose_name="Аргументы")
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING, verbose_name="Статус")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Попыток")
+    max_attempts = models.PositiveIntegerField(default=3, verbose_name="Максимум попыток")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    run_after = models.DateTimeField(default=timezone.now, verbose_name="Выполнить после")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создана")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлена")
+
+    class Meta:
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='task_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} [{self.status}]"
+
+
+class SearchEntry(models.Model):
+    """
+    Запись поискового индекса (см. users.search). Обновляется по сигналам сохранения моделей.
+    """
+    class Kind(models.TextChoices):
+        USER = 'user', 'Пользователь'
+        ACHIEVEMENT = 'achievement', 'Достижение'
+
+    kind = models.CharField(max_length=20, choices=Kind.choices, verbose_name="Тип")
+    object_id = models.BigIntegerField(verbose_name="ID объекта")
+    title = models.CharField(max_length=400, verbose_name="Заголовок")
+    content = models.TextField(verbose_name="Индексируемый текст")
+
+    class Meta:
+        verbose_name = "Запись поискового индекса"
+        verbose_name_plural = "Поисковый индекс"
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='searchentry_kind_object_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.object_id}"
+
+
+class LeaderboardEntry(models.Model):
+    """
+    Материализованный рейтинг: число достижений пользователя за год (year=0 — за всё время).
+    """
+    ALL_TIME = 0
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="leaderboard_entries",
+                             verbose_name="Пользователь")
+    year = models.PositiveSmallIntegerField(default=ALL_TIME, verbose_name="Год")
+    achievement_count = models.PositiveIntegerField(default=0, verbose_name="Число достижений")
+
+    class Meta:
+        verbose_name = "Позиция в рейтинге"
+        verbose_name_plural = "Рейтинг"
+        constraints = [
+            models.UniqueConstraint(fields=['year', 'user'], name='leaderboard_year_user_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['year', '-achievement_count', 'user'], name='leaderboard_year_count_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} ({self.year}): {self.achievement_count}"
+
+
+class Follow(models.Model):
+    """
+    Подписка пользователя follower на спортсмена followee.
+    """
+    follower = models.ForeignKey(User, on_delete=models.CASCADE, related_name="following",
+                                 verbose_name="Подписчик")
+    followee = models.ForeignKey(User, on_delete=models.CASCADE, related_name="followers",
+                                 verbose_name="Спортсмен")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата подписки")
+
+    class Meta:
+        verbose_name = "Подписка"
+        verbose_name_plural = "Подписки"
+        constraints = [
+            models.UniqueConstraint(fields=['follower', 'followee'], name='follow_follower_followee_uniq'),
+            models.CheckConstraint(condition=~models.Q(follower=models.F('followee')), name='follow_not_self'),
+        ]
+        indexes = [
+            models.Index(fields=['followee', 'follower'], name='follow_followee_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.follower_id} -> {self.followee_id}"
+
+
+class FeedItem(models.Model):
+    """
+    Строка ленты: достижение спортсмена, разосланное подписчику при публикации (fan-out-on-write).
+    created_at копируется из достижения, чтобы лента и чтение «на лету» сортировались одинаково.
+    """
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="feed_items", verbose_name="Владелец ленты")
+    achievement = models.ForeignKey(Achievement, on_delete=models.CASCADE, related_name="feed_items",
+                                    verbose_name="Достижение")
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+", verbose_name="Автор")
+    created_at = models.DateTimeField(verbose_name="Дата публикации")
+
+    class Meta:
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Ленты"
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'achievement'], name='feeditem_owner_achievement_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-achievement'], name='feeditem_owner_created_idx'),
+            models.Index(fields=['owner', 'author'], name='feeditem_owner_author_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner_id}: {self.achievement_id}"
+
+
+class UploadSession(models.Model):
+    """
+    Возобновляемая загрузка изображения достижения по частям (см. users.uploads).
+    Части хранятся во временном каталоге до сборки; в БД — только параметры загрузки.
+    """
+    class Status(models.TextChoices):
+        ACTIVE = 'active', 'Загружается'
+        COMPLETED = 'completed', 'Завершена'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="upload_sessions",
+                             verbose_name="Пользователь")
+    achievement = models.ForeignKey(Achievement, on_delete=models.CASCADE, related_name="upload_sessions",
+                                    verbose_name="Достижение")
+    filename = models.CharField(max_length=255, verbose_name="Имя файла")
+    size = models.PositiveBigIntegerField(verbose_name="Размер файла")
+    chunk_size = models.PositiveIntegerField(verbose_name="Размер части")
+    checksum = models.CharField(max_length=64, verbose_name="SHA-256 файла")
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.ACTIVE, verbose_name="Статус")
+    image = models.ForeignKey(AchievementImage, on_delete=models.SET_NULL, null=True, blank=True, related_name="+",
+                              verbose_name="Изображение")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создана")
+    expires_at = models.DateTimeField(verbose_name="Истекает")
+
+    class Meta:
+        verbose_name = "Загрузка по частям"
+        verbose_name_plural = "Загрузки по частям"
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='upload_status_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} ({self.status})"
+
+    @property
+    def parts_total(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    def part_size(self, number):
+        if number == self.parts_total - 1:
+            return self.size - self.chunk_size * number
+        return self.chunk_size
+
+
+class MediaBlob(models.Model):
+    """
+    Файл в контентно-адресуемом хранилище (см. users.storage) и число ссылок на него из записей.
+    Файл удаляется, когда ссылок не остаётся.
+    """
+    name = models.CharField(max_length=255, unique=True, verbose_name="Путь в хранилище")
+    size = models.PositiveBigIntegerField(verbose_name="Размер")
+    ref_count = models.PositiveIntegerField(default=0, verbose_name="Число ссылок")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создан")
+
+    class Meta:
+        verbose_name = "Медиафайл"
+        verbose_name_plural = "Медиафайлы"
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
+
+
+class RolePermission(models.Model):
+    """
+    Разрешение роли: действие над ресурсом в пределах своих объектов (own) или всех (all).
+    Компилируется в кэш прав в памяти (см. users.permissions).
+    """
+    class Resource(models.TextChoices):
+        USER = 'user', 'Пользователи'
+        ACHIEVEMENT = 'achievement', 'Достижения'
+        ACHIEVEMENT_IMAGE = 'achievementimage', 'Изображения достижений'
+
+    class Action(models.TextChoices):
+        VIEW = 'view', 'Просмотр'
+        CREATE = 'create', 'Создание'
+        UPDATE = 'update', 'Изменение'
+        DELETE = 'delete', 'Удаление'
+
+    class Scope(models.TextChoices):
+        OWN = 'own', 'Свои объекты'
+        ALL = 'all', 'Все объекты'
+
+    role = models.ForeignKey(Role, on_delete=models.CASCADE, related_name="permissions", verbose_name="Роль")
+    resource = models.CharField(max_length=30, choices=Resource.choices, verbose_name="Ресурс")
+    action = models.CharField(max_length=20, choices=Action.choices, verbose_name="Действие")
+    scope = models.CharField(max_length=10, choices=Scope.choices, default=Scope.OWN, verbose_name="Область")
+
+    class Meta:
+        verbose_name = "Разрешение роли"
+        verbose_name_plural = "Разрешения ролей"
+        constraints = [
+            models.UniqueConstraint(fields=['role', 'resource', 'action'], name='rolepermission_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.role_id}: {self.action} {self.resource} ({self.scope})"
+
+
+class ImportMapping(models.Model):
+    """
+    Соответствие id записи в выгрузке и id, под которым она создана при импорте (см. users.transfer).
+    По нему переназначаются внешние ключи и пропускаются уже импортированные строки при повторном запуске.
+    """
+    source = models.UUIDField(verbose_name="Выгрузка")
+    model = models.CharField(max_length=100, verbose_name="Модель")
+    old_pk = models.BigIntegerField(verbose_name="ID в выгрузке")
+    new_pk = models.BigIntegerField(verbose_name="ID после импорта")
+
+    class Meta:
+        verbose_name = "Соответствие импортированной записи"
+        verbose_name_plural = "Соответствия импортированных записей"
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'model', 'old_pk'], name='importmapping_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.model}:{self.old_pk} -> {self.new_pk}"
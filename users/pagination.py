@@ -0,0 +1,27 @@
+from rest_framework.pagination import CursorPagination
+
+
+class BaseCursorPagination(CursorPagination):
+    """
+    Курсорная (keyset) пагинация со стабильной сортировкой.
+    Стоимость страницы не зависит от её глубины: вместо OFFSET используется условие по ключу сортировки.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class RoleCursorPagination(BaseCursorPagination):
+    ordering = ('id',)
+
+
+class UserCursorPagination(BaseCursorPagination):
+    ordering = ('-date_joined', '-id')
+
+
+class AchievementCursorPagination(BaseCursorPagination):
+    ordering = ('-id',)
+
+
+class AchievementImageCursorPagination(BaseCursorPagination):
+    ordering = ('-uploaded_at', '-id')
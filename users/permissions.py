@@ -0,0 +1,260 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.permissions import BasePermission, SAFE_METHODS
+
+from .filters import MAX_ID
+from .models import Role, RolePermission, User, Achievement
+
+Action = RolePermission.Action
+Scope = RolePermission.Scope
+
+# Ресурс -> (путь к владельцу для фильтра queryset, поле тела запроса, указывающее владельца)
+RESOURCES = {
+    RolePermission.Resource.USER: ('pk', None),
+    RolePermission.Resource.ACHIEVEMENT: ('user', 'user'),
+    RolePermission.Resource.ACHIEVEMENT_IMAGE: ('achievement__user', 'achievement'),
+}
+
+METHOD_ACTIONS = {
+    'GET': Action.VIEW, 'HEAD': Action.VIEW, 'OPTIONS': Action.VIEW,
+    'POST': Action.CREATE, 'PUT': Action.UPDATE, 'PATCH': Action.UPDATE, 'DELETE': Action.DELETE,
+}
+# Действия представлений, для которых владелец проверяется по телу запроса
+DATA_CHECKED_ACTIONS = ('create', 'update', 'partial_update', 'bulk')
+
+
+# Роль, которая при создании получает область all на все действия (и в миграции 0012 — тоже)
+ADMIN_ROLE_NAME = 'Администратор'
+
+
+def default_permissions():
+    """
+    Права пользователей без роли и набор, который получают новые роли: {ресурс: {действие: область}}.
+    """
+    return getattr(settings, 'RBAC_DEFAULT_PERMISSIONS', {})
+
+
+class PermissionCache:
+    """
+    Скомпилированные права всех ролей: {role_id: {(ресурс, действие): область}}.
+    Загружаются одним запросом, сбрасываются при изменении Role/RolePermission в этом процессе
+    и не живут дольше RBAC_CACHE_TTL — за это время подхватываются изменения из других процессов.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.permissions = None
+        self.loaded_at = 0.0
+
+    def get(self, role_id):
+        permissions = self.permissions
+        if permissions is None or time.monotonic() - self.loaded_at > getattr(settings, 'RBAC_CACHE_TTL', 30):
+            with self.lock:
+                permissions = self.permissions = self.load()
+                self.loaded_at = time.monotonic()
+        return permissions.get(role_id, {})
+
+    @staticmethod
+    def load():
+        permissions = {}
+        for role_id, resource, action, scope in RolePermission.objects.values_list('role_id', 'resource', 'action',
+                                                                                   'scope'):
+            permissions.setdefault(role_id, {})[resource, action] = scope
+        return permissions
+
+    def invalidate(self):
+        self.permissions = None
+
+
+permission_cache = PermissionCache()
+
+
+def grant_default_permissions(roles):
+    """
+    Выдаёт ролям набор RBAC_DEFAULT_PERMISSIONS, роли ADMIN_ROLE_NAME — область all на все действия.
+    Нужен для ролей, созданных через bulk_create, минуя сигнал post_save.
+    """
+    permissions = []
+    for role in roles:
+        for resource, actions in default_permissions().items():
+            if role.name == ADMIN_ROLE_NAME:
+                actions = dict.fromkeys(Action.values, Scope.ALL)
+            permissions += [RolePermission(role=role, resource=resource, action=action, scope=scope)
+                            for action, scope in actions.items()]
+    RolePermission.objects.bulk_create(permissions)
+    permission_cache.invalidate()
+
+
+@receiver(post_save, sender=Role)
+def grant_defaults_to_new_role(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        grant_default_permissions([instance])
+    permission_cache.invalidate()
+
+
+@receiver(post_delete, sender=Role)
+@receiver(post_save, sender=RolePermission)
+@receiver(post_delete, sender=RolePermission)
+def invalidate_permissions(sender, **kwargs):
+    permission_cache.invalidate()
+
+
+def get_scope(user, resource, action):
+    """
+    Область действия пользователя над ресурсом: Scope.ALL, Scope.OWN или None (запрещено).
+    """
+    if not user or not user.is_authenticated:
+        return None
+    if user.is_superuser:
+        return Scope.ALL
+    if user.role_id is None:
+        return default_permissions().get(resource, {}).get(action)
+    return permission_cache.get(user.role_id).get((resource, action))
+
+
+def scope_queryset(user, resource, queryset, action=Action.VIEW):
+    """
+    Права роли для выборок вне HasRolePermission (поиск, лента, вложенные объекты, async-представления):
+    all — queryset без изменений, own — только объекты пользователя, нет права — пустой queryset.
+    """
+    scope = get_scope(user, resource, action)
+    if scope == Scope.ALL:
+        return queryset
+    if scope == Scope.OWN:
+        return queryset.filter(**{RESOURCES[resource][0]: user.pk})
+    return queryset.none()
+
+
+def request_action(request, view):
+    action = getattr(view, 'permission_actions', {}).get(getattr(view, 'action', None))
+    return action or METHOD_ACTIONS.get(request.method, Action.VIEW)
+
+
+def owner_values(data, field):
+    if isinstance(data, list):
+        values = [item.get(field) for item in data if isinstance(item, dict)]
+    elif hasattr(data, 'getlist'):
+        values = data.getlist(field)
+    elif isinstance(data, dict):
+        values = [data.get(field)]
+    else:
+        values = []
+    return [value for value in values if value not in (None, '')]
+
+
+def parse_owner_ids(values):
+    """
+    Разбирает id так же, как их примет сериализатор (PrimaryKeyRelatedField -> int()): « 2» и «+2» — это 2.
+    Возвращает None, если хотя бы одно значение не разбирается или не помещается в BigAutoField:
+    такой запрос отклоняется, а не пропускается.
+    """
+    ids = set()
+    for value in values:
+        if isinstance(value, bool):
+            return None
+        try:
+            pk = int(str(value).strip())
+        except ValueError:
+            return None
+        if abs(pk) > MAX_ID:
+            return None
+        ids.add(pk)
+    return ids
+
+
+def data_owned_by(user, resource, data):
+    """
+    Проверяет, что тело запроса не назначает владельцем объекта другого пользователя.
+    Несуществующие id пропускаются — их отклонит сериализатор.
+    """
+    field = RESOURCES[resource][1]
+    if field is None:
+        return True
+    ids = parse_owner_ids(owner_values(data, field))
+    if ids is None:
+        return False
+    if resource == RolePermission.Resource.ACHIEVEMENT_IMAGE:
+        return not Achievement.objects.filter(pk__in=ids).exclude(user_id=user.pk).exists() if ids else True
+    others = ids - {user.pk}
+    # Запрос нужен, только если в теле упомянут кто-то кроме самого пользователя
+    return not others or not User.objects.filter(pk__in=others).exists()
+
+
+class HasRolePermission(BasePermission):
+    """
+    Проверка прав роли для представлений с permission_resource. Ограничение «только свои объекты»
+    для чтения, изменения и удаления применяется одним условием в queryset (RoleScopedQuerysetMixin),
+    а для создания и изменения дополнительно проверяется владелец, указанный в теле запроса.
+    Поля permission_protected_fields (например, роль) с областью own менять нельзя.
+    """
+
+    def has_permission(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return False
+        resource = getattr(view, 'permission_resource', None)
+        if resource is None:
+            return True
+        action = request_action(request, view)
+        scope = get_scope(request.user, resource, action)
+        if scope is None:
+            return False
+        if (scope == Scope.OWN and action in (Action.CREATE, Action.UPDATE)
+                and getattr(view, 'action', None) in DATA_CHECKED_ACTIONS):
+            if action == Action.CREATE and RESOURCES[resource][1] is None:
+                return False
+            if hasattr(request.data, 'keys') and set(getattr(view, 'permission_protected_fields', ())) & set(
+                    request.data.keys()):
+                return False
+            return data_owned_by(request.user, resource, request.data)
+        return True
+
+
+class HasFullViewPermission(BasePermission):
+    """
+    Для представлений с агрегатами по всем пользователям (рейтинг), которые нельзя сузить до своих
+    объектов: нужна область all на просмотр каждого ресурса из permission_resources.
+    """
+
+    def has_permission(self, request, view):
+        return all(get_scope(request.user, resource, Action.VIEW) == Scope.ALL
+                   for resource in view.permission_resources)
+
+
+class IsAdminOrReadOnly(BasePermission):
+    """
+    Чтение — любому аутентифицированному пользователю, изменение — только персоналу:
+    роли и их права определяют доступ ко всему остальному.
+    """
+
+    def has_permission(self, request, view):
+        user = request.user
+        if not user or not user.is_authenticated:
+            return False
+        return request.method in SAFE_METHODS or user.is_staff
+
+
+class RoleScopedQuerysetMixin:
+    """
+    Для области own сужает queryset до объектов пользователя: одно условие WHERE для списка,
+    деталей, изменения и удаления вместо проверки каждого объекта.
+    """
+    permission_resource = None
+
+    def scope(self):
+        return get_scope(self.request.user, self.permission_resource, request_action(self.request, self))
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        request = getattr(self, 'request', None)
+        if request is None or self.permission_resource is None or self.scope() != Scope.OWN:
+            return queryset
+        return queryset.filter(**{RESOURCES[self.permission_resource][0]: request.user.pk})
+
+    def cache_key_extra(self, request):
+        # Ответы пользователей с областью own различаются, поэтому кэшируются раздельно
+        scope = self.scope()
+        return (scope, request.user.pk) if scope == Scope.OWN else (scope,)
@@ -0,0 +1,50 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+try:
+    import orjson
+except ImportError:  # orjson — необязательная зависимость
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack — необязательная зависимость
+    msgpack = None
+
+
+def _default(obj):
+    # Типы, которые не умеют сериализовать orjson/msgpack (Decimal, ленивые строки, UUID в msgpack и т.п.)
+    return DjangoJSONEncoder().default(obj)
+
+
+class FastJSONRenderer(BaseRenderer):
+    """
+    Компактный JSON через orjson (?format=fast-json). Без orjson — стандартный json.
+    """
+    media_type = 'application/json'
+    format = 'fast-json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is not None:
+            return orjson.dumps(data, default=_default)
+        return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    MessagePack (Accept: application/msgpack или ?format=msgpack). Доступен при установленном msgpack.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_default, use_bin_type=True)
@@ -0,0 +1,158 @@
+import re
+
+from django.db import connection, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import User, Achievement, SearchEntry
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Окончания существительных и прилагательных от длинных к коротким (упрощённый стеммер Snowball).
+# Глагольные окончания (-ат, -ит, -ла...) не отсекаются: они совпадают с концом основ существительных
+RUSSIAN_ENDINGS = sorted({
+    'иями', 'ями', 'ами', 'иях', 'ях', 'ах', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ией',
+    'ий', 'ый', 'ой', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ую', 'юю', 'ых', 'их', 'ым', 'им', 'ом', 'ем',
+    'ей', 'ою', 'ею', 'ов', 'ев', 'ам', 'ям', 'ия', 'ье', 'ья', 'ться', 'ть',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+}, key=len, reverse=True)
+MIN_STEM_LENGTH = 3
+
+
+def stem(word):
+    """
+    Приводит слово к основе: нижний регистр, ё -> е, для кириллицы — отсечение окончания.
+    """
+    word = word.lower().replace('ё', 'е')
+    if not re.search('[а-я]', word):
+        return word
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def stem_text(text):
+    return ' '.join(stem(word) for word in WORD_RE.findall(text or ''))
+
+
+def user_document(user):
+    title = ' '.join(filter(None, [user.last_name, user.first_name, user.patronymic])) or user.username
+    return title, ' '.join(filter(None, [user.username, user.last_name, user.first_name, user.patronymic,
+                                         user.bio]))
+
+
+def achievement_document(achievement):
+    return achievement.title, ' '.join(filter(None, [achievement.title, achievement.description]))
+
+
+DOCUMENTS = {
+    'users.user': (SearchEntry.Kind.USER, user_document),
+    'users.achievement': (SearchEntry.Kind.ACHIEVEMENT, achievement_document),
+}
+
+
+def _sync_backend_index(entries):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.executemany('DELETE FROM users_search_fts WHERE rowid = %s', [(entry.pk,) for entry in entries])
+            cursor.executemany('INSERT INTO users_search_fts (rowid, content) VALUES (%s, %s)',
+                               [(entry.pk, stem_text(entry.content)) for entry in entries])
+    elif connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE users_searchentry SET search_vector = to_tsvector('russian', content) "
+                           "WHERE id = ANY(%s)", [[entry.pk for entry in entries]])
+
+
+def index_objects(objects):
+    """
+    Добавляет или обновляет записи индекса для пользователей и достижений.
+    """
+    objects = list(objects)
+    if not objects:
+        return
+    kind, document = DOCUMENTS[objects[0]._meta.label_lower]
+    with transaction.atomic():
+        existing = {entry.object_id: entry for entry in
+                    SearchEntry.objects.filter(kind=kind, object_id__in=[obj.pk for obj in objects])}
+        changed, created = [], []
+        for obj in objects:
+            title, content = document(obj)
+            entry = existing.get(obj.pk)
+            if entry is None:
+                created.append(SearchEntry(kind=kind, object_id=obj.pk, title=title, content=content))
+            elif (entry.title, entry.content) != (title, content):
+                entry.title, entry.content = title, content
+                changed.append(entry)
+        if changed:
+            SearchEntry.objects.bulk_update(changed, ['title', 'content'])
+        created = SearchEntry.objects.bulk_create(created)
+        _sync_backend_index(changed + created)
+
+
+def remove_objects(model, pks):
+    kind = DOCUMENTS[model._meta.label_lower][0]
+    with transaction.atomic():
+        entries = SearchEntry.objects.filter(kind=kind, object_id__in=pks)
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.executemany('DELETE FROM users_search_fts WHERE rowid = %s',
+                                   [(pk,) for pk in entries.values_list('pk', flat=True)])
+        entries.delete()
+
+
+def _fts_query(query):
+    # Каждое слово — префиксный поиск по основе, все слова обязательны
+    terms = [stem(word) for word in WORD_RE.findall(query)]
+    return ' AND '.join('"%s"*' % term.replace('"', '') for term in terms if term)
+
+
+def search(query, kind=None, limit=20):
+    """
+    Возвращает [(SearchEntry, rank)] по убыванию релевантности.
+    SQLite — FTS5 с bm25, PostgreSQL — tsvector ('russian') плюс триграммное сходство для опечаток.
+    """
+    if connection.vendor == 'sqlite':
+        fts_query = _fts_query(query)
+        if not fts_query:
+            return []
+        sql = ('SELECT e.id, -bm25(users_search_fts) AS rank FROM users_search_fts '
+               'JOIN users_searchentry e ON e.id = users_search_fts.rowid '
+               'WHERE users_search_fts MATCH %s' + (' AND e.kind = %s' if kind else '') +
+               ' ORDER BY bm25(users_search_fts) LIMIT %s')
+        params = [fts_query] + ([kind] if kind else []) + [limit]
+    elif connection.vendor == 'postgresql':
+        sql = ("SELECT id, ts_rank(search_vector, websearch_to_tsquery('russian', %s)) "
+               "+ similarity(content, %s) AS rank FROM users_searchentry "
+               "WHERE (search_vector @@ websearch_to_tsquery('russian', %s) OR content %% %s)"
+               + (' AND kind = %s' if kind else '') + ' ORDER BY rank DESC LIMIT %s')
+        params = [query, query, query, query] + ([kind] if kind else []) + [limit]
+    else:
+        entries = SearchEntry.objects.filter(content__icontains=query)
+        if kind:
+            entries = entries.filter(kind=kind)
+        return [(entry, 0.0) for entry in entries[:limit]]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        ranks = dict(cursor.fetchall())
+    entries = SearchEntry.objects.in_bulk(list(ranks))
+    return [(entries[pk], rank) for pk, rank in ranks.items() if pk in entries]
+
+
+INDEXED_USER_FIELDS = {'username', 'last_name', 'first_name', 'patronymic', 'bio'}
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Achievement)
+def index_on_save(sender, instance, update_fields=None, **kwargs):
+    # Например, обновление last_login при входе не затрагивает индексируемые поля
+    if sender is User and update_fields and not INDEXED_USER_FIELDS & set(update_fields):
+        return
+    index_objects([instance])
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Achievement)
+def remove_on_delete(sender, instance, **kwargs):
+    remove_objects(sender, [instance.pk])
@@ -1,27 +1,167 @@
 from rest_framework import serializers
-from .models import User, Role, Achievement, AchievementImage
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer as BaseTokenRefreshSerializer
 
+from .images import variants_representation
+from .models import User, Role, Achievement, AchievementImage, LeaderboardEntry, UploadSession
+from .tokens import RefreshToken
+from .uploads import received_parts
 
-class RoleSerializer(serializers.ModelSerializer):
+
+def query_param_set(request, name):
+    params = getattr(request, 'query_params', request.GET)
+    return {value.strip() for value in params.get(name, '').split(',') if value.strip()}
+
+
+class SparseFieldsMixin:
+    """
+    Выбор полей ответа параметрами запроса (только для чтения):
+    ?fields=id,username — вернуть только перечисленные поля,
+    ?expand=role — заменить id связанного объекта вложенным представлением (см. expandable_fields).
+    Методные поля описываются в method_field_sources: какие поля модели им нужны (для .only()).
+    """
+    expandable_fields = {}
+    method_field_sources = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return
+        for name in query_param_set(request, 'expand') & set(self.expandable_fields):
+            self.fields[name] = self.expandable_fields[name](read_only=True)
+        requested = query_param_set(request, 'fields')
+        if requested:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+
+class RoleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Role
         fields = '__all__'
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    profile_image_variants = serializers.SerializerMethodField()
+    expandable_fields = {'role': RoleSerializer}
+    method_field_sources = {'profile_image_variants': ['profile_image', 'profile_image_variants']}
+
     class Meta:
         model = User
-        fields = ['id', 'username', 'role', 'date_of_birth', 'bio', 'profile_image', 'last_name', 'first_name',
-                  'patronymic']
+        fields = ['id', 'username', 'role', 'date_of_birth', 'bio', 'profile_image', 'profile_image_variants',
+                  'profile_image_status', 'last_name', 'first_name', 'patronymic', 'achievement_count',
+                  'achievement_image_count', 'latest_achievement_date']
+        read_only_fields = ['profile_image_status', 'achievement_count', 'achievement_image_count',
+                            'latest_achievement_date']
+
+    def get_profile_image_variants(self, obj):
+        return variants_representation(obj.profile_image, obj.profile_image_variants, self.context.get('request'))
 
 
-class AchievementSerializer(serializers.ModelSerializer):
+class AchievementSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {'user': UserSerializer}
+
     class Meta:
         model = Achievement
         fields = '__all__'
 
 
-class AchievementImageSerializer(serializers.ModelSerializer):
+class AchievementImageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
+    expandable_fields = {'achievement': AchievementSerializer}
+    method_field_sources = {'image_variants': ['image', 'image_variants']}
+
     class Meta:
         model = AchievementImage
         fields = '__all__'
+
+    def get_image_variants(self, obj):
+        return variants_representation(obj.image, obj.image_variants, self.context.get('request'))
+
+
+class AchievementWithImagesSerializer(serializers.ModelSerializer):
+    images = AchievementImageSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Achievement
+        fields = ['id', 'title', 'description', 'date_achieved', 'images']
+
+
+class UserProfileSerializer(UserSerializer):
+    """
+    Профиль пользователя вместе с ролью, достижениями и их изображениями.
+    Рассчитан на queryset с select_related('role') и prefetch_related('achievements__images').
+    """
+    role = RoleSerializer(read_only=True)
+    achievements = AchievementWithImagesSerializer(many=True, read_only=True)
+
+    class Meta(UserSerializer.Meta):
+        fields = UserSerializer.Meta.fields + ['achievements']
+
+
+class TokenRefreshSerializer(BaseTokenRefreshSerializer):
+    token_class = RefreshToken
+
+
+class AchievementBulkListSerializer(serializers.ListSerializer):
+    """
+    Пакетная запись достижений: пользователи проверяются одним запросом,
+    запись — одним bulk_create/bulk_update.
+    """
+
+    def validate(self, attrs):
+        user_ids = {item['user_id'] for item in attrs if 'user_id' in item}
+        existing = set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        errors = {str(index): {'user': [f'Пользователь {item["user_id"]} не найден.']}
+                  for index, item in enumerate(attrs) if 'user_id' in item and item['user_id'] not in existing}
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+    def create(self, validated_data):
+        return Achievement.objects.bulk_create([Achievement(**item) for item in validated_data])
+
+    def update(self, instances, validated_data):
+        fields = set()
+        for instance, item in zip(instances, validated_data):
+            for attr, value in item.items():
+                setattr(instance, attr, value)
+            fields.update(item)
+        if fields:
+            Achievement.objects.bulk_update(instances, fields)
+        return instances
+
+
+class AchievementBulkSerializer(serializers.ModelSerializer):
+    # Существование пользователей проверяется пачкой в AchievementBulkListSerializer.validate
+    user = serializers.IntegerField(source='user_id')
+
+    class Meta:
+        model = Achievement
+        fields = ['id', 'user', 'title', 'description', 'date_achieved']
+        list_serializer_class = AchievementBulkListSerializer
+
+
+class LeaderboardEntrySerializer(serializers.ModelSerializer):
+    user = UserSerializer(read_only=True)
+
+    class Meta:
+        model = LeaderboardEntry
+        fields = ['year', 'achievement_count', 'user']
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    checksum = serializers.RegexField(r'^[0-9a-fA-F]{64}$', help_text="SHA-256 всего файла (hex)")
+    size = serializers.IntegerField(min_value=1)
+    chunk_size = serializers.IntegerField(min_value=1024, max_value=64 * 1024 * 1024, required=False)
+    parts_total = serializers.IntegerField(read_only=True)
+    received_parts = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'achievement', 'filename', 'size', 'chunk_size', 'checksum', 'status', 'image',
+                  'parts_total', 'received_parts', 'expires_at']
+        read_only_fields = ['status', 'image', 'expires_at']
+
+    def get_received_parts(self, obj):
+        return received_parts(obj)
@@ -0,0 +1,144 @@
+from django.db.models import Count, F, Max, Subquery
+from django.db.models.functions import ExtractYear
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import invalidate
+from .models import User, Achievement, AchievementImage, LeaderboardEntry
+
+# Денормализованная статистика пользователей и рейтинг.
+# Обновления выполняются сигналами внутри транзакции сохранения/удаления (см. Achievement.save),
+# команда rebuild_achievement_stats пересчитывает всё с нуля.
+
+
+def _latest_date(user_id):
+    # Использует индекс achievement_user_date_idx (user, -date_achieved)
+    return Subquery(Achievement.objects.filter(user_id=user_id, date_achieved__isnull=False)
+                    .order_by('-date_achieved').values('date_achieved')[:1])
+
+
+def _years(date_achieved):
+    # Значение может быть строкой, если объект создан как Achievement(date_achieved='2024-05-01')
+    date_achieved = Achievement._meta.get_field('date_achieved').to_python(date_achieved)
+    return [LeaderboardEntry.ALL_TIME] + ([date_achieved.year] if date_achieved else [])
+
+
+def _adjust_leaderboard(user_id, years, delta):
+    for year in years:
+        updated = LeaderboardEntry.objects.filter(user_id=user_id, year=year).update(
+            achievement_count=F('achievement_count') + delta)
+        if not updated and delta > 0:
+            LeaderboardEntry.objects.create(user_id=user_id, year=year, achievement_count=delta)
+    if delta < 0:
+        LeaderboardEntry.objects.filter(user_id=user_id, year__in=years, achievement_count=0).delete()
+
+
+def _adjust_user(user_id, **updates):
+    User.objects.filter(pk=user_id).update(**updates)
+    invalidate(User, user_id)
+
+
+def _add_achievement(user_id, date_achieved, delta):
+    _adjust_user(user_id, achievement_count=F('achievement_count') + delta,
+                 latest_achievement_date=_latest_date(user_id))
+    _adjust_leaderboard(user_id, _years(date_achieved), delta)
+
+
+def _add_images(user_id, delta):
+    if user_id is not None and delta:
+        _adjust_user(user_id, achievement_image_count=F('achievement_image_count') + delta)
+
+
+@receiver(pre_save, sender=Achievement)
+def remember_previous_achievement(sender, instance, **kwargs):
+    instance._previous_stats = None
+    if not instance._state.adding:
+        instance._previous_stats = Achievement.objects.filter(pk=instance.pk).values_list(
+            'user_id', 'date_achieved').first()
+
+
+@receiver(post_save, sender=Achievement)
+def achievement_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_stats', None)
+    if created or previous is None:
+        _add_achievement(instance.user_id, instance.date_achieved, 1)
+        return
+
+    old_user_id, old_date = previous
+    if old_user_id != instance.user_id:
+        _add_achievement(old_user_id, old_date, -1)
+        _add_achievement(instance.user_id, instance.date_achieved, 1)
+        images = AchievementImage.objects.filter(achievement_id=instance.pk).count()
+        _add_images(old_user_id, -images)
+        _add_images(instance.user_id, images)
+    elif old_date != instance.date_achieved:
+        _adjust_user(instance.user_id, latest_achievement_date=_latest_date(instance.user_id))
+        old_years, new_years = set(_years(old_date)), set(_years(instance.date_achieved))
+        _adjust_leaderboard(instance.user_id, new_years - old_years, 1)
+        _adjust_leaderboard(instance.user_id, old_years - new_years, -1)
+
+
+@receiver(post_delete, sender=Achievement)
+def achievement_deleted(sender, instance, **kwargs):
+    _add_achievement(instance.user_id, instance.date_achieved, -1)
+
+
+def _image_owner(achievement_id):
+    return Achievement.objects.filter(pk=achievement_id).values_list('user_id', flat=True).first()
+
+
+@receiver(pre_save, sender=AchievementImage)
+def remember_previous_image(sender, instance, **kwargs):
+    instance._previous_achievement_id = None
+    if not instance._state.adding:
+        instance._previous_achievement_id = AchievementImage.objects.filter(pk=instance.pk).values_list(
+            'achievement_id', flat=True).first()
+
+
+@receiver(post_save, sender=AchievementImage)
+def achievement_image_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_achievement_id', None)
+    if created:
+        _add_images(_image_owner(instance.achievement_id), 1)
+    elif previous is not None and previous != instance.achievement_id:
+        old_owner, new_owner = _image_owner(previous), _image_owner(instance.achievement_id)
+        if old_owner != new_owner:
+            _add_images(old_owner, -1)
+            _add_images(new_owner, 1)
+
+
+@receiver(post_delete, sender=AchievementImage)
+def achievement_image_deleted(sender, instance, **kwargs):
+    # При каскадном удалении достижения изображения удаляются раньше него, владелец ещё доступен
+    _add_images(_image_owner(instance.achievement_id), -1)
+
+
+def rebuild_user_stats(user_ids):
+    """
+    Пересчитывает счётчики и строки рейтинга для указанных пользователей (по одному запросу на вид агрегата).
+    """
+    user_ids = list(user_ids)
+    achievements = Achievement.objects.filter(user_id__in=user_ids)
+    counts = {row['user_id']: row for row in achievements.values('user_id').annotate(
+        count=Count('id'), latest=Max('date_achieved')).order_by()}
+    images = dict(AchievementImage.objects.filter(achievement__user_id__in=user_ids).values(
+        'achievement__user_id').annotate(count=Count('id')).order_by().values_list('achievement__user_id', 'count'))
+    per_year = achievements.filter(date_achieved__isnull=False).annotate(year=ExtractYear('date_achieved')).values(
+        'user_id', 'year').annotate(count=Count('id')).order_by()
+
+    users = list(User.objects.filter(pk__in=user_ids).only('pk'))
+    for user in users:
+        row = counts.get(user.pk, {})
+        user.achievement_count = row.get('count', 0)
+        user.latest_achievement_date = row.get('latest')
+        user.achievement_image_count = images.get(user.pk, 0)
+    User.objects.bulk_update(users, ['achievement_count', 'latest_achievement_date', 'achievement_image_count'])
+
+    LeaderboardEntry.objects.filter(user_id__in=user_ids).delete()
+    entries = [LeaderboardEntry(user_id=user_id, year=LeaderboardEntry.ALL_TIME, achievement_count=row['count'])
+               for user_id, row in counts.items()]
+    entries += [LeaderboardEntry(user_id=row['user_id'], year=row['year'], achievement_count=row['count'])
+                for row in per_year]
+    LeaderboardEntry.objects.bulk_create(entries)
+    for user in users:
+        invalidate(User, user.pk)
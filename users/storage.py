@@ -0,0 +1,257 @@
+import hashlib
+import os
+import tempfile
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .images import image_extension
+from .models import User, AchievementImage, MediaBlob
+
+CAS_PREFIX = 'cas'
+TMP_DIR = f'{CAS_PREFIX}/.tmp'
+
+# Модель -> (поле файла, поле вариантов)
+FILE_FIELDS = {
+    User: ('profile_image', 'profile_image_variants'),
+    AchievementImage: ('image', 'image_variants'),
+}
+
+
+def content_name(digest, extension):
+    return f'{CAS_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def is_content_addressed(name):
+    return bool(name) and name.startswith(f'{CAS_PREFIX}/')
+
+
+def _retain(name, size):
+    if MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1):
+        return
+    try:
+        with transaction.atomic():
+            MediaBlob.objects.create(name=name, size=size, ref_count=1)
+    except IntegrityError:
+        MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище, в котором имя файла — SHA-256 содержимого (cas/ab/cd/<sha256>.<ext>), а каталог
+    из upload_to не учитывается: одинаковые изображения профиля и достижений хранятся одной копией.
+    Каждое сохранение добавляет ссылку (MediaBlob.ref_count), каждое delete() — снимает;
+    файл удаляется после фиксации транзакции, в которой ссылок не осталось.
+    Содержимое по имени никогда не меняется, поэтому такие файлы кэшируются бессрочно (см. users.media).
+    Расширение определяется форматом изображения, а не присланным именем; не-изображения не сохраняются.
+    """
+
+    def _save(self, name, content):
+        tmp_dir = self.path(TMP_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        # Хэш считается при записи во временный файл — содержимое читается один раз
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            with open(tmp_path, 'rb') as f:
+                extension = image_extension(f)
+            name = content_name(digest.hexdigest(), extension)
+            # Ссылка учитывается до проверки наличия файла: параллельная сборка мусора либо увидит её,
+            # либо успеет удалить файл, и тогда он будет записан заново
+            _retain(name, size)
+            full_path = self.path(name)
+            if not os.path.exists(full_path):
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(tmp_path, self.file_permissions_mode)
+                os.replace(tmp_path, full_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return name
+
+    def delete(self, name):
+        if not name:
+            return
+        if is_content_addressed(name):
+            MediaBlob.objects.filter(name=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+        transaction.on_commit(lambda: self.collect(name))
+
+    def collect(self, name):
+        """
+        Удаляет файл, если на него не осталось ссылок. Файлы вне cas/ (загруженные до перехода
+        на это хранилище) принадлежат одной записи и удаляются сразу. Возвращает True, если файл удалён.
+        """
+        if not is_content_addressed(name):
+            super().delete(name)
+            return True
+        with transaction.atomic():
+            deleted, _ = MediaBlob.objects.filter(name=name, ref_count=0).delete()
+            if deleted:
+                super().delete(name)
+        return bool(deleted)
+
+    def collect_orphan(self, name):
+        """
+        Удаляет файл cas/, для которого нет записи MediaBlob (например, транзакция с _retain
+        откатилась после записи файла). Возвращает True, если файл удалён.
+        """
+        with transaction.atomic():
+            if MediaBlob.objects.filter(name=name).exists():
+                return False
+            super().delete(name)
+        return True
+
+
+def file_names(instance, field_name, variants_field_name):
+    names = [variant['name'] for variant in (getattr(instance, variants_field_name) or {}).values()
+             if variant.get('name')]
+    value = instance.__dict__.get(field_name)
+    name = getattr(value, 'name', value)
+    return ([name] if name else []) + names
+
+
+@receiver(post_init, sender=User)
+@receiver(post_init, sender=AchievementImage)
+def remember_file_name(sender, instance, **kwargs):
+    # Запоминается имя файла, загруженное из БД (строка, а не File), без лишнего запроса:
+    # при замене файла прежний освобождается в post_save
+    value = instance.__dict__.get(FILE_FIELDS[sender][0])
+    instance._stored_file_name = value if isinstance(value, str) else None
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=AchievementImage)
+def release_replaced_file(sender, instance, **kwargs):
+    field_name = FILE_FIELDS[sender][0]
+    current = getattr(instance, field_name).name
+    previous = getattr(instance, '_stored_file_name', None)
+    if previous and previous != current:
+        # Варианты прежнего файла удаляет пересборка вариантов (users.images.process_image_field)
+        getattr(instance, field_name).storage.delete(previous)
+    instance._stored_file_name = current
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=AchievementImage)
+def release_deleted_files(sender, instance, **kwargs):
+    field_name, variants_field_name = FILE_FIELDS[sender]
+    storage = getattr(instance, field_name).storage
+    for name in file_names(instance, field_name, variants_field_name):
+        storage.delete(name)
+
+
+def referenced_names():
+    """
+    Число ссылок на каждый файл по данным моделей.
+    """
+    counts = Counter()
+    for model, (field_name, variants_field_name) in FILE_FIELDS.items():
+        for name, variants in model.objects.values_list(field_name, variants_field_name).iterator():
+            if name:
+                counts[name] += 1
+            for variant in (variants or {}).values():
+                if variant.get('name'):
+                    counts[variant['name']] += 1
+    return counts
+
+
+def retain_names(counts, storage=default_storage):
+    """
+    Учитывает ссылки на файлы cas/, записанные в обход save() (импорт выгрузки): {имя: число ссылок}.
+    """
+    for name, count in counts.items():
+        if not is_content_addressed(name) or not count:
+            continue
+        if MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') + count):
+            continue
+        try:
+            with transaction.atomic():
+                MediaBlob.objects.create(name=name, size=storage.size(name), ref_count=count)
+        except IntegrityError:
+            MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') + count)
+
+
+def collect_garbage(grace_seconds=3600, dry_run=False, storage=default_storage):
+    """
+    Сверяет счётчики ссылок с данными моделей и удаляет файлы cas/, на которые никто не ссылается.
+    Файлы моложе grace_seconds не трогаются: запись, ссылающаяся на них, может быть ещё не зафиксирована.
+    Возвращает (исправлено счётчиков, удалено файлов).
+    """
+    counts = {name: count for name, count in referenced_names().items() if is_content_addressed(name)}
+    fixed = 0
+    settled = timezone.now() - timedelta(seconds=grace_seconds)
+    for blob in MediaBlob.objects.filter(created_at__lt=settled).iterator():
+        if blob.ref_count != counts.get(blob.name, 0):
+            fixed += 1
+            if not dry_run:
+                MediaBlob.objects.filter(pk=blob.pk).update(ref_count=counts.get(blob.name, 0))
+    known = set(MediaBlob.objects.values_list('name', flat=True))
+    missing = [MediaBlob(name=name, size=storage.size(name), ref_count=count)
+               for name, count in counts.items() if name not in known and storage.exists(name)]
+    fixed += len(missing)
+    if not dry_run:
+        MediaBlob.objects.bulk_create(missing, ignore_conflicts=True)
+
+    removed = 0
+    root = storage.path(CAS_PREFIX)
+    deadline = time.time() - grace_seconds
+    for directory, subdirectories, filenames in os.walk(root):
+        subdirectories[:] = [d for d in subdirectories if not d.startswith('.')]
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+            if counts.get(name) or os.path.getmtime(path) > deadline:
+                continue
+            if dry_run:
+                removed += 1
+            elif MediaBlob.objects.filter(name=name).update(ref_count=0):
+                removed += storage.collect(name)
+            else:
+                removed += storage.collect_orphan(name)
+    return fixed, removed
+
+
+def import_legacy_files(storage=default_storage):
+    """
+    Переносит файлы, сохранённые до перехода на хранилище по хэшу, в cas/ и обновляет ссылки в моделях.
+    Возвращает число перенесённых файлов.
+    """
+    moved = 0
+    for model, (field_name, variants_field_name) in FILE_FIELDS.items():
+        for pk, name, variants in model.objects.values_list('pk', field_name, variants_field_name).iterator():
+            updates = {}
+            if name and not is_content_addressed(name) and storage.exists(name):
+                with storage.open(name) as f:
+                    updates[field_name] = storage.save(name, f)
+                moved += 1
+            new_variants = dict(variants or {})
+            for variant, data in new_variants.items():
+                if data.get('name') and not is_content_addressed(data['name']) and storage.exists(data['name']):
+                    with storage.open(data['name']) as f:
+                        new_variants[variant] = {**data, 'name': storage.save(data['name'], f)}
+                    moved += 1
+            if new_variants != (variants or {}):
+                updates[variants_field_name] = new_variants
+            if updates:
+                with transaction.atomic():
+                    model.objects.filter(pk=pk).update(**updates)
+                old_names = [name] if field_name in updates else []
+                old_names += [data['name'] for variant, data in (variants or {}).items()
+                              if new_variants[variant]['name'] != data['name']]
+                for old_name in old_names:
+                    storage.delete(old_name)
+    return moved
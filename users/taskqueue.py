@@ -0,0 +1,188 @@
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Sum
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+_metrics = Counter()
+_metrics_lock = threading.Lock()
+
+
+def task(name=None, max_attempts=3):
+    """
+    Регистрирует функцию как фоновую задачу. Аргументы задачи должны сериализоваться в JSON.
+    """
+    def decorator(func):
+        task_name = name or f'{func.__module__}.{func.__name__}'
+        func.task_name = task_name
+        func.max_attempts = max_attempts
+        func.delay = lambda **kwargs: enqueue(task_name, **kwargs)
+        _registry[task_name] = func
+        return func
+    return decorator
+
+
+def _incr(key, value=1):
+    with _metrics_lock:
+        _metrics[key] += value
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(2 ** attempts, 300))
+
+
+def execute(task_id):
+    """
+    Забирает задачу из очереди и выполняет её. Возвращает True, если задача выполнена успешно.
+    Захват атомарный (UPDATE ... WHERE status='pending'), поэтому задачу не выполнят два воркера сразу.
+    """
+    from .models import Task
+
+    claimed = Task.objects.filter(pk=task_id, status=Task.Status.PENDING).update(
+        status=Task.Status.RUNNING, attempts=F('attempts') + 1, updated_at=timezone.now())
+    if not claimed:
+        return False
+
+    job = Task.objects.get(pk=task_id)
+    func = _registry.get(job.name)
+    try:
+        if func is None:
+            raise LookupError(f'Неизвестная задача: {job.name}')
+        func(**job.payload)
+    except Exception as e:
+        logger.exception('Task %s (%s) failed on attempt %s', job.pk, job.name, job.attempts)
+        job.last_error = repr(e)
+        if func is not None and job.attempts < job.max_attempts:
+            job.status = Task.Status.PENDING
+            job.run_after = timezone.now() + retry_delay(job.attempts)
+            _incr('retried')
+        else:
+            job.status = Task.Status.FAILED
+            _incr('failed')
+        job.save(update_fields=['status', 'run_after', 'last_error', 'updated_at'])
+        return False
+
+    job.status = Task.Status.DONE
+    job.last_error = ''
+    job.save(update_fields=['status', 'last_error', 'updated_at'])
+    _incr('succeeded')
+    return True
+
+
+class BaseTaskBackend:
+    def submit(self, job):
+        raise NotImplementedError
+
+
+class ImmediateBackend(BaseTaskBackend):
+    """
+    Выполняет задачу сразу в текущем потоке. Используется в тестах и для отладки.
+    """
+    def submit(self, job):
+        execute(job.pk)
+
+
+class ThreadPoolBackend(BaseTaskBackend):
+    """
+    Выполняет задачи в пуле потоков внутри процесса, без внешнего брокера.
+    Строка Task сохраняется до отправки в пул, поэтому после перезапуска процесса
+    невыполненные задачи подберёт команда run_task_worker.
+    """
+    def __init__(self, workers=2):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='task-worker')
+
+    def submit(self, job):
+        transaction.on_commit(lambda: self.executor.submit(self._run, job.pk))
+
+    def _run(self, task_id):
+        from .models import Task
+
+        try:
+            execute(task_id)
+            job = Task.objects.filter(pk=task_id, status=Task.Status.PENDING).only('run_after').first()
+            if job is not None:
+                delay = max((job.run_after - timezone.now()).total_seconds(), 0)
+                threading.Timer(delay, self.executor.submit, (self._run, task_id)).start()
+        finally:
+            close_old_connections()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = dict(getattr(settings, 'TASK_QUEUE', {}))
+                backend_class = import_string(config.pop('BACKEND', 'users.taskqueue.ThreadPoolBackend'))
+                _backend = backend_class(**{key.lower(): value for key, value in config.items()})
+    return _backend
+
+
+@receiver(setting_changed)
+def reset_backend(*, setting=None, **kwargs):
+    global _backend
+    if setting in (None, 'TASK_QUEUE'):
+        _backend = None
+
+
+def enqueue(name, **kwargs):
+    from .models import Task
+
+    func = _registry[name]
+    job = Task.objects.create(name=name, payload=kwargs, max_attempts=func.max_attempts)
+    _incr('enqueued')
+    get_backend().submit(job)
+    return job
+
+
+def queue_metrics():
+    """
+    Глубина очереди по статусам, число повторов и счётчики текущего процесса.
+    """
+    from .models import Task
+
+    by_status = dict(Task.objects.values_list('status').annotate(count=Count('id')).order_by())
+    retries = Task.objects.filter(attempts__gt=1).aggregate(total=Sum(F('attempts') - 1))['total'] or 0
+    with _metrics_lock:
+        process = dict(_metrics)
+    return {
+        'depth': by_status.get(Task.Status.PENDING, 0),
+        'by_status': {status: by_status.get(status, 0) for status in Task.Status.values},
+        'retries': retries,
+        'process': process,
+    }
+
+
+def purge_finished_tasks(batch_size=1000):
+    """
+    Удаляет выполненные и окончательно упавшие задачи старше срока хранения TASK_RETENTION_DAYS
+    ({'done': дни, 'failed': дни}). Удаление пачками, чтобы не держать долгую блокировку таблицы.
+    Возвращает число удалённых строк.
+    """
+    from .models import Task
+
+    retention = getattr(settings, 'TASK_RETENTION_DAYS', {})
+    deleted = 0
+    for status in (Task.Status.DONE, Task.Status.FAILED):
+        days = retention.get(status)
+        if days is None:
+            continue
+        expired = Task.objects.filter(status=status, updated_at__lt=timezone.now() - timedelta(days=days))
+        while ids := list(expired.values_list('id', flat=True)[:batch_size]):
+            deleted += Task.objects.filter(pk__in=ids).delete()[0]
+    return deleted
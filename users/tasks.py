@@ -0,0 +1,45 @@
+from django.apps import apps
+from PIL import UnidentifiedImageError
+
+from .cache import invalidate
+from .images import process_image_field
+from .models import ImageStatus
+from .taskqueue import task
+
+# Модель -> (поле изображения, поле вариантов, поле статуса)
+IMAGE_FIELDS = {
+    'users.user': ('profile_image', 'profile_image_variants', 'profile_image_status'),
+    'users.achievementimage': ('image', 'image_variants', 'image_status'),
+}
+
+
+@task(name='users.process_image', max_attempts=3)
+def process_image(model, pk):
+    """
+    Строит варианты изображения и переводит запись в статус ready.
+    Нечитаемый файл повторно не обрабатывается: статус сразу становится failed.
+    """
+    model_class = apps.get_model(model)
+    field_name, variants_field_name, status_field_name = IMAGE_FIELDS[model]
+    instance = model_class.objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    try:
+        process_image_field(instance, field_name, variants_field_name)
+        status = ImageStatus.READY if getattr(instance, field_name) else ImageStatus.NONE
+    except (UnidentifiedImageError, OSError):
+        status = ImageStatus.FAILED
+    model_class.objects.filter(pk=pk).update(**{status_field_name: status})
+    invalidate(model_class, pk)
+
+
+def schedule_image_processing(instance):
+    """
+    Помечает изображение как обрабатываемое и ставит задачу в очередь.
+    """
+    model = instance._meta.label_lower
+    status_field_name = IMAGE_FIELDS[model][2]
+    setattr(instance, status_field_name, ImageStatus.PROCESSING)
+    type(instance).objects.filter(pk=instance.pk).update(**{status_field_name: ImageStatus.PROCESSING})
+    invalidate(type(instance), instance.pk)
+    process_image.delay(model=model, pk=instance.pk)
@@ -1,3 +1,1227 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework.test import APITestCase
+
+from .authentication import user_cache
+from .db_router import PIN_COOKIE, PIN_HEADER, ReplicaRouter, ReplicaRoutingMiddleware
+from .feed import follow
+from .metrics import fingerprint, registry
+from .stats import rebuild_user_stats
+from .storage import collect_garbage
+from .throttling import CacheSlidingWindowStore, MemoryBucketStore
+from .models import (Role, User, Achievement, AchievementImage, Task, LeaderboardEntry, FeedItem, MediaBlob,
+                     RolePermission, SearchEntry, UploadSession, Follow)
+from .permissions import ADMIN_ROLE_NAME, permission_cache
+from .taskqueue import task, queue_metrics
+from .tokens import RefreshToken, blacklist_index, compact_tokens
+from . import transfer
+
+
+class UserProfileQueryCountTests(APITestCase):
+    def setUp(self):
+        self.role = Role.objects.create(name='Спортсмен')
+        self.user = User.objects.create_user('athlete', password='password', role=self.role)
+        self.client.force_authenticate(self.user)
+        # Права роли загружаются одним запросом при первом обращении; в замеры он попадать не должен
+        permission_cache.get(self.role.pk)
+
+    def add_achievements(self, user, count, images_per_achievement):
+        for i in range(count):
+            achievement = Achievement.objects.create(user=user, title=f'Достижение {i}')
+            for j in range(images_per_achievement):
+                AchievementImage.objects.create(achievement=achievement, image=f'achievements/{i}_{j}.jpg')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_query_count_does_not_grow_with_achievements(self):
+        self.add_achievements(self.user, 1, 1)
+        baseline, _ = self.count_queries('/api/v1/profiles/')
+
+        self.add_achievements(self.user, 10, 3)
+        other = User.objects.create_user('other', password='password', role=self.role)
+        self.add_achievements(other, 5, 2)
+        queries, response = self.count_queries('/api/v1/profiles/')
+
+        self.assertEqual(queries, baseline)
+        results = {item['username']: item for item in response.json()['results']}
+        self.assertEqual(len(results['athlete']['achievements']), 11)
+        self.assertEqual(len(results['other']['achievements'][0]['images']), 2)
+        self.assertEqual(results['athlete']['role']['name'], 'Спортсмен')
+
+    def test_retrieve_query_count_is_fixed(self):
+        self.add_achievements(self.user, 1, 1)
+        baseline, _ = self.count_queries(f'/api/v1/profiles/{self.user.pk}/')
+        self.add_achievements(self.user, 20, 4)
+        queries, _ = self.count_queries(f'/api/v1/profiles/{self.user.pk}/')
+        self.assertEqual(queries, baseline)
+
+
+class CursorPaginationTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('athlete', password='password')
+        Achievement.objects.bulk_create([Achievement(user=self.user, title=f'Старт {i}') for i in range(5)])
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_stable_across_inserts(self):
+        first = self.client.get('/api/v1/achievements/', {'page_size': 2}).json()
+        # Новые записи попадают в начало списка и не сдвигают уже выданные страницы
+        Achievement.objects.create(user=self.user, title='Новый старт')
+        ids = [item['id'] for item in first['results']]
+        url = first['next']
+        while url:
+            page = self.client.get(url).json()
+            ids += [item['id'] for item in page['results']]
+            url = page['next']
+        expected = list(Achievement.objects.exclude(title='Новый старт').order_by('-id').values_list('pk', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_stream_returns_ndjson(self):
+        response = self.client.get('/api/v1/achievements/', {'stream': '1'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row['id'] for row in rows],
+                         list(Achievement.objects.order_by('-id').values_list('pk', flat=True)))
+        self.assertEqual(rows[0]['title'], 'Старт 4')
+
+
+class AchievementFilterTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('athlete', password='password')
+        self.other = User.objects.create_user('other', password='password')
+        Achievement.objects.create(user=self.user, title='Весна', date_achieved='2024-04-01')
+        Achievement.objects.create(user=self.user, title='Осень', date_achieved='2024-10-01')
+        Achievement.objects.create(user=self.other, title='Лето', date_achieved='2024-07-01')
+        self.client.force_authenticate(self.user)
+
+    def titles(self, query):
+        response = self.client.get(f'/api/v1/achievements/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return {item['title'] for item in response.json()['results']}
+
+    def test_filter_by_user_and_date_range(self):
+        self.assertEqual(self.titles(f'user={self.user.pk}'), {'Весна', 'Осень'})
+        self.assertEqual(self.titles('date_achieved_after=2024-06-01'), {'Осень', 'Лето'})
+        self.assertEqual(self.titles(f'user={self.user.pk}&date_achieved_before=2024-06-01'), {'Весна'})
+
+    def test_invalid_date_returns_400(self):
+        response = self.client.get('/api/v1/achievements/?date_achieved_after=вчера')
+        self.assertEqual(response.status_code, 400)
+
+    def test_impossible_values_return_400(self):
+        for query in ('date_achieved_after=2024-02-30', 'user=²', 'user=-1', 'user=99999999999999999999'):
+            response = self.client.get(f'/api/v1/achievements/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+        for url in ('/api/v1/achievement-images/?achievement=', '/api/v1/users/?role='):
+            self.assertEqual(self.client.get(f'{url}99999999999999999999').status_code, 400, url)
+        response = self.client.delete('/api/v1/achievements/bulk/', {'ids': [10 ** 20]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+def make_jpeg(name='photo.jpg', size=(1600, 1200)):
+    buffer = BytesIO()
+    exif = Image.Exif()
+    exif[0x010F] = 'Camera'
+    Image.new('RGB', size, 'red').save(buffer, 'JPEG', exif=exif)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class ImageVariantsTests(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root,
+                                              TASK_QUEUE={'BACKEND': 'users.taskqueue.ImmediateBackend'})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user('athlete', password='password')
+        self.achievement = Achievement.objects.create(user=self.user, title='Кубок')
+        self.client.force_authenticate(self.user)
+
+    def test_upload_builds_variants_without_exif(self):
+        response = self.client.post('/api/v1/achievement-images/',
+                                    {'achievement': self.achievement.pk, 'image': make_jpeg()}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['image_status'], 'processing')
+
+        response = self.client.get(f"/api/v1/achievement-images/{response.json()['id']}/")
+        self.assertEqual(response.json()['image_status'], 'ready')
+        variants = response.json()['image_variants']
+        self.assertEqual(set(variants), {'thumbnail', 'medium', 'original'})
+        self.assertEqual((variants['thumbnail']['width'], variants['thumbnail']['height']), (200, 150))
+        self.assertEqual(variants['original']['width'], 1600)
+
+        image = AchievementImage.objects.get()
+        with image.image.storage.open(image.image_variants['medium']['name']) as f, Image.open(f) as variant:
+            self.assertEqual(variant.format, 'WEBP')
+            self.assertEqual(len(variant.getexif()), 0)
+
+
+@override_settings(TASK_QUEUE={'BACKEND': 'users.taskqueue.ImmediateBackend'})
+class TaskQueueTests(APITestCase):
+    def test_failed_task_is_retried_then_marked_failed(self):
+        calls = []
+
+        @task(name='tests.flaky', max_attempts=2)
+        def flaky():
+            calls.append(1)
+            raise RuntimeError('boom')
+
+        with self.assertLogs('users.taskqueue', 'ERROR'):
+            job = flaky.delay()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Task.Status.PENDING, 1))
+
+        Task.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        with self.assertLogs('users.taskqueue', 'ERROR'):
+            call_command('run_task_worker', '--once', stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Task.Status.FAILED, 2))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(queue_metrics()['by_status'][Task.Status.FAILED], 1)
+
+    @override_settings(TASK_RETENTION_DAYS={'done': 7, 'failed': 30})
+    def test_purge_removes_only_expired_finished_tasks(self):
+        now = timezone.now()
+        rows = [(Task.Status.DONE, 8), (Task.Status.DONE, 1), (Task.Status.FAILED, 8), (Task.Status.FAILED, 31),
+                (Task.Status.PENDING, 100)]
+        for status, days in rows:
+            job = Task.objects.create(name='tests.old', status=status)
+            Task.objects.filter(pk=job.pk).update(updated_at=now - timedelta(days=days))
+        out = StringIO()
+        call_command('purge_tasks', '--batch-size', '1', stdout=out)
+        self.assertIn('Удалено задач: 2', out.getvalue())
+        remaining = sorted(Task.objects.values_list('status', flat=True))
+        self.assertEqual(remaining, sorted([Task.Status.DONE, Task.Status.FAILED, Task.Status.PENDING]))
+
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('athlete', password='password')
+        self.client.force_authenticate(self.user)
+
+    def test_etag_and_invalidation_on_save(self):
+        url = f'/api/v1/users/{self.user.pk}/'
+        first = self.client.get(url)
+        etag = first['ETag']
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+
+        self.user.bio = 'Мастер спорта'
+        self.user.save()
+        fresh = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual(fresh.json()['bio'], 'Мастер спорта')
+        self.assertNotEqual(fresh['ETag'], etag)
+
+    def test_expanded_relation_invalidates_cached_response(self):
+        achievement = Achievement.objects.create(user=self.user, title='Кубок')
+        url = f'/api/v1/achievements/{achievement.pk}/?expand=user'
+        self.assertEqual(self.client.get(url).json()['user']['username'], 'athlete')
+        self.user.username = 'champion'
+        self.user.save()
+        self.assertEqual(self.client.get(url).json()['user']['username'], 'champion')
+        self.assertEqual(self.client.get('/api/v1/achievements/?expand=user').json()['results'][0]['user']['username'],
+                         'champion')
+
+    def test_list_invalidated_on_delete(self):
+        Achievement.objects.create(user=self.user, title='Кубок')
+        self.assertEqual(len(self.client.get('/api/v1/achievements/').json()['results']), 1)
+        Achievement.objects.get().delete()
+        self.assertEqual(self.client.get('/api/v1/achievements/').json()['results'], [])
+
+
+class TokenBlacklistIndexTests(APITestCase):
+    def setUp(self):
+        blacklist_index.reset()
+        self.addCleanup(blacklist_index.reset)
+        self.user = User.objects.create_user('athlete', password='password')
+
+    def test_rotated_refresh_token_is_rejected_without_blacklist_query(self):
+        tokens = self.client.post('/api/v1/token/', {'username': 'athlete', 'password': 'password'}).json()
+        response = self.client.post('/api/v1/token/refresh/', {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, 200)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/v1/token/refresh/', {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse([q for q in ctx.captured_queries if 'blacklistedtoken' in q['sql']])
+
+    def test_sync_picks_up_other_workers_and_late_commits(self):
+        blacklist_index.sync(force=True)
+        # Другой процесс: строка без post_save в этом процессе, зафиксирована позже, чем была создана
+        foreign = RefreshToken.for_user(self.user)
+        outstanding = OutstandingToken.objects.get(jti=foreign['jti'])
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=outstanding)])
+        BlacklistedToken.objects.filter(token=outstanding).update(blacklisted_at=timezone.now() - timedelta(seconds=30))
+        # Собственный отзыв с большим id не должен сдвигать точку догрузки
+        own = RefreshToken.for_user(self.user)
+        own.blacklist()
+        self.assertTrue(blacklist_index.contains(own['jti']))
+
+        blacklist_index.sync(force=True)
+        self.assertTrue(blacklist_index.contains(foreign['jti']))
+
+    def test_full_sync_drops_deleted_rows(self):
+        token = RefreshToken.for_user(self.user)
+        token.blacklist()
+        self.assertTrue(blacklist_index.contains(token['jti']))
+        BlacklistedToken.objects.all().delete()
+        blacklist_index.sync(force=True)
+        self.assertTrue(blacklist_index.contains(token['jti']))
+        with override_settings(JWT_BLACKLIST_FULL_SYNC_INTERVAL=0):
+            blacklist_index.sync(force=True)
+        self.assertFalse(blacklist_index.contains(token['jti']))
+        self.assertEqual(len(blacklist_index), 0)
+
+    def test_compact_tokens_removes_expired(self):
+        token = RefreshToken.for_user(self.user)
+        token.blacklist()
+        OutstandingToken.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        blacklist_index.reset()
+
+        self.assertEqual(compact_tokens(), 1)
+        self.assertFalse(BlacklistedToken.objects.exists())
+        self.assertFalse(blacklist_index.contains(token['jti']))
+
+
+class CachedJWTAuthenticationTests(APITestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.user = User.objects.create_user('athlete', password='password')
+        access = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_authentication_uses_cache_until_user_changes(self):
+        url = f'/api/v1/users/{self.user.pk}/'
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+
+@override_settings(TASK_QUEUE={'BACKEND': 'users.taskqueue.ImmediateBackend'})
+class BulkEndpointTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('athlete', password='password')
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_create_update_delete_achievements(self):
+        def create(count):
+            payload = [{'user': self.user.pk, 'title': f'Старт {i}'} for i in range(count)]
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post('/api/v1/achievements/bulk/', payload, format='json')
+            self.assertEqual(response.status_code, 201)
+            return len(ctx.captured_queries), [item['id'] for item in response.json()]
+
+        small, _ = create(5)
+        large, ids = create(50)
+        self.assertEqual(small, large)
+        self.assertEqual(Achievement.objects.count(), 55)
+        self.assertEqual(User.objects.get().achievement_count, 55)
+
+        response = self.client.patch('/api/v1/achievements/bulk/',
+                                     [{'id': pk, 'date_achieved': '2024-05-01'} for pk in ids[:10]], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Achievement.objects.filter(date_achieved='2024-05-01').count(), 10)
+
+        response = self.client.delete('/api/v1/achievements/bulk/', {'ids': ids[:5] + [10 ** 9]}, format='json')
+        self.assertEqual(response.json()['missing'], [10 ** 9])
+        self.assertEqual(Achievement.objects.count(), 50)
+
+    def test_bulk_update_rejects_boolean_and_oversized_ids(self):
+        achievement = Achievement.objects.create(user=self.user, title='Кубок')
+        for pk in (True, 10 ** 20, str(achievement.pk)):
+            response = self.client.patch('/api/v1/achievements/bulk/', [{'id': pk, 'title': 'Взлом'}], format='json')
+            self.assertEqual(response.status_code, 400, pk)
+        self.assertEqual(Achievement.objects.get().title, 'Кубок')
+
+    def test_bulk_create_reports_per_item_errors_and_writes_nothing(self):
+        payload = [{'user': self.user.pk, 'title': 'Кубок'}, {'user': 10 ** 9, 'title': 'Кубок'}, {'user': self.user.pk}]
+        response = self.client.post('/api/v1/achievements/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'2'})
+        self.assertIn('title', response.json()['errors']['2'])
+        self.assertFalse(Achievement.objects.exists())
+
+        payload[2]['title'] = 'Кубок'
+        response = self.client.post('/api/v1/achievements/bulk/', payload, format='json')
+        self.assertEqual(set(response.json()['errors']), {'1'})
+        self.assertFalse(Achievement.objects.exists())
+
+    def test_bulk_image_upload(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        achievement = Achievement.objects.create(user=self.user, title='Кубок')
+        with override_settings(MEDIA_ROOT=media_root):
+            response = self.client.post('/api/v1/achievement-images/bulk/', {
+                'achievement': achievement.pk,
+                'image': [make_jpeg('a.jpg', (300, 200)), make_jpeg('b.jpg', (300, 200))],
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()), 2)
+        self.assertEqual(set(AchievementImage.objects.values_list('image_status', flat=True)), {'ready'})
+
+    def test_bulk_image_upload_rejects_non_ascii_id(self):
+        # Суперпользователь не проходит проверку владельца в HasRolePermission — id разбирает само представление
+        self.client.force_authenticate(User.objects.create_superuser('root', password='password'))
+        response = self.client.post('/api/v1/achievement-images/bulk/', {
+            'achievement': '²', 'image': [make_jpeg('a.jpg', (300, 200))],
+        }, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors']['0']['achievement'], ['Достижение не найдено.'])
+
+
+@mock.patch('users.db_router.replica_aliases', return_value=['replica_0', 'replica_1', 'replica_2'])
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.reads = []
+
+        def view(request):
+            # Несколько чтений одного запроса должны уйти на одну и ту же реплику
+            self.reads.append({ReplicaRouter().db_for_read(User) for _ in range(20)})
+            return HttpResponse(status=201 if request.method == 'POST' else 200)
+
+        self.middleware = ReplicaRoutingMiddleware(view)
+
+    def test_one_replica_per_request(self, _):
+        for _ in range(10):
+            self.middleware(self.factory.get('/api/v1/users/'))
+        self.assertTrue(all(len(reads) == 1 and reads <= {'replica_0', 'replica_1', 'replica_2'}
+                            for reads in self.reads))
+        self.middleware(self.factory.get('/admin/'))
+        self.assertEqual(self.reads[-1], {'default'})
+        self.assertEqual(ReplicaRouter().db_for_read(User), 'default')
+
+    def test_write_pins_client_to_default_via_cookie_or_header(self, _):
+        response = self.middleware(self.factory.post('/api/v1/achievements/'))
+        self.assertEqual(self.reads[-1], {'default'})
+
+        request = self.factory.get('/api/v1/achievements/')
+        request.COOKIES[PIN_COOKIE] = response.cookies[PIN_COOKIE].value
+        self.middleware(request)
+        self.assertEqual(self.reads[-1], {'default'})
+
+        self.middleware(self.factory.get('/api/v1/achievements/', headers={PIN_HEADER: response[PIN_HEADER]}))
+        self.assertEqual(self.reads[-1], {'default'})
+
+        # Подделанная или просроченная отметка не закрепляет
+        self.middleware(self.factory.get('/api/v1/achievements/', headers={PIN_HEADER: '1:forged:sig'}))
+        self.assertNotEqual(self.reads[-1], {'default'})
+        with override_settings(DATABASE_REPLICA_PIN_SECONDS=0):
+            time.sleep(1)
+            self.middleware(self.factory.get('/api/v1/achievements/', headers={PIN_HEADER: response[PIN_HEADER]}))
+        self.assertNotEqual(self.reads[-1], {'default'})
+
+
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.user = User.objects.create_user('athlete', password='password')
+        for i in range(3):
+            Achievement.objects.create(user=self.user, title=f'Старт {i}')
+        self.auth = {'headers': {'Authorization': f'Bearer {RefreshToken.for_user(self.user).access_token}'}}
+
+    async def test_list_paginates_by_cursor(self):
+        client = AsyncClient()
+        response = await client.get('/api/v1/async/achievements/?page_size=2', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        page = response.json()
+        self.assertEqual([item['title'] for item in page['results']], ['Старт 2', 'Старт 1'])
+
+        response = await client.get(page['next'], **self.auth)
+        self.assertEqual([item['title'] for item in response.json()['results']], ['Старт 0'])
+        self.assertIsNone(response.json()['next'])
+
+    async def test_retrieve_and_auth_errors(self):
+        client = AsyncClient()
+        response = await client.get(f'/api/v1/async/users/{self.user.pk}/', **self.auth)
+        self.assertEqual(response.json()['username'], 'athlete')
+        self.assertEqual((await client.get('/api/v1/async/users/')).status_code, 401)
+        self.assertEqual((await client.get('/api/v1/async/users/999/', **self.auth)).status_code, 404)
+
+    async def test_expand_related_objects(self):
+        client = AsyncClient()
+        response = await client.get('/api/v1/async/achievements/?expand=user', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({item['user']['username'] for item in response.json()['results']}, {'athlete'})
+        achievement = await Achievement.objects.afirst()
+        response = await client.get(f'/api/v1/async/achievements/{achievement.pk}/?expand=user', **self.auth)
+        self.assertEqual(response.json()['user']['id'], self.user.pk)
+
+    async def test_invalid_filter_and_cursor(self):
+        client = AsyncClient()
+        response = await client.get('/api/v1/async/achievements/?date_achieved_after=2024-02-30', **self.auth)
+        self.assertEqual(response.status_code, 400)
+        response = await client.get('/api/v1/async/achievements/?cursor=²', **self.auth)
+        self.assertEqual(len(response.json()['results']), 3)
+
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ivanov', password='password', last_name='Иванов', first_name='Пётр',
+                                             bio='Мастер спорта по плаванию')
+        self.client.force_authenticate(self.user)
+
+    def test_search_with_russian_word_forms(self):
+        Achievement.objects.create(user=self.user, title='Чемпионат России', description='Первое место в эстафете')
+        response = self.client.get('/api/v1/search/', {'q': 'чемпионатах'})
+        self.assertEqual([(item['type'], item['title']) for item in response.json()['results']],
+                         [('achievement', 'Чемпионат России')])
+
+        response = self.client.get('/api/v1/search/', {'q': 'плавание', 'type': 'user'})
+        self.assertEqual([item['id'] for item in response.json()['results']], [self.user.pk])
+
+    def test_index_follows_updates_and_deletes(self):
+        achievement = Achievement.objects.create(user=self.user, title='Кубок области')
+        achievement.title = 'Первенство города'
+        achievement.save()
+        self.assertEqual(self.client.get('/api/v1/search/', {'q': 'кубок'}).json()['results'], [])
+        self.assertEqual(len(self.client.get('/api/v1/search/', {'q': 'первенство'}).json()['results']), 1)
+        achievement.delete()
+        self.assertEqual(self.client.get('/api/v1/search/', {'q': 'первенство'}).json()['results'], [])
+
+    def test_limit_is_clamped(self):
+        for i in range(3):
+            Achievement.objects.create(user=self.user, title=f'Кубок {i}')
+        for limit, expected in (('-1', 1), ('0', 1), ('2', 2), ('1000', 3)):
+            response = self.client.get('/api/v1/search/', {'q': 'кубок', 'limit': limit})
+            self.assertEqual(len(response.json()['results']), expected, limit)
+
+
+class SparseFieldsTests(APITestCase):
+    def setUp(self):
+        self.role = Role.objects.create(name='Тренер')
+        self.user = User.objects.create_user('coach', password='password', role=self.role, bio='Длинная биография')
+        Achievement.objects.create(user=self.user, title='Кубок')
+        self.client.force_authenticate(self.user)
+
+    def test_fields_narrow_response_and_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/v1/users/', {'fields': 'id,username'})
+        self.assertEqual(response.json()['results'], [{'id': self.user.pk, 'username': 'coach'}])
+        select = next(q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT "users_user"'))
+        self.assertNotIn('"bio"', select)
+
+    def test_expand_nests_related_object(self):
+        response = self.client.get('/api/v1/achievements/', {'fields': 'title,user', 'expand': 'user'})
+        item = response.json()['results'][0]
+        self.assertEqual(set(item), {'title', 'user'})
+        self.assertEqual(item['user']['username'], 'coach')
+
+    def test_fast_json_renderer(self):
+        response = self.client.get('/api/v1/roles/', {'format': 'fast-json'})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(response.content)['results'], [{'id': self.role.pk, 'name': 'Тренер'}])
+
+
+class AchievementStatsTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('athlete', password='password')
+        self.other = User.objects.create_user('other', password='password')
+        self.client.force_authenticate(self.user)
+
+    def test_full_user_save_keeps_concurrent_counters(self):
+        stale = User.objects.get(pk=self.user.pk)
+        Achievement.objects.create(user=self.user, title='Кубок', date_achieved='2024-05-01')
+        stale.bio = 'Мастер спорта'
+        stale.save()
+        response = self.client.patch(f'/api/v1/users/{self.user.pk}/', {'first_name': 'Пётр'})
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual((user.bio, user.achievement_count, str(user.latest_achievement_date)),
+                         ('Мастер спорта', 1, '2024-05-01'))
+
+    def test_counters_follow_create_update_delete(self):
+        first = Achievement.objects.create(user=self.user, title='Кубок', date_achieved='2023-03-01')
+        second = Achievement.objects.create(user=self.user, title='Медаль', date_achieved='2024-06-01')
+        AchievementImage.objects.create(achievement=second, image='achievements/a.jpg')
+        Achievement.objects.create(user=self.other, title='Грамота', date_achieved='2024-01-01')
+
+        response = self.client.get(f'/api/v1/users/{self.user.pk}/stats/').json()
+        self.assertEqual(response, {'achievement_count': 2, 'achievement_image_count': 1,
+                                    'latest_achievement_date': '2024-06-01',
+                                    'achievements_by_year': {'2023': 1, '2024': 1}})
+
+        first.date_achieved = '2024-02-01'
+        first.save()
+        second.delete()
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.achievement_count, self.user.achievement_image_count), (1, 0))
+        self.assertEqual(str(self.user.latest_achievement_date), '2024-02-01')
+
+        board = self.client.get('/api/v1/leaderboard/', {'year': 2024}).json()['results']
+        self.assertEqual([(item['rank'], item['achievement_count']) for item in board], [(1, 1), (2, 1)])
+        self.assertEqual(self.client.get('/api/v1/leaderboard/', {'year': 2023}).json()['results'], [])
+
+    def test_rebuild_command_restores_counters(self):
+        Achievement.objects.create(user=self.user, title='Кубок', date_achieved='2024-03-01')
+        User.objects.update(achievement_count=0)
+        LeaderboardEntry.objects.all().delete()
+        call_command('rebuild_achievement_stats', stdout=StringIO())
+        self.assertEqual(User.objects.get(pk=self.user.pk).achievement_count, 1)
+        self.assertEqual(LeaderboardEntry.objects.filter(user=self.user).count(), 2)
+
+    def test_leaderboard_limit_is_clamped(self):
+        Achievement.objects.create(user=self.user, title='Кубок')
+        Achievement.objects.create(user=self.other, title='Медаль')
+        for limit, expected in (('-1', 1), ('0', 1), ('1000', 2)):
+            response = self.client.get('/api/v1/leaderboard/', {'limit': limit})
+            self.assertEqual(response.status_code, 200, limit)
+            self.assertEqual(len(response.json()['results']), expected, limit)
+
+
+@override_settings(TASK_QUEUE={'BACKEND': 'users.taskqueue.ImmediateBackend'})
+class FeedTests(APITestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user('reader', password='password')
+        self.athletes = [User.objects.create_user(f'athlete{i}', password='password') for i in range(3)]
+        self.client.force_authenticate(self.reader)
+
+    def follow_all(self):
+        for athlete in self.athletes:
+            self.assertEqual(self.client.post(f'/api/v1/users/{athlete.pk}/follow/').status_code, 200)
+
+    def read_titles(self, **params):
+        response = self.client.get('/api/v1/feed/', params)
+        self.assertEqual(response.status_code, 200)
+        return [item['title'] for item in response.json()['results']], response.json()['next']
+
+    def test_fan_out_unfollow_and_paging(self):
+        old = Achievement.objects.create(user=self.athletes[0], title='До подписки')
+        self.follow_all()
+        self.assertEqual(User.objects.get(pk=self.athletes[0].pk).follower_count, 1)
+        for i, athlete in enumerate(self.athletes):
+            Achievement.objects.create(user=athlete, title=f'Медаль {i}')
+
+        titles, _ = self.read_titles()
+        self.assertEqual(titles, ['Медаль 2', 'Медаль 1', 'Медаль 0', old.title])
+
+        first, next_url = self.read_titles(page_size=3)
+        second = self.client.get(next_url).json()
+        self.assertEqual((first + [item['title'] for item in second['results']], second['next']), (titles, None))
+
+        self.client.delete(f'/api/v1/users/{self.athletes[0].pk}/follow/')
+        self.assertEqual(self.read_titles()[0], ['Медаль 2', 'Медаль 1'])
+        self.assertEqual(User.objects.get(pk=self.athletes[0].pk).follower_count, 0)
+
+    def test_self_follow_rejected(self):
+        self.assertEqual(self.client.post(f'/api/v1/users/{self.reader.pk}/follow/').status_code, 400)
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_celebrity_achievements_merged_on_read(self):
+        self.follow_all()
+        for i, athlete in enumerate(self.athletes):
+            Achievement.objects.create(user=athlete, title=f'Медаль {i}')
+        self.assertFalse(FeedItem.objects.exists())
+        self.assertEqual(self.read_titles()[0], ['Медаль 2', 'Медаль 1', 'Медаль 0'])
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_crossing_fanout_limit_neither_duplicates_nor_loses(self):
+        star, fan = self.athletes[0], self.athletes[1]
+        self.client.post(f'/api/v1/users/{star.pk}/follow/')
+        Achievement.objects.create(user=star, title='До порога')
+        self.assertEqual(self.read_titles()[0], ['До порога'])
+
+        # Второй подписчик переводит спортсмена в «звёзды»: разосланные строки удаляются, но не дублируются
+        self.client.force_authenticate(fan)
+        self.client.post(f'/api/v1/users/{star.pk}/follow/')
+        self.assertFalse(FeedItem.objects.filter(author=star).exists())
+        Achievement.objects.create(user=star, title='Над порогом')
+        self.client.force_authenticate(self.reader)
+        self.assertEqual(self.read_titles()[0], ['Над порогом', 'До порога'])
+
+        # Возврат под порог: опубликованное в статусе «звезды» попадает в ленты подписчиков
+        self.client.force_authenticate(fan)
+        self.client.delete(f'/api/v1/users/{star.pk}/follow/')
+        self.client.force_authenticate(self.reader)
+        self.assertEqual(self.read_titles()[0], ['Над порогом', 'До порога'])
+        self.assertEqual(FeedItem.objects.filter(owner=self.reader, author=star).count(), 2)
+
+    def test_read_query_count_does_not_depend_on_follows(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get('/api/v1/feed/')
+            return len(ctx.captured_queries)
+
+        self.client.post(f'/api/v1/users/{self.athletes[0].pk}/follow/')
+        Achievement.objects.create(user=self.athletes[0], title='Кубок')
+        few = count_queries()
+        self.follow_all()
+        for athlete in self.athletes:
+            Achievement.objects.create(user=athlete, title='Медаль')
+        self.assertEqual(count_queries(), few)
+
+
+class ChunkedUploadTests(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root,
+                                              CHUNKED_UPLOAD_DIR=f'{self.media_root}/.parts',
+                                              TASK_QUEUE={'BACKEND': 'users.taskqueue.ImmediateBackend'})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user('athlete', password='password')
+        self.achievement = Achievement.objects.create(user=self.user, title='Кубок')
+        self.client.force_authenticate(self.user)
+        self.content = make_jpeg().read()
+
+    def start(self, checksum=None, filename='photo.jpg'):
+        response = self.client.post('/api/v1/uploads/', {
+            'achievement': self.achievement.pk, 'filename': filename, 'size': len(self.content),
+            'chunk_size': 4096, 'checksum': checksum or hashlib.sha256(self.content).hexdigest(),
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def put_part(self, upload_id, number, data, checksum=None):
+        headers = {'X-Part-Checksum': checksum} if checksum else {}
+        return self.client.put(f'/api/v1/uploads/{upload_id}/parts/{number}/', data,
+                               content_type='application/octet-stream', headers=headers)
+
+    def chunks(self):
+        return [self.content[i:i + 4096] for i in range(0, len(self.content), 4096)]
+
+    def test_resume_and_commit(self):
+        upload = self.start()
+        chunks = self.chunks()
+        self.assertEqual(upload['parts_total'], len(chunks))
+        # Части в обратном порядке; первая «обрывается» и отправляется повторно
+        for number in reversed(range(1, len(chunks))):
+            self.assertEqual(self.put_part(upload['id'], number, chunks[number]).status_code, 200)
+        self.assertEqual(self.put_part(upload['id'], 0, chunks[0][:100]).status_code, 400)
+        self.assertEqual(self.client.post(f"/api/v1/uploads/{upload['id']}/commit/").status_code, 400)
+        self.assertNotIn(0, self.client.get(f"/api/v1/uploads/{upload['id']}/").json()['received_parts'])
+
+        self.assertEqual(self.put_part(upload['id'], 0, chunks[0],
+                                       checksum=hashlib.sha256(chunks[0]).hexdigest()).status_code, 200)
+        response = self.client.post(f"/api/v1/uploads/{upload['id']}/commit/")
+        self.assertEqual(response.status_code, 201)
+        image = AchievementImage.objects.get(pk=response.json()['id'])
+        self.assertEqual(image.image_status, 'ready')
+        with image.image.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(self.client.post(f"/api/v1/uploads/{upload['id']}/commit/").json()['id'], image.pk)
+
+    def test_checksum_mismatch_rejected(self):
+        upload = self.start(checksum='0' * 64)
+        for number, chunk in enumerate(self.chunks()):
+            self.put_part(upload['id'], number, chunk)
+        self.assertEqual(self.client.post(f"/api/v1/uploads/{upload['id']}/commit/").status_code, 400)
+        self.assertFalse(AchievementImage.objects.exists())
+
+    def test_extension_follows_detected_format(self):
+        upload = self.start(filename='photo.html')
+        for number, chunk in enumerate(self.chunks()):
+            self.put_part(upload['id'], number, chunk)
+        response = self.client.post(f"/api/v1/uploads/{upload['id']}/commit/")
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(AchievementImage.objects.get(pk=response.json()['id']).image.name.endswith('.jpg'))
+
+    def test_non_image_rejected(self):
+        self.content = b'<html><script>alert(document.cookie)</script></html>' * 100
+        upload = self.start(filename='photo.jpg')
+        for number, chunk in enumerate(self.chunks()):
+            self.put_part(upload['id'], number, chunk)
+        self.assertEqual(self.client.post(f"/api/v1/uploads/{upload['id']}/commit/").status_code, 400)
+        self.assertFalse(AchievementImage.objects.exists())
+
+    def test_expired_session_rejects_parts_and_commit(self):
+        upload = self.start()
+        chunks = self.chunks()
+        self.assertEqual(self.put_part(upload['id'], 0, chunks[0]).status_code, 200)
+        UploadSession.objects.filter(pk=upload['id']).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.put_part(upload['id'], 1, chunks[1]).status_code, 410)
+        self.assertEqual(self.client.post(f"/api/v1/uploads/{upload['id']}/commit/").status_code, 410)
+        self.assertFalse(AchievementImage.objects.exists())
+
+    def test_other_users_session_not_found(self):
+        upload = self.start()
+        self.client.force_authenticate(User.objects.create_user('other', password='password'))
+        self.assertEqual(self.client.get(f"/api/v1/uploads/{upload['id']}/").status_code, 404)
+
+
+class MediaViewTests(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        with open(f'{self.media_root}/photo.0123456789abcdef.jpg', 'wb') as f:
+            f.write(bytes(range(256)) * 4)
+        self.url = '/media/photo.0123456789abcdef.jpg'
+
+    def test_full_conditional_and_range(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(256)) * 4)
+        self.assertIn('immutable', response['Cache-Control'])
+
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': response['ETag']}).status_code, 304)
+        self.assertEqual(self.client.get(self.url, headers={'If-Modified-Since': response['Last-Modified']})
+                         .status_code, 304)
+
+        partial = self.client.get(self.url, headers={'Range': 'bytes=10-19'})
+        self.assertEqual((partial.status_code, partial['Content-Range']), (206, 'bytes 10-19/1024'))
+        self.assertEqual(b''.join(partial.streaming_content), bytes(range(10, 20)))
+        self.assertEqual(b''.join(self.client.get(self.url, headers={'Range': 'bytes=-6'}).streaming_content),
+                         bytes(range(250, 256)))
+        self.assertEqual(self.client.get(self.url, headers={'Range': 'bytes=2000-'}).status_code, 416)
+        stale = self.client.get(self.url, headers={'Range': 'bytes=0-1', 'If-Range': '"stale"'})
+        self.assertEqual(stale.status_code, 200)
+
+    def test_only_images_served_inline(self):
+        response = self.client.get(self.url)
+        self.assertEqual((response['Content-Type'], response['X-Content-Type-Options']), ('image/jpeg', 'nosniff'))
+        self.assertTrue(response['Content-Disposition'].startswith('inline'))
+        with open(f'{self.media_root}/page.html', 'wb') as f:
+            f.write(b'<script>alert(1)</script>')
+        response = self.client.get('/media/page.html')
+        self.assertEqual((response['Content-Type'], response['X-Content-Type-Options']),
+                         ('application/octet-stream', 'nosniff'))
+        self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+        self.assertEqual(self.client.head('/media/page.html')['Content-Disposition'], 'attachment')
+
+    def test_sendfile_and_traversal(self):
+        with override_settings(MEDIA_SENDFILE='x-accel-redirect'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/photo.0123456789abcdef.jpg')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+
+
+@override_settings(TASK_QUEUE={'BACKEND': 'users.taskqueue.ImmediateBackend'})
+class ContentAddressedStorageTests(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user('athlete', password='password')
+        self.achievement = Achievement.objects.create(user=self.user, title='Кубок')
+        self.client.force_authenticate(self.user)
+
+    def upload(self):
+        response = self.client.post('/api/v1/achievement-images/',
+                                    {'achievement': self.achievement.pk, 'image': make_jpeg()}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return AchievementImage.objects.get(pk=response.json()['id'])
+
+    def refs(self, name):
+        return MediaBlob.objects.filter(name=name).values_list('ref_count', flat=True).first()
+
+    def test_identical_uploads_share_one_file(self):
+        first, second = self.upload(), self.upload()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.startswith('cas/'))
+        self.assertEqual(self.refs(first.image.name), 2)
+        self.assertEqual(first.image_variants, second.image_variants)
+
+        response = self.client.patch(f'/api/v1/users/{self.user.pk}/', {'profile_image': make_jpeg()},
+                                     format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.refs(first.image.name), 3)
+
+        name, variant = first.image.name, first.image_variants['thumbnail']['name']
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual((self.refs(name), first.image.storage.exists(name)), (2, True))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+            self.client.patch(f'/api/v1/users/{self.user.pk}/', {'profile_image': make_jpeg(size=(300, 200))},
+                              format='multipart')
+        self.assertEqual((self.refs(name), self.refs(variant)), (None, None))
+        self.assertFalse(first.image.storage.exists(name))
+        self.assertFalse(first.image.storage.exists(variant))
+
+    def test_garbage_collection_repairs_counts(self):
+        image = self.upload()
+        MediaBlob.objects.filter(name=image.image.name).update(ref_count=5)
+        AchievementImage.objects.filter(pk=image.pk).delete()
+        fixed, removed = collect_garbage(grace_seconds=0)
+        self.assertGreaterEqual(fixed, 1)
+        self.assertEqual(removed, len(image.image_variants) + 1)
+        self.assertFalse(MediaBlob.objects.exists())
+        out = StringIO()
+        call_command('gc_media', '--grace-seconds=0', stdout=out)
+        self.assertIn('удалено файлов: 0', out.getvalue())
+
+    def test_garbage_collection_removes_files_without_blob(self):
+        storage = AchievementImage._meta.get_field('image').storage
+        name = storage.save('photo.jpg', make_jpeg())
+        MediaBlob.objects.filter(name=name).delete()
+        self.assertEqual(collect_garbage(grace_seconds=3600), (0, 0))
+        self.assertEqual(collect_garbage(grace_seconds=0), (0, 1))
+        self.assertFalse(storage.exists(name))
+
+    def test_extension_follows_image_format(self):
+        storage = AchievementImage._meta.get_field('image').storage
+        self.assertTrue(storage.save('photo.html', make_jpeg()).endswith('.jpg'))
+        with self.assertRaises(ValueError):
+            storage.save('photo.jpg', ContentFile(b'<script>alert(1)</script>'))
+
+
+class PerformanceMetricsTests(APITestCase):
+    def setUp(self):
+        registry.reset()
+        self.user = User.objects.create_user('athlete', password='password')
+        self.client.force_authenticate(self.user)
+
+    def test_metrics_tagged_by_action(self):
+        self.client.get('/api/v1/users/')
+        self.client.post('/api/v1/achievements/', {'user': self.user.pk, 'title': 'Кубок'})
+        self.client.force_login(User.objects.create_user('admin', password='password', is_staff=True))
+        metrics = self.client.get('/metrics')
+        self.assertEqual(metrics.status_code, 200)
+        text = metrics.content.decode()
+        self.assertIn('http_request_duration_seconds_count{view="UserViewSet.list",method="GET",status="200"} 1',
+                      text)
+        self.assertIn('http_request_duration_seconds_count{view="AchievementViewSet.create",method="POST",'
+                      'status="201"} 1', text)
+        self.assertIn('http_request_serialization_seconds_count{view="UserViewSet.list"} 1', text)
+        self.assertRegex(text, r'http_request_db_queries_sum\{view="UserViewSet.list"\} [1-9]')
+
+    def test_metrics_endpoint_restricted(self):
+        self.client.force_authenticate(None)
+        # Без явной настройки локальный адрес (например, nginx на той же машине) доступа не даёт
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 403)
+        options = {'TOKEN': 'secret', 'ALLOWED_IPS': ('10.0.0.2',)}
+        with override_settings(PERFORMANCE_METRICS=options):
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code,
+                             403)
+            self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code,
+                             200)
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+    def test_slow_query_log_and_profile_sampling(self):
+        profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, profile_dir, ignore_errors=True)
+        options = {'SLOW_QUERY_MS': 0, 'SLOW_REQUEST_MS': 0, 'PROFILE_SAMPLE_RATE': 1.0,
+                   'PROFILE_THRESHOLD_MS': 0, 'PROFILE_DIR': profile_dir}
+        with override_settings(PERFORMANCE_METRICS=options), self.assertLogs('users.metrics') as logs:
+            self.client.get('/api/v1/users/')
+        self.assertTrue(any('Slow query' in line and 'UserViewSet.list' in line for line in logs.output))
+        self.assertTrue(any('Slow request' in line for line in logs.output))
+        self.assertEqual(len(os.listdir(profile_dir)), 1)
+
+    def test_fingerprint_ignores_literals_and_in_lists(self):
+        first = fingerprint('SELECT * FROM users_user WHERE id IN (%s, %s, %s) AND username = \'a\'')
+        second = fingerprint('SELECT *  FROM users_user WHERE id IN (%s) AND username = \'bb\'')
+        self.assertEqual(first, second)
+
+
+class BenchmarkSuiteTests(APITestCase):
+    def test_fixture_generator_and_regression_check(self):
+        from benchmarks.fixtures import seed
+        from benchmarks.run import compare
+
+        owner = seed(users=5, roles=2, achievements_per_user=3, images_per_achievement=2, follows_per_user=2)
+        self.assertEqual((User.objects.count(), Achievement.objects.count(), AchievementImage.objects.count()),
+                         (5, 15, 30))
+        owner.refresh_from_db()
+        self.assertEqual(owner.achievement_count, 3)
+        self.assertTrue(FeedItem.objects.filter(owner=owner).exists())
+
+        baseline = {'users.list': {'p95_ms': 100, 'queries': 2}}
+        ok = {'users.list': {'p95_ms': 120, 'queries': 2, 'errors': 0}}
+        slow = {'users.list': {'p95_ms': 130, 'queries': 3, 'errors': 0}}
+        self.assertEqual(compare(ok, baseline, 0.25), [])
+        self.assertEqual(len(compare(slow, baseline, 0.25)), 2)
+
+
+THROTTLE_RATES = {'user': '3/min', 'anon': '100/min', 'login': '100/min', 'login_username': '2/min',
+                  'token_refresh': '100/min'}
+
+
+@override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': THROTTLE_RATES})
+class ThrottlingTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('athlete', password='password')
+
+    def test_user_limit_headers_and_retry_after(self):
+        self.client.force_authenticate(self.user)
+        responses = [self.client.get('/api/v1/achievements/') for _ in range(4)]
+        self.assertEqual([r.status_code for r in responses], [200, 200, 200, 429])
+        self.assertEqual([r['RateLimit-Remaining'] for r in responses[:3]], ['2', '1', '0'])
+        self.assertEqual(responses[0]['RateLimit-Limit'], '3')
+        self.assertGreaterEqual(int(responses[3]['Retry-After']), 1)
+        # Лимит считается по пользователю: другой пользователь не затронут
+        self.client.force_authenticate(User.objects.create_user('other', password='password'))
+        self.assertEqual(self.client.get('/api/v1/achievements/').status_code, 200)
+
+    def test_login_limited_per_username_and_ip(self):
+        attempts = [self.client.post('/api/v1/token/', {'username': 'athlete', 'password': 'wrong'},
+                                     REMOTE_ADDR='10.0.0.1').status_code for _ in range(3)]
+        self.assertEqual(attempts, [401, 401, 429])
+        self.assertEqual(self.client.post('/api/v1/token/', {'username': 'other', 'password': 'x'},
+                                          REMOTE_ADDR='10.0.0.1').status_code, 401)
+        # Чужие неудачные попытки не блокируют вход владельцу с другого адреса
+        self.assertEqual(self.client.post('/api/v1/token/', {'username': 'athlete', 'password': 'password'},
+                                          REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK,
+                                       'DEFAULT_THROTTLE_RATES': {**THROTTLE_RATES, 'login': '2/min'}})
+    def test_forwarded_for_does_not_change_client_ip(self):
+        attempts = [self.client.post('/api/v1/token/', {'username': f'user{i}', 'password': 'x'},
+                                     REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR=f'192.0.2.{i}').status_code
+                    for i in range(3)]
+        self.assertEqual(attempts, [401, 401, 429])
+
+    def test_disabled(self):
+        self.client.force_authenticate(self.user)
+        with override_settings(RATE_LIMIT={'ENABLED': False}):
+            statuses = {self.client.get('/api/v1/achievements/').status_code for _ in range(5)}
+        self.assertEqual(statuses, {200})
+
+
+class RateLimitStoreTests(APITestCase):
+    def test_memory_bucket_refills(self):
+        store = MemoryBucketStore()
+        results = [store.consume('k', capacity=2, period=0.2)[0] for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertGreater(store.consume('k', capacity=2, period=0.2)[3], 0)
+        time.sleep(0.15)
+        self.assertTrue(store.consume('k', capacity=2, period=0.2)[0])
+
+    def test_cache_sliding_window(self):
+        store = CacheSlidingWindowStore()
+        results = [store.consume('window-test', capacity=3, period=60) for _ in range(4)]
+        self.assertEqual([allowed for allowed, *_ in results], [True, True, True, False])
+        self.assertEqual(results[0][1], 2)
+        self.assertGreater(results[3][3], 0)
+
+
+class RolePermissionTests(APITestCase):
+    def setUp(self):
+        self.role = Role.objects.create(name='Спортсмен')
+        self.user = User.objects.create_user('athlete', password='password', role=self.role)
+        self.other = User.objects.create_user('other', password='password', role=self.role)
+        self.mine = Achievement.objects.create(user=self.user, title='Мой старт')
+        self.foreign = Achievement.objects.create(user=self.other, title='Чужой старт')
+        self.client.force_authenticate(self.user)
+
+    def set_scope(self, resource, action, scope):
+        RolePermission.objects.update_or_create(role=self.role, resource=resource, action=action,
+                                                defaults={'scope': scope})
+
+    def test_new_role_gets_default_permissions(self):
+        self.assertEqual(self.role.permissions.count(),
+                         sum(len(actions) for actions in settings.RBAC_DEFAULT_PERMISSIONS.values()))
+        admin_role = Role.objects.create(name=ADMIN_ROLE_NAME)
+        self.assertEqual(set(admin_role.permissions.values_list('scope', flat=True)), {'all'})
+        self.assertEqual(admin_role.permissions.count(),
+                         len(settings.RBAC_DEFAULT_PERMISSIONS) * len(RolePermission.Action.values))
+
+    def test_own_scope_hides_foreign_objects_from_changes(self):
+        response = self.client.patch(f'/api/v1/achievements/{self.foreign.pk}/', {'title': 'Взлом'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.delete(f'/api/v1/achievements/{self.foreign.pk}/').status_code, 404)
+        response = self.client.delete('/api/v1/achievements/bulk/', {'ids': [self.mine.pk, self.foreign.pk]},
+                                      format='json')
+        self.assertEqual(response.json(), {'deleted': [self.mine.pk], 'missing': [self.foreign.pk]})
+        self.assertTrue(Achievement.objects.filter(pk=self.foreign.pk).exists())
+
+    def test_cannot_create_for_another_user_or_change_own_role(self):
+        for value in (self.other.pk, f' {self.other.pk}', f'+{self.other.pk}', '²', True, str(10 ** 20)):
+            response = self.client.post('/api/v1/achievements/', {'user': value, 'title': 'Кубок'}, format='json')
+            self.assertEqual(response.status_code, 403, value)
+        self.assertFalse(Achievement.objects.filter(user=self.other, title='Кубок').exists())
+        response = self.client.post('/api/v1/achievements/', {'user': self.user.pk, 'title': 'Кубок'})
+        self.assertEqual(response.status_code, 201)
+        admin_role = Role.objects.create(name=ADMIN_ROLE_NAME)
+        response = self.client.patch(f'/api/v1/users/{self.user.pk}/', {'role': admin_role.pk})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.post('/api/v1/roles/', {'name': 'Своя роль'}).status_code, 403)
+
+    def test_list_filtered_by_single_predicate(self):
+        self.set_scope('achievement', 'view', 'own')
+        permission_cache.get(self.role.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/v1/achievements/')
+        self.assertEqual([item['id'] for item in response.json()['results']], [self.mine.pk])
+        select = next(q['sql'] for q in ctx.captured_queries if 'FROM "users_achievement"' in q['sql'])
+        self.assertIn('"users_achievement"."user_id" = %d' % self.user.pk, select)
+        self.assertFalse(any('users_rolepermission' in q['sql'] for q in ctx.captured_queries))
+        # Ответ с областью own кэшируется отдельно для каждого пользователя
+        self.client.force_authenticate(self.other)
+        response = self.client.get('/api/v1/achievements/')
+        self.assertEqual([item['id'] for item in response.json()['results']], [self.foreign.pk])
+
+    @override_settings(TASK_QUEUE={'BACKEND': 'users.taskqueue.ImmediateBackend'})
+    def test_own_view_scope_applies_outside_viewsets(self):
+        self.assertEqual(self.client.post(f'/api/v1/users/{self.other.pk}/follow/').status_code, 200)
+        self.set_scope('achievement', 'view', 'own')
+
+        response = self.client.get('/api/v1/search/', {'q': 'старт', 'type': 'achievement'})
+        self.assertEqual([item['id'] for item in response.json()['results']], [self.mine.pk])
+        self.assertEqual(self.client.get('/api/v1/feed/').json()['results'], [])
+        self.assertEqual(self.client.get(f'/api/v1/profiles/{self.other.pk}/').json()['achievements'], [])
+        self.assertEqual(self.client.get('/api/v1/leaderboard/').status_code, 403)
+
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        auth = {'headers': {'Authorization': f'Bearer {RefreshToken.for_user(self.user).access_token}'}}
+        response = self.client.get('/api/v1/async/achievements/', **auth)
+        self.assertEqual([item['id'] for item in response.json()['results']], [self.mine.pk])
+        self.assertEqual(self.client.get(f'/api/v1/async/achievements/{self.foreign.pk}/', **auth).status_code, 404)
+        RolePermission.objects.filter(role=self.role, resource='achievement', action='view').delete()
+        self.assertEqual(self.client.get('/api/v1/async/achievements/', **auth).status_code, 403)
+
+    def test_cache_invalidated_on_permission_change(self):
+        self.assertEqual(self.client.get('/api/v1/achievements/').status_code, 200)
+        RolePermission.objects.filter(role=self.role, resource='achievement', action='view').delete()
+        self.assertEqual(self.client.get('/api/v1/achievements/').status_code, 403)
+        self.set_scope('achievement', 'view', 'all')
+        self.assertEqual(self.client.get('/api/v1/achievements/').status_code, 200)
+
+    def test_scope_all_and_superuser_reach_foreign_objects(self):
+        self.set_scope('achievement', 'update', 'all')
+        response = self.client.patch(f'/api/v1/achievements/{self.foreign.pk}/', {'title': 'Поправлено'})
+        self.assertEqual(response.status_code, 200)
+        self.client.force_authenticate(User.objects.create_superuser('root', password='password'))
+        self.assertEqual(self.client.delete(f'/api/v1/achievements/{self.foreign.pk}/').status_code, 204)
+
+
+@override_settings(TASK_QUEUE={'BACKEND': 'users.taskqueue.ImmediateBackend'})
+class ExportImportTests(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.export_dir = os.path.join(tempfile.mkdtemp(), 'export')
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.export_dir), ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.role = Role.objects.create(name='Тренер')
+        RolePermission.objects.filter(role=self.role, resource='achievement', action='update').update(scope='all')
+        self.user = User.objects.create_user('athlete', password='password', role=self.role, bio='Бегун')
+        self.achievements = [Achievement.objects.create(user=self.user, title=f'Марафон {i}') for i in range(3)]
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/api/v1/achievement-images/',
+                                    {'achievement': self.achievements[0].pk, 'image': make_jpeg()},
+                                    format='multipart')
+        self.image = AchievementImage.objects.get(pk=response.json()['id'])
+        # Файл, загруженный до хранилища по хэшу, — вне cas/
+        os.makedirs(os.path.join(self.media_root, 'achievements'))
+        with open(os.path.join(self.media_root, 'achievements', 'legacy.jpg'), 'wb') as f:
+            f.write(make_jpeg().read())
+        AchievementImage.objects.bulk_create([AchievementImage(achievement=self.achievements[1],
+                                                               image='achievements/legacy.jpg')])
+        rebuild_user_stats([self.user.pk])
+        self.fan = User.objects.create_user('fan', password='password')
+        follow(self.fan, self.user)
+
+    def wipe(self):
+        AchievementImage.objects.all().delete()
+        User.objects.all().delete()
+        Role.objects.all().delete()
+        MediaBlob.objects.all().delete()
+        SearchEntry.objects.all().delete()
+        shutil.rmtree(self.media_root)
+        os.makedirs(self.media_root)
+
+    def test_round_trip_remaps_keys_and_restores_media(self):
+        call_command('export_sportsocnet', self.export_dir, '--chunk-size', '2', stdout=StringIO())
+        # Новые записи занимают старые id, чтобы импорт не мог совпасть с ними случайно
+        self.wipe()
+        User.objects.create_user('placeholder', password='password')
+
+        out = StringIO()
+        call_command('import_sportsocnet', self.export_dir, '--batch-size', '2', stdout=out)
+        self.assertIn('users.achievement: создано 3', out.getvalue())
+
+        user = User.objects.get(username='athlete')
+        self.assertNotEqual(user.pk, self.user.pk)
+        self.assertTrue(user.check_password('password'))
+        self.assertEqual(user.date_joined, self.user.date_joined)
+        self.assertEqual((user.role.name, user.achievement_count, user.achievement_image_count), ('Тренер', 3, 2))
+        self.assertEqual(user.role.permissions.get(resource='achievement', action='update').scope, 'all')
+        self.assertEqual(sorted(user.achievements.values_list('title', flat=True)),
+                         [f'Марафон {i}' for i in range(3)])
+        self.assertTrue(SearchEntry.objects.filter(kind=SearchEntry.Kind.ACHIEVEMENT).exists())
+
+        image = AchievementImage.objects.get(image=self.image.image.name)
+        self.assertEqual(image.achievement.title, 'Марафон 0')
+        self.assertEqual(image.image_variants, self.image.image_variants)
+        for name in [image.image.name, 'achievements/legacy.jpg'] + [
+                variant['name'] for variant in image.image_variants.values()]:
+            self.assertTrue(os.path.exists(os.path.join(self.media_root, name)), name)
+        self.assertEqual(MediaBlob.objects.get(name=image.image.name).ref_count, 1)
+        self.assertEqual(collect_garbage(grace_seconds=0, dry_run=True), (0, 0))
+
+        # Подписки переносятся вместе со счётчиком и лентой подписчика
+        fan = User.objects.get(username='fan')
+        self.assertTrue(Follow.objects.filter(follower=fan, followee=user).exists())
+        self.assertEqual(user.follower_count, 1)
+        self.assertEqual(FeedItem.objects.filter(owner=fan, author=user).count(), 3)
+
+        # Повторный импорт ничего не дублирует
+        call_command('import_sportsocnet', self.export_dir, stdout=StringIO())
+        self.assertEqual((User.objects.count(), Achievement.objects.count(), AchievementImage.objects.count(),
+                          Role.objects.count(), Follow.objects.count()), (3, 3, 2, 1, 1))
+
+    def test_interrupted_export_resumes_from_checkpoint(self):
+        calls = []
+        original = transfer.save_manifest
+
+        def crash_on_fourth(path, manifest):
+            calls.append(1)
+            if len(calls) == 4:
+                raise KeyboardInterrupt
+            original(path, manifest)
+
+        with mock.patch('users.transfer.save_manifest', crash_on_fourth):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('export_sportsocnet', self.export_dir, '--chunk-size', '1', stdout=StringIO())
+        self.assertFalse(transfer.load_manifest(self.export_dir)['completed'])
+
+        call_command('export_sportsocnet', self.export_dir, '--chunk-size', '1', stdout=StringIO())
+        manifest = transfer.load_manifest(self.export_dir)
+        self.assertTrue(manifest['completed'])
+        with open(os.path.join(self.export_dir, 'users.jsonl'), encoding='utf-8') as f:
+            self.assertEqual([json.loads(line)['id'] for line in f], [self.user.pk, self.fan.pk])
+        with open(os.path.join(self.export_dir, 'achievements.jsonl'), encoding='utf-8') as f:
+            self.assertEqual([json.loads(line)['id'] for line in f], [a.pk for a in self.achievements])
+        with tarfile.open(os.path.join(self.export_dir, 'media.tar')) as tar:
+            names = tar.getnames()
+        self.assertEqual(len(names), len(set(names)))
+        self.assertIn('achievements/legacy.jpg', names)
+        self.assertIn(self.image.image.name, names)
+        self.assertEqual(manifest['media']['files'], len(names))
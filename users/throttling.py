@@ -0,0 +1,240 @@
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+from django.utils.module_loading import import_string
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class MemoryBucketStore:
+    """
+    Token bucket в памяти процесса. Ключи разнесены по STRIPES словарям со своими блокировками,
+    поэтому параллельные запросы разных клиентов почти не конкурируют; проверка — O(1).
+    При переполнении вытесняются давно не использованные ключи (LRU): вытесненный ключ
+    равносилен полному ведру, то есть лимит может только ослабнуть, но не ужесточиться.
+    """
+    STRIPES = 64
+
+    def __init__(self, max_entries=100000, **kwargs):
+        self.locks = [threading.Lock() for _ in range(self.STRIPES)]
+        self.buckets = [OrderedDict() for _ in range(self.STRIPES)]
+        self.max_per_stripe = max(1, max_entries // self.STRIPES)
+
+    def consume(self, key, capacity, period, cost=1):
+        """
+        Списывает cost жетонов. Возвращает (разрешено, осталось, сек. до полного ведра, сек. до повтора).
+        """
+        rate = capacity / period
+        now = time.monotonic()
+        stripe = hash(key) % self.STRIPES
+        with self.locks[stripe]:
+            buckets = self.buckets[stripe]
+            state = buckets.get(key)
+            if state is None:
+                tokens = capacity
+            else:
+                tokens = min(capacity, state[0] + (now - state[1]) * rate)
+                buckets.move_to_end(key)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            buckets[key] = (tokens, now)
+            if len(buckets) > self.max_per_stripe:
+                buckets.popitem(last=False)
+        retry_after = 0 if allowed else (cost - tokens) / rate
+        return allowed, int(tokens), (capacity - tokens) / rate, retry_after
+
+    def clear(self):
+        for lock, buckets in zip(self.locks, self.buckets):
+            with lock:
+                buckets.clear()
+
+
+class CacheSlidingWindowStore:
+    """
+    Общее для процессов и узлов хранилище поверх кэша Django (Redis, Memcached): скользящее окно
+    из двух счётчиков фиксированных окон с весом. Используются только get_many, add и атомарный incr,
+    без блокировок; при гонке лимит может быть превышен на число одновременных запросов.
+    """
+
+    def __init__(self, cache_alias='default', **kwargs):
+        self.cache_alias = cache_alias
+
+    def consume(self, key, capacity, period, cost=1):
+        cache = caches[self.cache_alias]
+        now = time.time()
+        window = int(now // period)
+        elapsed = now - window * period
+        current_key, previous_key = f'rl:{key}:{window}', f'rl:{key}:{window - 1}'
+        counts = cache.get_many([current_key, previous_key])
+        previous, current = counts.get(previous_key, 0), counts.get(current_key, 0)
+        weight = 1 - elapsed / period
+        estimate = previous * weight + current
+
+        if estimate + cost > capacity:
+            if current + cost > capacity or not previous:
+                retry_after = period - elapsed
+            else:
+                # Вес прошлого окна убывает линейно: ждём, пока оценка не опустится до capacity - cost
+                retry_after = (estimate + cost - capacity) / (previous / period)
+            return False, 0, period - elapsed, retry_after
+
+        if not cache.add(current_key, cost, timeout=int(period * 2) + 1):
+            try:
+                current = cache.incr(current_key, cost) - cost
+            except ValueError:
+                cache.add(current_key, cost, timeout=int(period * 2) + 1)
+        remaining = max(0, int(capacity - (previous * weight + current + cost)))
+        return True, remaining, period - elapsed, 0
+
+    def clear(self):
+        pass
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = dict(getattr(settings, 'RATE_LIMIT', {}))
+                store_class = import_string(config.pop('STORE', 'users.throttling.MemoryBucketStore'))
+                config.pop('ENABLED', None)
+                _store = store_class(**{key.lower(): value for key, value in config.items()})
+    return _store
+
+
+@receiver(setting_changed)
+def reset_store(*, setting=None, **kwargs):
+    global _store
+    if setting in (None, 'RATE_LIMIT', 'REST_FRAMEWORK'):
+        _store = None
+
+
+def rate_limit_enabled():
+    return getattr(settings, 'RATE_LIMIT', {}).get('ENABLED', True)
+
+
+class BucketRateThrottle(SimpleRateThrottle):
+    """
+    Основа троттлинга: лимит scope из DEFAULT_THROTTLE_RATES ('100/min'), состояние — в хранилище
+    RATE_LIMIT['STORE']. Результат самой строгой проверки запоминается для заголовков RateLimit-*.
+    """
+
+    def get_rate(self):
+        # DRF читает ставки один раз при импорте; здесь — при каждом создании, чтобы работал override_settings
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        if self.rate is None or not rate_limit_enabled():
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        allowed, remaining, reset, self.retry_after = get_store().consume(
+            f'{self.scope}:{key}', self.num_requests, self.duration)
+        remember_limit(request, self.num_requests, remaining, reset)
+        return allowed
+
+    def wait(self):
+        return self.retry_after
+
+
+def remember_limit(request, limit, remaining, reset):
+    # Хранится в HttpRequest, чтобы RateLimitHeadersMiddleware увидел его и после исключения Throttled
+    http_request = request._request
+    current = getattr(http_request, '_rate_limit', None)
+    if current is None or remaining < current[1]:
+        http_request._rate_limit = (limit, remaining, reset)
+
+
+class UserBucketThrottle(BucketRateThrottle):
+    """
+    Общий лимит на клиента: по пользователю (scope user) или по IP для анонимных запросов (scope anon).
+    """
+
+    def get_cache_key(self, request, view):
+        return self.get_ident_key(request)
+
+    def allow_request(self, request, view):
+        self.scope = 'user' if request.user and request.user.is_authenticated else 'anon'
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
+
+
+class ScopedBucketThrottle(UserBucketThrottle):
+    """
+    Лимит отдельного представления: throttle_scope на классе представления, ключ — пользователь или IP.
+    """
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, 'throttle_scope', None)
+        if not self.scope:
+            return True
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return BucketRateThrottle.allow_request(self, request, view)
+
+
+class LoginUsernameThrottle(BucketRateThrottle):
+    """
+    Лимит попыток входа на пару (имя пользователя, IP): перебор пароля одного аккаунта ограничен
+    строже общего лимита login, но чужие попытки с других адресов не блокируют вход владельцу.
+    """
+    scope = 'login_username'
+
+    def get_cache_key(self, request, view):
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        return f'username:{str(username).lower()}:ip:{self.get_ident(request)}' if username else None
+
+
+class RateLimitHeadersMiddleware:
+    """
+    Добавляет к ответам API заголовки RateLimit-Limit/Remaining/Reset по самой строгой из проверенных
+    квот. Retry-After при 429 выставляет сам DRF по значению wait() троттлинга.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def add_headers(request, response):
+        limit = getattr(request, '_rate_limit', None)
+        if limit is not None:
+            response['RateLimit-Limit'] = str(limit[0])
+            response['RateLimit-Remaining'] = str(max(0, limit[1]))
+            response['RateLimit-Reset'] = str(max(0, int(limit[2] + 0.999)))
+        return response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.add_headers(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.add_headers(request, await self.get_response(request))
@@ -0,0 +1,132 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken as BaseRefreshToken
+
+
+class BlacklistIndex:
+    """
+    Множество JTI отозванных токенов в памяти процесса.
+    Заполняется из БД при первой проверке, затем не чаще раза в JWT_BLACKLIST_SYNC_INTERVAL секунд
+    догружает строки BlacklistedToken, отозванные с начала прошлой синхронизации минус
+    JWT_BLACKLIST_SYNC_OVERLAP секунд. По id догружать нельзя: строки других процессов фиксируются
+    не в порядке id, и запись с меньшим id может появиться уже после загрузки большего.
+    Раз в JWT_BLACKLIST_FULL_SYNC_INTERVAL секунд индекс строится заново — на случай транзакций
+    длиннее окна перекрытия и удалённых строк (flushexpiredtokens, compact_tokens, админка).
+    Записи текущего процесса попадают в индекс сразу через post_save.
+    """
+
+    def __init__(self):
+        self._entries = {}  # jti -> время истечения (timestamp)
+        self._loaded_since = None  # момент начала последней синхронизации (время БД-записей)
+        self._synced_at = 0.0
+        self._full_synced_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def sync_interval(self):
+        return getattr(settings, 'JWT_BLACKLIST_SYNC_INTERVAL', 5)
+
+    @property
+    def overlap(self):
+        return timedelta(seconds=getattr(settings, 'JWT_BLACKLIST_SYNC_OVERLAP', 60))
+
+    @property
+    def full_sync_interval(self):
+        return getattr(settings, 'JWT_BLACKLIST_FULL_SYNC_INTERVAL', 300)
+
+    @staticmethod
+    def _load(queryset, entries):
+        rows = queryset.values_list('token__jti', 'token__expires_at')
+        for jti, expires_at in rows.iterator(chunk_size=2000):
+            entries[jti] = expires_at.timestamp()
+        return entries
+
+    def sync(self, force=False):
+        now = time.monotonic()
+        if not force and self._loaded_since is not None and now - self._synced_at < self.sync_interval:
+            return
+        with self._lock:
+            started = timezone.now()
+            if self._loaded_since is None or now - self._full_synced_at >= self.full_sync_interval:
+                # Новый словарь подменяет старый целиком: удалённые из БД строки исчезают и из индекса.
+                # Незафиксированные на этот момент отзывы догрузит следующая синхронизация с перекрытием
+                self._entries = self._load(BlacklistedToken.objects.filter(token__expires_at__gt=started), {})
+                self._full_synced_at = now
+            else:
+                self._load(BlacklistedToken.objects.filter(blacklisted_at__gte=self._loaded_since - self.overlap),
+                           self._entries)
+            self._loaded_since = started
+            self._synced_at = now
+
+    def contains(self, jti):
+        self.sync()
+        return jti in self._entries
+
+    def add(self, jti, expires_at):
+        # Момент синхронизации не сдвигается: строки других процессов догрузит следующий sync()
+        with self._lock:
+            self._entries[jti] = expires_at.timestamp()
+
+    def prune(self):
+        """
+        Удаляет из памяти истёкшие токены: они и так не пройдут проверку exp.
+        """
+        now = time.time()
+        with self._lock:
+            self._entries = {jti: exp for jti, exp in self._entries.items() if exp > now}
+
+    def reset(self):
+        with self._lock:
+            self._entries = {}
+            self._loaded_since = None
+            self._synced_at = 0.0
+            self._full_synced_at = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+blacklist_index = BlacklistIndex()
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def add_to_blacklist_index(sender, instance, created, **kwargs):
+    if created:
+        blacklist_index.add(instance.token.jti, instance.token.expires_at)
+
+
+class RefreshToken(BaseRefreshToken):
+    """
+    Refresh-токен, который проверяет черный список по индексу в памяти вместо запроса к БД.
+    """
+
+    def check_blacklist(self):
+        if blacklist_index.contains(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+
+def compact_tokens(batch_size=1000):
+    """
+    Удаляет истёкшие OutstandingToken (и каскадно BlacklistedToken) пачками.
+    Возвращает число удалённых OutstandingToken.
+    """
+    deleted = 0
+    while True:
+        ids = list(OutstandingToken.objects.filter(expires_at__lte=timezone.now())
+                   .order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        OutstandingToken.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+    blacklist_index.prune()
+    return deleted
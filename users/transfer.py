@@ -0,0 +1,443 @@
+"""
+Выгрузка и загрузка данных SportSocNet (команды export_sportsocnet и import_sportsocnet).
+
+Каталог выгрузки:
+    manifest.json            — версия формата, id выгрузки и контрольные точки
+    roles.jsonl, users.jsonl, achievements.jsonl, achievementimages.jsonl, follows.jsonl — строки моделей
+                             (JSON Lines); ленты (FeedItem) не выгружаются — после импорта подписок
+                             они заполняются заново так же, как при подписке
+    media.tar                — файлы из MEDIA_ROOT, на которые ссылаются записи
+
+Строки читаются из БД через .iterator() и пишутся построчно, память не зависит от объёма данных.
+После каждой пачки файлы сбрасываются на диск и в manifest.json записываются смещения: прерванная
+выгрузка при повторном запуске обрезает недописанный хвост и продолжает с последней контрольной точки.
+Импорт создаёт записи пачками через bulk_create, а соответствие старых и новых id хранит в ImportMapping —
+в той же транзакции, что и сами записи, поэтому повторный запуск пропускает уже загруженные строки.
+"""
+import datetime
+import itertools
+import json
+import os
+import tarfile
+import uuid
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.utils import timezone
+
+from .cache import invalidate
+from .feed import backfill_feed
+from .models import Role, RolePermission, User, Achievement, AchievementImage, Follow, MediaBlob, ImportMapping
+from .permissions import permission_cache
+from .search import index_objects
+from .stats import rebuild_user_stats
+from .storage import FILE_FIELDS, ContentAddressedStorage, file_names, is_content_addressed, retain_names
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+MEDIA_ARCHIVE = 'media.tar'
+
+
+class TransferError(Exception):
+    pass
+
+
+class ExportEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder округляет время до миллисекунд — в резервной копии нужна исходная точность
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class ModelSpec:
+    """
+    Как выгружается модель: файл, внешние ключи (attname -> модель) и поля, которые не переносятся,
+    потому что пересчитываются после импорта (денормализованная статистика).
+    """
+
+    def __init__(self, model, file, foreign_keys=None, derived=()):
+        self.model = model
+        self.file = file
+        self.foreign_keys = foreign_keys or {}
+        self.derived = set(derived)
+
+    @property
+    def label(self):
+        return self.model._meta.label_lower
+
+    @property
+    def fields(self):
+        return [field for field in self.model._meta.concrete_fields if field.name not in self.derived]
+
+
+# Порядок важен: модель выгружается и загружается после тех, на которые ссылается
+SPECS = [
+    ModelSpec(Role, 'roles.jsonl'),
+    ModelSpec(User, 'users.jsonl', {'role_id': Role},
+              derived=('achievement_count', 'achievement_image_count', 'latest_achievement_date', 'follower_count')),
+    ModelSpec(Achievement, 'achievements.jsonl', {'user_id': User}),
+    ModelSpec(AchievementImage, 'achievementimages.jsonl', {'achievement_id': Achievement}),
+    # Последними: при импорте подписок ленты заполняются уже загруженными достижениями
+    ModelSpec(Follow, 'follows.jsonl', {'follower_id': User, 'followee_id': User}),
+]
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def load_manifest(path):
+    with open(os.path.join(path, MANIFEST), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    tmp_path = os.path.join(path, MANIFEST + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(path, MANIFEST))
+
+
+def model_state(spec):
+    return {'file': spec.file, 'fields': [field.attname for field in spec.fields],
+            'last_pk': 0, 'rows': 0, 'offset': 0, 'done': False}
+
+
+def new_manifest():
+    return {
+        'version': FORMAT_VERSION,
+        'export_id': str(uuid.uuid4()),
+        'started_at': timezone.now().isoformat(),
+        'completed': False,
+        'models': {spec.label: model_state(spec) for spec in SPECS},
+        'media': {'offset': 0, 'files': 0, 'missing': 0, 'last_name': '', 'done': False},
+    }
+
+
+def open_at(path, offset):
+    """
+    Открывает файл на дозапись с контрольной точки: всё, что записано после неё, отбрасывается.
+    """
+    f = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+    f.truncate(offset)
+    f.seek(offset)
+    return f
+
+
+def sync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+class MediaWriter:
+    """
+    Дописывает файлы хранилища в media.tar. Контрольная точка — смещение после последнего целого файла.
+    """
+
+    def __init__(self, path, state, storage):
+        self.state = state
+        self.storage = storage
+        self.file = open_at(path, state['offset'])
+        self.tar = tarfile.open(fileobj=self.file, mode='w', format=tarfile.PAX_FORMAT)
+
+    def add(self, name):
+        if not self.storage.exists(name):
+            self.state['missing'] += 1
+            return
+        info = tarfile.TarInfo(name)
+        info.size = self.storage.size(name)
+        info.mtime = int(self.storage.get_modified_time(name).timestamp())
+        with self.storage.open(name, 'rb') as f:
+            self.tar.addfile(info, f)
+        self.state['files'] += 1
+
+    def checkpoint(self):
+        sync(self.file)
+        self.state['offset'] = self.tar.offset
+
+    def close(self):
+        self.tar.close()
+        sync(self.file)
+        self.file.close()
+
+
+def export_data(path, chunk_size=1000, storage=default_storage):
+    """
+    Выгружает данные в каталог path или продолжает прерванную выгрузку. Возвращает manifest.
+    Файлы из cas/ добавляются в архив по одному разу (по списку MediaBlob), прочие — вместе с записью,
+    которой они принадлежат.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    manifest = load_manifest(path) if os.path.exists(os.path.join(path, MANIFEST)) else new_manifest()
+    if manifest['version'] != FORMAT_VERSION:
+        raise TransferError(f"Неизвестная версия формата выгрузки: {manifest['version']}")
+    if manifest['completed']:
+        return manifest
+
+    media = MediaWriter(os.path.join(path, MEDIA_ARCHIVE), manifest['media'], storage)
+    try:
+        for spec in SPECS:
+            # Прерванная выгрузка прежней версии может не знать о модели — она выгружается с начала
+            state = manifest['models'].setdefault(spec.label, model_state(spec))
+            if not state['done']:
+                export_model(path, manifest, spec, state, media, chunk_size)
+        if not manifest['media']['done']:
+            export_blobs(path, manifest, media, chunk_size)
+    finally:
+        media.close()
+    manifest['completed'] = True
+    manifest['completed_at'] = timezone.now().isoformat()
+    save_manifest(path, manifest)
+    return manifest
+
+
+def export_model(path, manifest, spec, state, media, chunk_size):
+    queryset = spec.model.objects.filter(pk__gt=state['last_pk']).order_by('pk').values(*state['fields'])
+    with open_at(os.path.join(path, spec.file), state['offset']) as f:
+        for batch in batches(queryset.iterator(chunk_size=chunk_size), chunk_size):
+            if spec.model is Role:
+                add_role_permissions(batch)
+            for row in batch:
+                f.write(json.dumps(row, cls=ExportEncoder, ensure_ascii=False).encode() + b'\n')
+                if spec.model in FILE_FIELDS:
+                    for name in file_names_from_row(spec.model, row):
+                        if not is_content_addressed(name):
+                            media.add(name)
+            sync(f)
+            media.checkpoint()
+            state.update(last_pk=batch[-1]['id'], rows=state['rows'] + len(batch), offset=f.tell())
+            save_manifest(path, manifest)
+    state['done'] = True
+    save_manifest(path, manifest)
+
+
+def add_role_permissions(rows):
+    permissions = {}
+    for role_id, resource, action, scope in RolePermission.objects.filter(
+            role_id__in=[row['id'] for row in rows]).values_list('role_id', 'resource', 'action', 'scope'):
+        permissions.setdefault(role_id, []).append([resource, action, scope])
+    for row in rows:
+        row['permissions'] = permissions.get(row['id'], [])
+
+
+def file_names_from_row(model, row):
+    field_name, variants_field_name = FILE_FIELDS[model]
+    names = [row.get(field_name)] + [variant.get('name') for variant in (row.get(variants_field_name) or {}).values()]
+    return [name for name in names if name]
+
+
+def export_blobs(path, manifest, media, chunk_size):
+    state = manifest['media']
+    blobs = (MediaBlob.objects.filter(ref_count__gt=0, name__gt=state['last_name'])
+             .order_by('name').values_list('name', flat=True))
+    for batch in batches(blobs.iterator(chunk_size=chunk_size), chunk_size):
+        for name in batch:
+            media.add(name)
+        media.checkpoint()
+        state['last_name'] = batch[-1]
+        save_manifest(path, manifest)
+    state['done'] = True
+    save_manifest(path, manifest)
+
+
+def safe_member_name(name):
+    parts = name.split('/')
+    return not name.startswith('/') and '\\' not in name and all(part not in ('', '.', '..') for part in parts)
+
+
+def import_media(path, storage):
+    """
+    Распаковывает media.tar в хранилище под исходными именами. Файлы, которые уже есть с тем же размером,
+    пропускаются, поэтому повторный запуск дешёв. Возвращает (записано, пропущено).
+    """
+    written = skipped = 0
+    archive = os.path.join(path, MEDIA_ARCHIVE)
+    if not os.path.exists(archive):
+        return written, skipped
+    with tarfile.open(archive, 'r:') as tar:
+        while (member := tar.next()) is not None:
+            # Список прочитанных заголовков не накапливается: архив может содержать миллионы файлов
+            tar.members.clear()
+            if not member.isfile() or not safe_member_name(member.name):
+                skipped += 1
+                continue
+            target = storage.path(member.name)
+            if os.path.exists(target) and os.path.getsize(target) == member.size:
+                skipped += 1
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp_path = f'{target}.{uuid.uuid4().hex}.part'
+            with tar.extractfile(member) as src, open(tmp_path, 'wb') as dst:
+                while chunk := src.read(1024 * 1024):
+                    dst.write(chunk)
+            os.replace(tmp_path, target)
+            written += 1
+    return written, skipped
+
+
+def read_rows(path, spec):
+    with open(os.path.join(path, spec.file), encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def import_data(path, batch_size=1000, storage=default_storage):
+    """
+    Загружает выгрузку из каталога path. Возвращает {модель: (создано, сопоставлено с существующими,
+    пропущено без родителя)} и ('записано', 'пропущено') для медиафайлов.
+    """
+    manifest = load_manifest(path)
+    if manifest['version'] != FORMAT_VERSION:
+        raise TransferError(f"Неизвестная версия формата выгрузки: {manifest['version']}")
+    if not manifest['completed']:
+        raise TransferError("Выгрузка не завершена — запустите export_sportsocnet ещё раз")
+    if not connection.features.can_return_rows_from_bulk_insert:
+        raise TransferError("База данных не возвращает id из bulk_create, переназначение ключей невозможно")
+    if not hasattr(storage, 'path'):
+        raise TransferError("Импорт медиафайлов поддерживается только для хранилища в файловой системе")
+
+    result = {'media': import_media(path, storage)}
+    for spec in SPECS:
+        if spec.label not in manifest['models']:
+            # Выгрузка сделана до появления модели в SPECS (например, без подписок)
+            continue
+        fields = [field for field in spec.fields if field.attname in manifest['models'][spec.label]['fields']]
+        totals = Counter()
+        for batch in batches(read_rows(path, spec), batch_size):
+            totals.update(import_batch(manifest['export_id'], spec, fields, batch, storage))
+        result[spec.label] = (totals['created'], totals['matched'], totals['orphaned'])
+    if result[Role._meta.label_lower][0]:
+        permission_cache.invalidate()
+    return result
+
+
+def remap(source, model, old_pks):
+    return dict(ImportMapping.objects.filter(source=source, model=model._meta.label_lower, old_pk__in=old_pks)
+                .values_list('old_pk', 'new_pk'))
+
+
+def existing_matches(model, rows):
+    """
+    Записи, которые уже есть в БД под тем же естественным ключом: пользователи — по username, роли — по названию.
+    """
+    if model is User:
+        return dict(User.objects.filter(username__in=[row['username'] for row in rows])
+                    .values_list('username', 'pk')), 'username'
+    if model is Role:
+        matches = {}
+        for name, pk in Role.objects.filter(name__in=[row['name'] for row in rows]).order_by('pk').values_list(
+                'name', 'pk'):
+            matches.setdefault(name, pk)
+        return matches, 'name'
+    return {}, None
+
+
+def existing_follows(objects):
+    """
+    Подписки, которые уже есть в БД (пара follower/followee уникальна): {номер объекта: id существующей}.
+    """
+    pairs = {(obj.follower_id, obj.followee_id) for obj in objects}
+    existing = {(follower_id, followee_id): pk for follower_id, followee_id, pk in Follow.objects.filter(
+        follower_id__in={pair[0] for pair in pairs}, followee_id__in={pair[1] for pair in pairs}
+    ).values_list('follower_id', 'followee_id', 'pk') if (follower_id, followee_id) in pairs}
+    return {index: existing[obj.follower_id, obj.followee_id] for index, obj in enumerate(objects)
+            if (obj.follower_id, obj.followee_id) in existing}
+
+
+def import_batch(source, spec, fields, rows, storage):
+    stats = Counter()
+    with transaction.atomic():
+        done = remap(source, spec.model, [row['id'] for row in rows])
+        rows = [row for row in rows if row['id'] not in done]
+        if not rows:
+            return stats
+
+        parents = {attname: remap(source, model, {row[attname] for row in rows if row.get(attname) is not None})
+                   for attname, model in spec.foreign_keys.items()}
+        matches, natural_key = existing_matches(spec.model, rows)
+        mapping, objects, created_rows = [], [], []
+        for row in rows:
+            if natural_key and row[natural_key] in matches:
+                mapping.append(ImportMapping(source=source, model=spec.label, old_pk=row['id'],
+                                             new_pk=matches[row[natural_key]]))
+                stats['matched'] += 1
+                continue
+            values = {}
+            for field in fields:
+                if field.primary_key:
+                    continue
+                value = row.get(field.attname)
+                if field.attname in parents and value is not None:
+                    value = parents[field.attname].get(value)
+                    if value is None:
+                        break
+                values[field.attname] = field.to_python(value) if value is not None else None
+            else:
+                objects.append(spec.model(**values))
+                created_rows.append(row)
+                continue
+            # Родитель не попал в выгрузку (создан во время её работы) — строка пропускается
+            stats['orphaned'] += 1
+
+        if spec.model is Follow and objects:
+            existing = existing_follows(objects)
+            mapping += [ImportMapping(source=source, model=spec.label, old_pk=created_rows[index]['id'], new_pk=pk)
+                        for index, pk in existing.items()]
+            stats['matched'] += len(existing)
+            objects = [obj for index, obj in enumerate(objects) if index not in existing]
+            created_rows = [row for index, row in enumerate(created_rows) if index not in existing]
+        objects = spec.model.objects.bulk_create(objects)
+        # auto_now_add перезаписывается при вставке — исходные даты возвращаются отдельным UPDATE
+        restored = [field for field in fields if getattr(field, 'auto_now_add', False)]
+        if objects and restored:
+            for obj, row in zip(objects, created_rows):
+                for field in restored:
+                    setattr(obj, field.attname, field.to_python(row[field.attname]))
+            spec.model.objects.bulk_update(objects, [field.attname for field in restored])
+        mapping += [ImportMapping(source=source, model=spec.label, old_pk=row['id'], new_pk=obj.pk)
+                    for row, obj in zip(created_rows, objects)]
+        ImportMapping.objects.bulk_create(mapping)
+        stats['created'] += len(objects)
+        after_import(spec.model, objects, created_rows, storage)
+    return stats
+
+
+def after_import(model, objects, rows, storage):
+    """
+    То, что при обычном сохранении делают сигналы и follow(): права ролей, поисковый индекс, статистика,
+    счётчики подписчиков и ленты, ссылки на файлы.
+    """
+    if not objects:
+        return
+    if model is Role:
+        RolePermission.objects.bulk_create([
+            RolePermission(role=role, resource=resource, action=action, scope=scope)
+            for role, row in zip(objects, rows) for resource, action, scope in row.get('permissions', [])
+        ])
+    if model in (User, Achievement):
+        index_objects(objects)
+    if model is Achievement:
+        rebuild_user_stats({obj.user_id for obj in objects})
+    if model is AchievementImage:
+        rebuild_user_stats(set(Achievement.objects.filter(pk__in={obj.achievement_id for obj in objects})
+                               .values_list('user_id', flat=True)))
+    if model is Follow:
+        followers = Follow.objects.filter(followee_id=OuterRef('pk')).order_by().values('followee_id')
+        User.objects.filter(pk__in={obj.followee_id for obj in objects}).update(
+            follower_count=Subquery(followers.annotate(count=Count('pk')).values('count')))
+        invalidate(User)
+        for obj in objects:
+            backfill_feed.delay(follower_id=obj.follower_id, followee_id=obj.followee_id)
+    if model in FILE_FIELDS and isinstance(storage, ContentAddressedStorage):
+        field_name, variants_field_name = FILE_FIELDS[model]
+        retain_names(Counter(name for obj in objects for name in file_names(obj, field_name, variants_field_name)),
+                     storage)
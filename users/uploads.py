@@ -0,0 +1,242 @@
+import bisect
+import hashlib
+import io
+import itertools
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .images import image_extension
+from .models import AchievementImage, UploadSession
+from .tasks import schedule_image_processing
+
+READ_BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """
+    Ошибка загрузки по частям; текст возвращается клиенту с кодом status_code.
+    """
+    status_code = 400
+
+
+class UploadExpired(UploadError):
+    status_code = 410
+
+
+def check_not_expired(session):
+    # Просроченные сессии удаляет purge_expired_uploads, но до этого они не должны принимать части
+    if session.expires_at <= timezone.now():
+        raise UploadExpired("Срок загрузки истёк, начните её заново")
+
+
+def upload_settings():
+    return {
+        'chunk_size': getattr(settings, 'CHUNKED_UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024),
+        'max_size': getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 50 * 1024 * 1024),
+        'ttl': getattr(settings, 'CHUNKED_UPLOAD_TTL', 24 * 60 * 60),
+    }
+
+
+def session_dir(session):
+    return os.path.join(settings.CHUNKED_UPLOAD_DIR, str(session.id))
+
+
+def part_path(session, number):
+    return os.path.join(session_dir(session), f'{number:06d}.part')
+
+
+def received_parts(session):
+    try:
+        names = os.listdir(session_dir(session))
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[:-5]) for name in names if name.endswith('.part'))
+
+
+def start_upload(user, achievement, filename, size, checksum, chunk_size=None):
+    """
+    Создаёт сессию загрузки. Части можно отправлять в любом порядке и параллельно.
+    """
+    options = upload_settings()
+    if size > options['max_size']:
+        raise UploadError(f"Размер файла превышает {options['max_size']} байт")
+    session = UploadSession.objects.create(
+        user=user, achievement=achievement, filename=os.path.basename(filename), size=size,
+        chunk_size=chunk_size or options['chunk_size'], checksum=checksum.lower(),
+        expires_at=timezone.now() + timedelta(seconds=options['ttl']),
+    )
+    os.makedirs(session_dir(session), exist_ok=True)
+    return session
+
+
+def write_part(session, number, stream, checksum=None):
+    """
+    Потоково записывает часть на диск блоками READ_BLOCK_SIZE. Часть появляется под итоговым
+    именем только целиком (os.replace), поэтому оборванная передача не оставляет битых частей,
+    а повторная отправка той же части её перезаписывает. Временный файл у каждого запроса свой,
+    так что одновременные отправки одной части (в том числе из потоков одного процесса) не мешают друг другу.
+    """
+    if session.status != UploadSession.Status.ACTIVE:
+        raise UploadError("Загрузка уже завершена")
+    check_not_expired(session)
+    if not 0 <= number < session.parts_total:
+        raise UploadError(f"Номер части должен быть от 0 до {session.parts_total - 1}")
+
+    expected = session.part_size(number)
+    digest = hashlib.sha256()
+    written = 0
+    path = part_path(session, number)
+    os.makedirs(session_dir(session), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=session_dir(session), prefix=f'{number:06d}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while written <= expected:
+                block = stream.read(min(READ_BLOCK_SIZE, expected + 1 - written))
+                if not block:
+                    break
+                f.write(block)
+                digest.update(block)
+                written += len(block)
+        if written != expected:
+            raise UploadError(f"Ожидалось {expected} байт в части {number}, получено {written}")
+        if checksum and digest.hexdigest() != checksum.lower():
+            raise UploadError(f"Контрольная сумма части {number} не совпадает")
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return received_parts(session)
+
+
+class PartsReader(io.RawIOBase):
+    """
+    Файловый объект, последовательно читающий части с диска: хранилище получает собранный файл
+    без промежуточной копии целиком. Поддерживает произвольный seek (нужен Pillow при проверке).
+    """
+    def __init__(self, paths):
+        super().__init__()
+        self.paths = paths
+        self.offsets = list(itertools.accumulate((os.path.getsize(path) for path in paths), initial=0))
+        self.current = None
+        self.seek(0)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.offsets[-1]
+        if offset < 0:
+            raise ValueError("Отрицательная позиция")
+        self.close_current()
+        self.current = None
+        self.position = offset
+        self.index = bisect.bisect_right(self.offsets, offset) - 1
+        return offset
+
+    def tell(self):
+        return self.position
+
+    def close_current(self):
+        if self.current is not None:
+            self.current.close()
+
+    def readinto(self, buffer):
+        while self.index < len(self.paths):
+            if self.current is None:
+                self.current = open(self.paths[self.index], 'rb')
+                self.current.seek(self.position - self.offsets[self.index])
+            read = self.current.readinto(buffer)
+            if read:
+                self.position += read
+                return read
+            self.close_current()
+            self.current = None
+            self.index += 1
+        return 0
+
+    def close(self):
+        self.close_current()
+        super().close()
+
+
+def hashed_filename(filename, checksum, extension):
+    """
+    Имя с хэшем содержимого: такой файл не меняется, и его можно кэшировать бессрочно (см. users.media).
+    Расширение берётся из формата, определённого по содержимому, а не из имени, присланного клиентом.
+    """
+    stem = os.path.splitext(filename)[0]
+    return f'{stem[:80] or "image"}.{checksum[:16]}{extension}'
+
+
+def commit_upload(session):
+    """
+    Проверяет наличие всех частей, размер, SHA-256 и то, что собранный файл — изображение,
+    затем сохраняет файл в хранилище и создаёт AchievementImage. Повторный вызов для завершённой сессии возвращает то же изображение.
+    """
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if session.status == UploadSession.Status.COMPLETED:
+            return session.image
+        check_not_expired(session)
+
+        missing = sorted(set(range(session.parts_total)) - set(received_parts(session)))
+        if missing:
+            raise UploadError(f"Не загружены части: {', '.join(map(str, missing[:20]))}")
+        paths = [part_path(session, number) for number in range(session.parts_total)]
+
+        digest = hashlib.sha256()
+        size = 0
+        with PartsReader(paths) as reader:
+            for block in iter(lambda: reader.read(READ_BLOCK_SIZE), b''):
+                digest.update(block)
+                size += len(block)
+        if size != session.size or digest.hexdigest() != session.checksum:
+            raise UploadError("Размер или контрольная сумма собранного файла не совпадают")
+
+        with PartsReader(paths) as reader:
+            try:
+                extension = image_extension(reader)
+            except ValueError as exc:
+                raise UploadError(str(exc))
+            content = File(reader, name=hashed_filename(session.filename, session.checksum, extension))
+            content.size = session.size
+            image = AchievementImage(achievement=session.achievement)
+            image.image.save(content.name, content, save=False)
+            image.save()
+        schedule_image_processing(image)
+
+        session.status = UploadSession.Status.COMPLETED
+        session.image = image
+        session.save(update_fields=['status', 'image'])
+        transaction.on_commit(lambda: shutil.rmtree(session_dir(session), ignore_errors=True))
+    return image
+
+
+def abort_upload(session):
+    session.delete()
+    shutil.rmtree(session_dir(session), ignore_errors=True)
+
+
+def purge_expired_uploads():
+    """
+    Удаляет просроченные незавершённые сессии вместе с загруженными частями.
+    """
+    expired = UploadSession.objects.filter(status=UploadSession.Status.ACTIVE, expires_at__lt=timezone.now())
+    count = 0
+    for session in expired.iterator():
+        abort_upload(session)
+        count += 1
+    return count
@@ -1,35 +1,348 @@
-from rest_framework import viewsets, status
-from rest_framework.permissions import IsAuthenticated
+from io import BytesIO
+
+from django.db import transaction
+from django.db.models import Prefetch
+from rest_framework import serializers, viewsets, status
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+from .cache import CachedResponseMixin, cache_metrics, invalidate
+from .feed import follow, unfollow, read_feed, schedule_fan_out
+from .filters import MAX_ID, UserFilterBackend, AchievementFilterBackend, AchievementImageFilterBackend
+from .mixins import StreamingListMixin, SparseQuerysetMixin
+from .models import (Role, User, Achievement, AchievementImage, SearchEntry, LeaderboardEntry, UploadSession,
+                     RolePermission)
+from .pagination import (RoleCursorPagination, UserCursorPagination, AchievementCursorPagination,
+                         AchievementImageCursorPagination)
+from .permissions import (HasRolePermission, HasFullViewPermission, IsAdminOrReadOnly, RoleScopedQuerysetMixin,
+                          Scope, get_scope, scope_queryset)
+from .search import index_objects, search
+from .serializers import (RoleSerializer, UserSerializer, AchievementSerializer, AchievementImageSerializer,
+                          UserProfileSerializer, AchievementBulkSerializer, LeaderboardEntrySerializer,
+                          AchievementWithImagesSerializer, UploadSessionSerializer)
+from .stats import rebuild_user_stats
+from .taskqueue import queue_metrics
+from .tasks import process_image, schedule_image_processing
+from .throttling import UserBucketThrottle, ScopedBucketThrottle, LoginUsernameThrottle
+from .tokens import RefreshToken
+from .uploads import UploadError, start_upload, write_part, commit_upload, abort_upload
+
 
-from .models import Role, User, Achievement, AchievementImage
-from .serializers import RoleSerializer, UserSerializer, AchievementSerializer, AchievementImageSerializer
+def indexed_errors(errors):
+    """
+    Ошибки пакетной операции в виде {индекс элемента: ошибки}, только для ошибочных элементов.
+    """
+    if isinstance(errors, list):
+        return {str(index): item for index, item in enumerate(errors) if item}
+    return errors
 
 
-class RoleViewSet(viewsets.ModelViewSet):
+class RoleViewSet(StreamingListMixin, CachedResponseMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = Role.objects.all()
     serializer_class = RoleSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAdminOrReadOnly]
+    cache_dependencies = ('users.role',)
+    pagination_class = RoleCursorPagination
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(StreamingListMixin, RoleScopedQuerysetMixin, CachedResponseMixin, SparseQuerysetMixin,
+                  viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [HasRolePermission]
+    permission_resource = RolePermission.Resource.USER
+    permission_actions = {'follow': RolePermission.Action.VIEW, 'stats': RolePermission.Action.VIEW}
+    permission_protected_fields = ('role',)
+    cache_dependencies = ('users.user', 'users.role')
+    pagination_class = UserCursorPagination
+    filter_backends = [UserFilterBackend]
+
+    def perform_create(self, serializer):
+        user = serializer.save()
+        if user.profile_image:
+            schedule_image_processing(user)
+
+    def perform_update(self, serializer):
+        user = serializer.save()
+        if 'profile_image' in serializer.validated_data:
+            schedule_image_processing(user)
+
+    @action(detail=True, methods=['post', 'delete'], url_path='follow')
+    def follow(self, request, pk=None):
+        """
+        POST — подписаться на пользователя, DELETE — отписаться.
+        """
+        followee = self.get_object()
+        if followee.pk == request.user.pk:
+            return Response({'error': 'Нельзя подписаться на себя'}, status=status.HTTP_400_BAD_REQUEST)
+        if request.method == 'DELETE':
+            changed = unfollow(request.user, followee)
+        else:
+            changed = follow(request.user, followee)
+        return Response({'following': request.method == 'POST', 'changed': changed})
+
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """
+        Статистика пользователя из денормализованных счётчиков и рейтинга, без агрегации по достижениям.
+        """
+        user = self.get_object()
+        by_year = (LeaderboardEntry.objects.filter(user=user).exclude(year=LeaderboardEntry.ALL_TIME)
+                   .order_by('year').values_list('year', 'achievement_count'))
+        return Response({
+            'achievement_count': user.achievement_count,
+            'achievement_image_count': user.achievement_image_count,
+            'latest_achievement_date': user.latest_achievement_date,
+            'achievements_by_year': {str(year): count for year, count in by_year},
+        })
 
 
-class AchievementViewSet(viewsets.ModelViewSet):
+class AchievementViewSet(StreamingListMixin, RoleScopedQuerysetMixin, CachedResponseMixin, SparseQuerysetMixin,
+                         viewsets.ModelViewSet):
     queryset = Achievement.objects.all()
     serializer_class = AchievementSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [HasRolePermission]
+    permission_resource = RolePermission.Resource.ACHIEVEMENT
+    cache_dependencies = ('users.achievement', 'users.user')
+    pagination_class = AchievementCursorPagination
+    filter_backends = [AchievementFilterBackend]
+    bulk_max_items = 1000
+
+    @action(detail=False, methods=['post', 'patch', 'delete'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Пакетные операции: POST — список новых достижений, PATCH — список изменений с id,
+        DELETE — {"ids": [...]}. Все изменения выполняются в одной транзакции; при ошибке
+        в любом элементе ничего не записывается, а в errors возвращаются ошибки по индексам элементов.
+        """
+        if request.method == 'DELETE':
+            return self.bulk_delete(request)
+        if not isinstance(request.data, list):
+            return Response({'error': 'Ожидается список объектов'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > self.bulk_max_items:
+            return Response({'error': f'Не более {self.bulk_max_items} объектов за запрос'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if request.method == 'PATCH':
+            return self.bulk_update(request)
+
+        serializer = AchievementBulkSerializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response({'errors': indexed_errors(serializer.errors)}, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            achievements = serializer.save()
+            index_objects(achievements)
+            rebuild_user_stats({achievement.user_id for achievement in achievements})
+            schedule_fan_out([achievement.pk for achievement in achievements])
+        invalidate(Achievement)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def bulk_update(self, request):
+        ids = [item.get('id') if isinstance(item, dict) else None for item in request.data]
+        # bool — подкласс int: JSON true иначе совпал бы с id 1
+        ids = [pk if type(pk) is int and 0 < pk <= MAX_ID else None for pk in ids]
+        instances = self.get_queryset().in_bulk([pk for pk in ids if pk is not None])
+        errors = indexed_errors([{} if pk in instances else {'id': ['Достижение не найдено.']} for pk in ids])
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
 
+        serializer = AchievementBulkSerializer([instances[pk] for pk in ids], data=request.data, many=True,
+                                               partial=True)
+        if not serializer.is_valid():
+            return Response({'errors': indexed_errors(serializer.errors)}, status=status.HTTP_400_BAD_REQUEST)
+        previous_users = {instance.user_id for instance in instances.values()}
+        with transaction.atomic():
+            achievements = serializer.save()
+            index_objects(achievements)
+            rebuild_user_stats(previous_users | {achievement.user_id for achievement in achievements})
+        for pk in ids:
+            invalidate(Achievement, pk)
+        return Response(serializer.data)
 
-class AchievementImageViewSet(viewsets.ModelViewSet):
+    def bulk_delete(self, request):
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        if (not isinstance(ids, list) or len(ids) > self.bulk_max_items
+                or not all(type(pk) is int and abs(pk) <= MAX_ID for pk in ids)):
+            return Response({'error': f'Ожидается ids — список не более чем из {self.bulk_max_items} id'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            # Для области own queryset уже сужен до своих достижений: чужие id попадут в missing
+            existing = set(self.get_queryset().filter(pk__in=ids).values_list('pk', flat=True))
+            Achievement.objects.filter(pk__in=existing).delete()
+        return Response({'deleted': sorted(existing), 'missing': [pk for pk in ids if pk not in existing]})
+
+
+class AchievementImageViewSet(StreamingListMixin, RoleScopedQuerysetMixin, CachedResponseMixin, SparseQuerysetMixin,
+                              viewsets.ModelViewSet):
     queryset = AchievementImage.objects.all()
     serializer_class = AchievementImageSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [HasRolePermission]
+    permission_resource = RolePermission.Resource.ACHIEVEMENT_IMAGE
+    cache_dependencies = ('users.achievementimage', 'users.achievement')
+    pagination_class = AchievementImageCursorPagination
+    filter_backends = [AchievementImageFilterBackend]
+
+    bulk_max_items = 100
+
+    def perform_create(self, serializer):
+        schedule_image_processing(serializer.save())
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Пакетная загрузка изображений одним multipart-запросом: несколько полей image и
+        одно поле achievement (для всех файлов) либо по одному achievement на каждый файл.
+        """
+        files = request.FILES.getlist('image')
+        achievement_ids = request.data.getlist('achievement') if hasattr(request.data, 'getlist') else []
+        if not files or len(files) > self.bulk_max_items:
+            return Response({'error': f'Ожидается от 1 до {self.bulk_max_items} файлов в поле image'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(achievement_ids) == 1:
+            achievement_ids = achievement_ids * len(files)
+        if len(achievement_ids) != len(files):
+            return Response({'error': 'Число значений achievement должно быть 1 или совпадать с числом файлов'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # isdigit() пропускает «²» и другие цифры Юникода, которые int() не разбирает
+        achievement_ids = [int(pk) if pk.isascii() and pk.isdecimal() else None for pk in achievement_ids]
+        existing = set(Achievement.objects.filter(pk__in=[pk for pk in achievement_ids if pk is not None])
+                       .values_list('pk', flat=True))
+        image_field = serializers.ImageField()
+        errors = []
+        for achievement_id, file in zip(achievement_ids, files):
+            item_errors = {}
+            if achievement_id not in existing:
+                item_errors['achievement'] = ['Достижение не найдено.']
+            try:
+                image_field.run_validation(file)
+            except serializers.ValidationError as e:
+                item_errors['image'] = e.detail
+            errors.append(item_errors)
+        errors = indexed_errors(errors)
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            images = AchievementImage.objects.bulk_create([
+                AchievementImage(achievement_id=achievement_id, image=file)
+                for achievement_id, file in zip(achievement_ids, files)
+            ])
+            for image in images:
+                process_image.delay(model='users.achievementimage', pk=image.pk)
+            rebuild_user_stats(Achievement.objects.filter(pk__in=existing).values_list('user_id', flat=True))
+        invalidate(AchievementImage)
+        serializer = self.get_serializer(images, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def perform_update(self, serializer):
+        image = serializer.save()
+        if 'image' in serializer.validated_data:
+            schedule_image_processing(image)
+
+
+class UploadSessionViewSet(viewsets.GenericViewSet):
+    """
+    Возобновляемая загрузка изображения достижения по частям:
+    POST /uploads/ — начать, PUT /uploads/<id>/parts/<n>/ — тело запроса с частью n
+    (необязательный заголовок X-Part-Checksum — её SHA-256), GET /uploads/<id>/ — какие части уже получены,
+    POST /uploads/<id>/commit/ — собрать файл, DELETE /uploads/<id>/ — отменить.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [HasRolePermission]
+    # Все шаги загрузки — часть создания изображения достижения
+    permission_resource = RolePermission.Resource.ACHIEVEMENT_IMAGE
+    permission_actions = dict.fromkeys(['create', 'retrieve', 'destroy', 'part', 'commit'],
+                                       RolePermission.Action.CREATE)
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            session = start_upload(request.user, **serializer.validated_data)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=e.status_code)
+        return Response(self.get_serializer(session).data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        return Response(self.get_serializer(self.get_object()).data)
+
+    def destroy(self, request, pk=None):
+        abort_upload(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['put'], url_path=r'parts/(?P<number>\d+)')
+    def part(self, request, pk=None, number=None):
+        session = self.get_object()
+        try:
+            # Тело читается из потока запроса блоками, без буферизации всей части в памяти
+            parts = write_part(session, int(number), request.stream or BytesIO(),
+                               request.headers.get('X-Part-Checksum'))
+        except UploadError as e:
+            return Response({'error': str(e)}, status=e.status_code)
+        return Response({'received_parts': parts, 'parts_total': session.parts_total})
+
+    @action(detail=True, methods=['post'])
+    def commit(self, request, pk=None):
+        try:
+            image = commit_upload(self.get_object())
+        except UploadError as e:
+            return Response({'error': str(e)}, status=e.status_code)
+        invalidate(AchievementImage)
+        return Response(AchievementImageSerializer(image, context=self.get_serializer_context()).data,
+                        status=status.HTTP_201_CREATED)
+
+
+class UserProfileViewSet(RoleScopedQuerysetMixin, CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Профили пользователей с вложенными достижениями и изображениями.
+    Количество запросов на страницу фиксировано: пользователи с ролями, достижения, изображения.
+    Вложенные достижения и изображения ограничены правами роли на их просмотр.
+    """
+    queryset = User.objects.select_related('role')
+    serializer_class = UserProfileSerializer
+    permission_classes = [HasRolePermission]
+    permission_resource = RolePermission.Resource.USER
+    nested_resources = (RolePermission.Resource.ACHIEVEMENT, RolePermission.Resource.ACHIEVEMENT_IMAGE)
+    cache_dependencies = ('users.user', 'users.role', 'users.achievement', 'users.achievementimage')
+    pagination_class = UserCursorPagination
+
+    def get_queryset(self):
+        user = self.request.user
+        achievements, images = (
+            scope_queryset(user, RolePermission.Resource.ACHIEVEMENT,
+                           Achievement.objects.order_by('-date_achieved', '-id')),
+            scope_queryset(user, RolePermission.Resource.ACHIEVEMENT_IMAGE,
+                           AchievementImage.objects.order_by('uploaded_at', 'id')),
+        )
+        return super().get_queryset().prefetch_related(
+            Prefetch('achievements', queryset=achievements),
+            Prefetch('achievements__images', queryset=images),
+        )
+
+    def cache_key_extra(self, request):
+        scopes = tuple(get_scope(request.user, resource, RolePermission.Action.VIEW)
+                       for resource in self.nested_resources)
+        extra = super().cache_key_extra(request) + scopes
+        return extra + (request.user.pk,) if Scope.OWN in scopes else extra
+
+
+class TokenObtainView(TokenObtainPairView):
+    """
+    Выдача токенов по логину и паролю. Хэширование пароля дорогое, поэтому попытки ограничены
+    и по IP/пользователю (login), и по имени пользователя (login_username).
+    """
+    throttle_scope = 'login'
+    throttle_classes = [UserBucketThrottle, ScopedBucketThrottle, LoginUsernameThrottle]
+
+
+class TokenRefreshThrottledView(TokenRefreshView):
+    throttle_scope = 'token_refresh'
 
 
 class LogoutView(APIView):
@@ -43,3 +356,129 @@ class LogoutView(APIView):
             return Response({"detail": "Вы успешно вышли из системы."}, status=status.HTTP_205_RESET_CONTENT)
         except Exception as e:
             return Response({"error": "Невалидный токен"}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class TaskQueueMetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(queue_metrics())
+
+
+class CacheMetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(cache_metrics())
+
+
+class SearchView(APIView):
+    """
+    Полнотекстовый поиск по пользователям и достижениям: ?q=<запрос>&type=user|achievement&limit=20.
+    Найденные объекты, которые роль не может просматривать, в ответ не попадают.
+    """
+    permission_classes = [IsAuthenticated]
+    max_limit = 50
+    serializers = {
+        SearchEntry.Kind.USER: (User.objects.all(), UserSerializer, RolePermission.Resource.USER),
+        SearchEntry.Kind.ACHIEVEMENT: (Achievement.objects.all(), AchievementSerializer,
+                                       RolePermission.Resource.ACHIEVEMENT),
+    }
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        kind = request.query_params.get('type') or None
+        if not query:
+            return Response({'error': 'Параметр q обязателен'}, status=status.HTTP_400_BAD_REQUEST)
+        if kind is not None and kind not in SearchEntry.Kind.values:
+            return Response({'error': f'type: одно из {", ".join(SearchEntry.Kind.values)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), self.max_limit)
+        except ValueError:
+            limit = 20
+
+        found = search(query, kind=kind, limit=limit)
+        objects = {}
+        for entry_kind, (queryset, _, resource) in self.serializers.items():
+            ids = [entry.object_id for entry, _ in found if entry.kind == entry_kind]
+            objects[entry_kind] = scope_queryset(request.user, resource, queryset).in_bulk(ids) if ids else {}
+
+        results = []
+        for entry, rank in found:
+            obj = objects[entry.kind].get(entry.object_id)
+            if obj is None:
+                continue
+            serializer_class = self.serializers[entry.kind][1]
+            results.append({
+                'type': entry.kind,
+                'id': entry.object_id,
+                'title': entry.title,
+                'rank': rank,
+                'object': serializer_class(obj, context={'request': request}).data,
+            })
+        return Response({'results': results})
+
+
+class LeaderboardView(APIView):
+    """
+    Рейтинг спортсменов по числу достижений: ?year=2024 (по умолчанию — за всё время), ?limit=20.
+    Читается из материализованной таблицы по индексу (year, -achievement_count).
+    Рейтинг раскрывает данные всех пользователей, поэтому нужна область all на их просмотр.
+    """
+    permission_classes = [IsAuthenticated, HasFullViewPermission]
+    permission_resources = (RolePermission.Resource.USER, RolePermission.Resource.ACHIEVEMENT)
+    max_limit = 100
+
+    def get(self, request):
+        try:
+            year = int(request.query_params.get('year', LeaderboardEntry.ALL_TIME))
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), self.max_limit)
+        except ValueError:
+            return Response({'error': 'year и limit должны быть числами'}, status=status.HTTP_400_BAD_REQUEST)
+        entries = (LeaderboardEntry.objects.filter(year=year).select_related('user')
+                   .order_by('-achievement_count', 'user')[:limit])
+        data = LeaderboardEntrySerializer(entries, many=True, context={'request': request}).data
+        for rank, item in enumerate(data, start=1):
+            item['rank'] = rank
+        return Response({'year': year, 'results': data})
+
+
+class FeedView(APIView):
+    """
+    Лента достижений спортсменов, на которых подписан пользователь: ?cursor=&page_size=20.
+    Достижения и изображения, которые роль не может просматривать, пропускаются.
+    """
+    permission_classes = [IsAuthenticated]
+    page_size = 20
+    max_page_size = 100
+
+    def get(self, request):
+        try:
+            page_size = min(max(int(request.query_params.get('page_size', self.page_size)), 1), self.max_page_size)
+        except ValueError:
+            page_size = self.page_size
+        rows, next_cursor = read_feed(request.user, request.query_params.get('cursor'), page_size)
+
+        user = request.user
+        images = scope_queryset(user, RolePermission.Resource.ACHIEVEMENT_IMAGE,
+                                AchievementImage.objects.order_by('uploaded_at', 'id'))
+        achievements = scope_queryset(user, RolePermission.Resource.ACHIEVEMENT, Achievement.objects.all())
+        achievements = achievements.select_related('user').prefetch_related(
+            Prefetch('images', queryset=images)
+        ).in_bulk([achievement_id for _, achievement_id in rows])
+        results = []
+        for _, achievement_id in rows:
+            achievement = achievements.get(achievement_id)
+            if achievement is None:
+                continue
+            item = AchievementWithImagesSerializer(achievement, context={'request': request}).data
+            item['author'] = {'id': achievement.user_id, 'username': achievement.user.username}
+            results.append(item)
+
+        next_url = None
+        if next_cursor:
+            params = request.query_params.copy()
+            params['cursor'] = next_cursor
+            next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+        return Response({'next': next_url, 'results': results})